@@ -0,0 +1,1000 @@
+#!/usr/bin/python3
+
+from Dictionary import Dictionary, OrderStatistics, Cursor
+
+from array import array
+import bisect
+import unittest
+import string
+import random
+
+
+# Colours, with the convention of RBNode: black is true
+_RED = 0
+_BLACK = 1
+
+# The index of the nil sentinel; it is black and its links are meaningless
+_NIL = 0
+
+
+class ArrayRBTree(Dictionary, OrderStatistics):
+    """ A red-black tree stored as parallel columns indexed by node handles (ints).
+
+    Keys and values live in two lists, while colours, parent / son links and the
+    weights of the subtrees (for the order statistics) live in typed arrays, so a
+    node costs a few machine words instead of an object. The slots of erased
+    nodes are chained through the left links into a free list and reused by the
+    following insertions. Slot 0 is the nil sentinel, of weight 0.
+    """
+
+    def __init__(self):
+        self._keys = [None]
+        self._values = [None]
+        self._colours = array('b', [_BLACK])
+        self._parents = array('i', [_NIL])
+        self._left_sons = array('i', [_NIL])
+        self._right_sons = array('i', [_NIL])
+        self._weights = array('i', [0])
+
+        self._root = _NIL
+        self._free_head = _NIL
+        self._size = 0
+
+    def get_root(self):
+        return self._root
+
+    # Slot management
+    def _allocate(self, key, value, parent):
+        node = self._free_head
+        if node != _NIL:
+            self._free_head = self._left_sons[node]
+            self._keys[node] = key
+            self._values[node] = value
+            self._colours[node] = _RED
+            self._parents[node] = parent
+            self._left_sons[node] = self._right_sons[node] = _NIL
+            self._weights[node] = 1
+        else:
+            node = len(self._keys)
+            self._keys.append(key)
+            self._values.append(value)
+            self._colours.append(_RED)
+            self._parents.append(parent)
+            self._left_sons.append(_NIL)
+            self._right_sons.append(_NIL)
+            self._weights.append(1)
+
+        return node
+
+    def _release(self, node):
+        self._keys[node] = self._values[node] = None
+        self._left_sons[node] = self._free_head
+        self._free_head = node
+
+    # Rotations
+    def _rotate_left(self, node):
+        parents, left_sons, right_sons = self._parents, self._left_sons, self._right_sons
+
+        right_son = right_sons[node]
+        right_sons[node] = left_sons[right_son]
+        if left_sons[right_son] != _NIL:
+            parents[left_sons[right_son]] = node
+        parent = parents[node]
+        parents[right_son] = parent
+        if parent == _NIL:
+            self._root = right_son
+        elif left_sons[parent] == node:
+            left_sons[parent] = right_son
+        else:
+            right_sons[parent] = right_son
+        left_sons[right_son] = node
+        parents[node] = right_son
+
+        weights = self._weights
+        weights[right_son] = weights[node]
+        weights[node] = weights[left_sons[node]] + weights[right_sons[node]] + 1
+
+    def _rotate_right(self, node):
+        parents, left_sons, right_sons = self._parents, self._left_sons, self._right_sons
+
+        left_son = left_sons[node]
+        left_sons[node] = right_sons[left_son]
+        if right_sons[left_son] != _NIL:
+            parents[right_sons[left_son]] = node
+        parent = parents[node]
+        parents[left_son] = parent
+        if parent == _NIL:
+            self._root = left_son
+        elif right_sons[parent] == node:
+            right_sons[parent] = left_son
+        else:
+            left_sons[parent] = left_son
+        right_sons[left_son] = node
+        parents[node] = left_son
+
+        weights = self._weights
+        weights[left_son] = weights[node]
+        weights[node] = weights[left_sons[node]] + weights[right_sons[node]] + 1
+
+    # Support insertion
+    def _insert_fixup(self, node):
+        colours, parents, left_sons, right_sons = self._colours, self._parents, self._left_sons, self._right_sons
+
+        while colours[parents[node]] == _RED:
+            parent = parents[node]
+            grand_parent = parents[parent]
+            if parent == left_sons[grand_parent]:
+                uncle = right_sons[grand_parent]
+                if colours[uncle] == _RED:
+                    colours[parent] = colours[uncle] = _BLACK
+                    colours[grand_parent] = _RED
+                    node = grand_parent
+                else:
+                    if node == right_sons[parent]:
+                        node = parent
+                        self._rotate_left(node)
+                        parent = parents[node]
+                    colours[parent] = _BLACK
+                    colours[grand_parent] = _RED
+                    self._rotate_right(grand_parent)
+            else:
+                uncle = left_sons[grand_parent]
+                if colours[uncle] == _RED:
+                    colours[parent] = colours[uncle] = _BLACK
+                    colours[grand_parent] = _RED
+                    node = grand_parent
+                else:
+                    if node == left_sons[parent]:
+                        node = parent
+                        self._rotate_right(node)
+                        parent = parents[node]
+                    colours[parent] = _BLACK
+                    colours[grand_parent] = _RED
+                    self._rotate_left(grand_parent)
+
+        colours[self._root] = _BLACK
+
+    def insert(self, key, value=None):
+        self._version += 1
+        keys, left_sons, right_sons = self._keys, self._left_sons, self._right_sons
+
+        parent = _NIL
+        node = self._root
+        while node != _NIL:
+            parent = node
+            if key == keys[node]:
+                self._values[node] = value
+                return
+            node = left_sons[node] if key < keys[node] else right_sons[node]
+
+        node = self._allocate(key, value, parent)
+        if parent == _NIL:
+            self._root = node
+        elif key < keys[parent]:
+            left_sons[parent] = node
+        else:
+            right_sons[parent] = node
+
+        self._size += 1
+        self._add_to_weights(parent, 1)
+        self._insert_fixup(node)
+
+    def _add_to_weights(self, node, delta):
+        """ Adds delta to the weights of node and of all its ancestors.
+            Complexity: O(log n)
+        """
+        parents, weights = self._parents, self._weights
+        while node != _NIL:
+            weights[node] += delta
+            node = parents[node]
+
+    # Support erasing
+    def _transplant(self, node, replacing_node):
+        parent = self._parents[node]
+        if parent == _NIL:
+            self._root = replacing_node
+        elif self._left_sons[parent] == node:
+            self._left_sons[parent] = replacing_node
+        else:
+            self._right_sons[parent] = replacing_node
+        # the parent of the sentinel is set too, _erase_fixup relies on it
+        self._parents[replacing_node] = parent
+
+    def _erase_fixup(self, node):
+        colours, parents, left_sons, right_sons = self._colours, self._parents, self._left_sons, self._right_sons
+
+        while node != self._root and colours[node] == _BLACK:
+            parent = parents[node]
+            if node == left_sons[parent]:
+                sibling = right_sons[parent]
+                if colours[sibling] == _RED:
+                    colours[sibling] = _BLACK
+                    colours[parent] = _RED
+                    self._rotate_left(parent)
+                    sibling = right_sons[parent]
+                if colours[left_sons[sibling]] == _BLACK and colours[right_sons[sibling]] == _BLACK:
+                    colours[sibling] = _RED
+                    node = parent
+                else:
+                    if colours[right_sons[sibling]] == _BLACK:
+                        colours[left_sons[sibling]] = _BLACK
+                        colours[sibling] = _RED
+                        self._rotate_right(sibling)
+                        sibling = right_sons[parent]
+                    colours[sibling] = colours[parent]
+                    colours[parent] = _BLACK
+                    colours[right_sons[sibling]] = _BLACK
+                    self._rotate_left(parent)
+                    node = self._root
+            else:
+                sibling = left_sons[parent]
+                if colours[sibling] == _RED:
+                    colours[sibling] = _BLACK
+                    colours[parent] = _RED
+                    self._rotate_right(parent)
+                    sibling = left_sons[parent]
+                if colours[right_sons[sibling]] == _BLACK and colours[left_sons[sibling]] == _BLACK:
+                    colours[sibling] = _RED
+                    node = parent
+                else:
+                    if colours[left_sons[sibling]] == _BLACK:
+                        colours[right_sons[sibling]] = _BLACK
+                        colours[sibling] = _RED
+                        self._rotate_left(sibling)
+                        sibling = left_sons[parent]
+                    colours[sibling] = colours[parent]
+                    colours[parent] = _BLACK
+                    colours[left_sons[sibling]] = _BLACK
+                    self._rotate_right(parent)
+                    node = self._root
+
+        colours[node] = _BLACK
+
+    def erase(self, key):
+        self._version += 1
+        node = self._find_index(key)
+        if node == _NIL:
+            return
+
+        colours, parents, left_sons, right_sons = self._colours, self._parents, self._left_sons, self._right_sons
+
+        erased_colour = colours[node]
+        # the node leaving its place is the erased one, or its successor which replaces it
+        if left_sons[node] == _NIL or right_sons[node] == _NIL:
+            self._add_to_weights(parents[node], -1)
+        else:
+            self._add_to_weights(parents[self._get_left_most_index(right_sons[node])], -1)
+
+        if left_sons[node] == _NIL:
+            replacing_node = right_sons[node]
+            self._transplant(node, replacing_node)
+        elif right_sons[node] == _NIL:
+            replacing_node = left_sons[node]
+            self._transplant(node, replacing_node)
+        else:
+            successor = self._get_left_most_index(right_sons[node])
+            erased_colour = colours[successor]
+            replacing_node = right_sons[successor]
+            if parents[successor] == node:
+                parents[replacing_node] = successor
+            else:
+                self._transplant(successor, replacing_node)
+                right_sons[successor] = right_sons[node]
+                parents[right_sons[successor]] = successor
+            self._transplant(node, successor)
+            left_sons[successor] = left_sons[node]
+            parents[left_sons[successor]] = successor
+            colours[successor] = colours[node]
+            self._weights[successor] = self._weights[node]
+
+        if erased_colour == _BLACK:
+            self._erase_fixup(replacing_node)
+        parents[_NIL] = _NIL
+
+        self._size -= 1
+        self._release(node)
+
+    @classmethod
+    def from_sorted(cls, items):
+        items = Dictionary._check_sorted(items)
+        number_of_items = len(items)
+
+        tree = cls()
+        tree._keys.extend(key for key, value in items)
+        tree._values.extend(value for key, value in items)
+        tree._colours.extend([_BLACK] * number_of_items)
+        for column in (tree._parents, tree._left_sons, tree._right_sons):
+            column.extend([_NIL] * number_of_items)
+        tree._weights.extend([0] * number_of_items)
+
+        # The i-th item goes to slot i + 1 and the tree is built by halving, as in
+        # RBTree.from_sorted: only the incomplete last level is coloured red.
+        red_depth = (number_of_items + 1).bit_length() - 1
+        stack = [(1, number_of_items + 1, _NIL, 0, True)]
+        while stack:
+            low, high, parent, depth, is_left_son = stack.pop()
+            if low >= high:
+                continue
+
+            node = (low + high) // 2
+            tree._parents[node] = parent
+            tree._weights[node] = high - low
+            if parent == _NIL:
+                tree._root = node
+            elif is_left_son:
+                tree._left_sons[parent] = node
+            else:
+                tree._right_sons[parent] = node
+            if depth == red_depth:
+                tree._colours[node] = _RED
+
+            stack.append((low, node, node, depth + 1, True))
+            stack.append((node + 1, high, node, depth + 1, False))
+
+        tree._size = number_of_items
+        return tree
+
+    # Bulk updates, see Dictionary.insert_many
+    def _adopt(self, tree):
+        version = self._version
+        self.__dict__.update(tree.__dict__)
+        self._version = version + 1
+
+    # Snapshots
+    def snapshot(self):
+        """ Copies the whole tree as a handful of flat buffers.
+            Complexity: O(n), without walking the tree
+        :return: An opaque snapshot, which can be restored with from_snapshot.
+        """
+        return {
+            "keys": self._keys[:],
+            "values": self._values[:],
+            "colours": self._colours.tobytes(),
+            "parents": self._parents.tobytes(),
+            "left_sons": self._left_sons.tobytes(),
+            "right_sons": self._right_sons.tobytes(),
+            "weights": self._weights.tobytes(),
+            "root": self._root,
+            "free_head": self._free_head,
+            "size": self._size,
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """ Restores a tree from the result of snapshot.
+            Complexity: O(n)
+        """
+        tree = cls()
+        tree._keys = snapshot["keys"][:]
+        tree._values = snapshot["values"][:]
+        tree._colours = array('b', snapshot["colours"])
+        tree._parents = array('i', snapshot["parents"])
+        tree._left_sons = array('i', snapshot["left_sons"])
+        tree._right_sons = array('i', snapshot["right_sons"])
+        tree._weights = array('i', snapshot["weights"])
+        tree._root = snapshot["root"]
+        tree._free_head = snapshot["free_head"]
+        tree._size = snapshot["size"]
+        return tree
+
+    # Queries
+    def size(self):
+        return self._size
+
+    def _find_index(self, key):
+        keys, left_sons, right_sons = self._keys, self._left_sons, self._right_sons
+
+        node = self._root
+        while node != _NIL:
+            if key == keys[node]:
+                return node
+            node = left_sons[node] if key < keys[node] else right_sons[node]
+
+        return _NIL
+
+    def _get_left_most_index(self, node):
+        while self._left_sons[node] != _NIL:
+            node = self._left_sons[node]
+        return node
+
+    def look_up(self, key):
+        node = self._find_index(key)
+        return self._values[node] if node != _NIL else None
+
+    def __contains__(self, key):
+        return self._find_index(key) != _NIL
+
+    def _find_many_indices(self, keys):
+        """ Same as Dictionary._find_many, over the columns.
+        :return: The handles of the keys (the sentinel for the missing ones), in the order of keys.
+        """
+        node_keys, left_sons, right_sons = self._keys, self._left_sons, self._right_sons
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        sorted_keys = [keys[index] for index in order]
+        nodes = [_NIL] * len(keys)
+
+        stack = [(self._root, 0, len(sorted_keys))] if self._root != _NIL and keys else []
+        while stack:
+            node, low, high = stack.pop()
+
+            if high - low <= Dictionary._SMALL_BATCH:
+                for index in range(low, high):
+                    key = sorted_keys[index]
+                    current = node
+                    while current != _NIL:
+                        if key == node_keys[current]:
+                            nodes[order[index]] = current
+                            break
+                        current = left_sons[current] if key < node_keys[current] else right_sons[current]
+                continue
+
+            node_key = node_keys[node]
+            first_equal = bisect.bisect_left(sorted_keys, node_key, low, high)
+            first_higher = first_equal
+            while first_higher < high and sorted_keys[first_higher] == node_key:
+                nodes[order[first_higher]] = node
+                first_higher += 1
+
+            if low < first_equal and left_sons[node] != _NIL:
+                stack.append((left_sons[node], low, first_equal))
+            if first_higher < high and right_sons[node] != _NIL:
+                stack.append((right_sons[node], first_higher, high))
+
+        return nodes
+
+    def look_up_many(self, keys):
+        values = self._values
+        return [values[node] if node != _NIL else None for node in self._find_many_indices(list(keys))]
+
+    def contains_many(self, keys):
+        return [node != _NIL for node in self._find_many_indices(list(keys))]
+
+    def _iter_indices(self, reverse=False):
+        """ Yields the handles of the nodes sorted by keys, using an explicit stack.
+            Complexity: O(n), O(height) memory
+        """
+        first_sons, last_sons = (self._right_sons, self._left_sons) if reverse else (self._left_sons, self._right_sons)
+
+        stack = []
+        node = self._root
+        while True:
+            while node != _NIL:
+                stack.append(node)
+                node = first_sons[node]
+            if not stack:
+                return
+            node = stack.pop()
+            yield node
+            node = last_sons[node]
+
+    def iter_items(self):
+        keys, values = self._keys, self._values
+        return ((keys[node], values[node]) for node in self._iter_indices())
+
+    def iter_keys(self):
+        keys = self._keys
+        return (keys[node] for node in self._iter_indices())
+
+    def iter_values(self):
+        values = self._values
+        return (values[node] for node in self._iter_indices())
+
+    def reversed(self):
+        keys, values = self._keys, self._values
+        return ((keys[node], values[node]) for node in self._iter_indices(True))
+
+    def __reversed__(self):
+        keys = self._keys
+        return (keys[node] for node in self._iter_indices(True))
+
+    def _iter_range_indices(self, low, high, inclusive, reverse=False):
+        """ Yields the handles of the nodes whose keys lie between low and high.
+            Complexity: O(log n + k), where k is the number of yielded nodes
+        """
+        keys = self._keys
+        include_low, include_high = inclusive
+        if not reverse:
+            first_sons, last_sons = self._left_sons, self._right_sons
+            in_bound = lambda key: Dictionary._after_low(key, low, include_low)
+            in_other_bound = lambda key: Dictionary._before_high(key, high, include_high)
+        else:
+            first_sons, last_sons = self._right_sons, self._left_sons
+            in_bound = lambda key: Dictionary._before_high(key, high, include_high)
+            in_other_bound = lambda key: Dictionary._after_low(key, low, include_low)
+
+        stack = []
+        node = self._root
+        while True:
+            while node != _NIL:
+                if in_bound(keys[node]):
+                    stack.append(node)
+                    node = first_sons[node]
+                else:
+                    node = last_sons[node]
+            if not stack:
+                return
+            node = stack.pop()
+            if not in_other_bound(keys[node]):
+                return
+            yield node
+            node = last_sons[node]
+
+    def irange(self, low=None, high=None, inclusive=(True, True), reverse=False):
+        keys, values = self._keys, self._values
+        return ((keys[node], values[node]) for node in self._iter_range_indices(low, high, inclusive, reverse))
+
+    # Order statistics, over the weights column
+    def _count_lower(self, key, inclusive):
+        """ Same as Dictionary._count_lower, from the root.
+        """
+        keys, left_sons, right_sons, weights = self._keys, self._left_sons, self._right_sons, self._weights
+
+        count = 0
+        node = self._root
+        while node != _NIL:
+            if keys[node] < key or (inclusive and keys[node] == key):
+                count += 1 + weights[left_sons[node]]
+                node = right_sons[node]
+            else:
+                node = left_sons[node]
+
+        return count
+
+    def _get_kth_index(self, k):
+        """ Returns the handle of the node with the k-th lowest key, or the sentinel if k is out of range.
+        """
+        left_sons, right_sons, weights = self._left_sons, self._right_sons, self._weights
+        if not 0 <= k < self._size:
+            return _NIL
+
+        node = self._root
+        while True:
+            left_son_weight = weights[left_sons[node]]
+            if k == left_son_weight:
+                return node
+            if k < left_son_weight:
+                node = left_sons[node]
+            else:
+                k -= left_son_weight + 1
+                node = right_sons[node]
+
+    def rank(self, key):
+        return self._count_lower(key, False)
+
+    def get_kth_element(self, k):
+        node = self._get_kth_index(k)
+        return (self._keys[node], self._values[node]) if node != _NIL else None
+
+    def select(self, k):
+        node = self._get_kth_index(k)
+        return self._keys[node] if node != _NIL else None
+
+    def count_range(self, low=None, high=None, inclusive=(True, True)):
+        include_low, include_high = inclusive
+        count_high = self._size if high is None else self._count_lower(high, include_high)
+        count_low = 0 if low is None else self._count_lower(low, not include_low)
+        return max(count_high - count_low, 0)
+
+    def get_kth_elements(self, ranks):
+        """ Same as Dictionary.get_kth_elements, over the columns.
+            Complexity: O(k log n) for k ranks, visiting every node at most once
+        """
+        keys, values, left_sons, right_sons, weights = (self._keys, self._values, self._left_sons,
+                                                        self._right_sons, self._weights)
+        order = sorted(range(len(ranks)), key=ranks.__getitem__)
+        sorted_ranks = [ranks[index] for index in order]
+        results = [None] * len(ranks)
+
+        stack = [(self._root, 0, len(sorted_ranks), 0)]
+        while stack:
+            node, low, high, offset = stack.pop()
+            if node == _NIL or low >= high:
+                continue
+
+            node_rank = offset + weights[left_sons[node]]
+            first_equal = bisect.bisect_left(sorted_ranks, node_rank, low, high)
+            first_higher = bisect.bisect_right(sorted_ranks, node_rank, first_equal, high)
+            for index in range(first_equal, first_higher):
+                results[order[index]] = keys[node], values[node]
+
+            stack.append((left_sons[node], low, first_equal, offset))
+            stack.append((right_sons[node], first_higher, high, node_rank + 1))
+
+        return results
+
+    # Cursors
+    def lower_bound(self, key):
+        cursor = ArrayCursor(self)
+        cursor.seek(key)
+        return cursor
+
+    def _assign_value(self, node, value):
+        self._version += 1
+        self._values[node] = value
+
+    def get_height(self):
+        height = 0
+        stack = [(self._root, 1)] if self._root != _NIL else []
+        while stack:
+            node, current_height = stack.pop()
+            height = max(height, current_height)
+            for son in (self._left_sons[node], self._right_sons[node]):
+                if son != _NIL:
+                    stack.append((son, current_height + 1))
+
+        return height
+
+    def black_height(self):
+        """ Returns the number of black nodes on the paths from the root to the leaves.
+            Complexity: O(log n)
+        """
+        black_height = 0
+        node = self._root
+        while node != _NIL:
+            if self._colours[node] == _BLACK:
+                black_height += 1
+            node = self._left_sons[node]
+        return black_height
+
+    def _sampled_max_depth(self):
+        """ Same as Dictionary._sampled_max_depth, over the weights column; the height of a
+            red-black tree needs no bound on the descents.
+        """
+        left_sons, right_sons, weights = self._left_sons, self._right_sons, self._weights
+        if self._size == 0:
+            return 0
+
+        max_depth = 0
+        for k in Dictionary._depth_samples(self._size):
+            node, depth = self._root, 1
+            while k != weights[left_sons[node]]:
+                if k < weights[left_sons[node]]:
+                    node = left_sons[node]
+                else:
+                    k -= weights[left_sons[node]] + 1
+                    node = right_sons[node]
+                depth += 1
+            max_depth = max(max_depth, depth)
+
+        return max_depth
+
+    def tree_stats(self):
+        """ Same as RBTree.tree_stats.
+        """
+        stats = Dictionary.tree_stats(self)
+        stats["black_height"] = self.black_height()
+        stats["max_depth_bound"] = 2 * stats["black_height"]
+        return stats
+
+
+class ArrayCursor(Cursor):
+    """ A position in an ArrayRBTree, see Cursor.
+
+    The cursor only keeps the handle of its node, and steps to the neighbouring
+    keys through the parent links.
+    """
+
+    __slots__ = ('_node_index',)
+
+    def __init__(self, tree):
+        Cursor.__init__(self, tree)
+        self._node_index = _NIL
+
+    @property
+    def valid(self):
+        return self._node_index != _NIL
+
+    def _node(self):
+        if self._node_index == _NIL:
+            raise IndexError("The cursor does not point to any entry.")
+        return self._node_index
+
+    @property
+    def key(self):
+        return self._tree._keys[self._node()]
+
+    @property
+    def value(self):
+        return self._tree._values[self._node()]
+
+    @value.setter
+    def value(self, value):
+        self._tree._assign_value(self._node(), value)
+
+    def _step(self, first_sons, last_sons):
+        """ Moves to the next node in the order where the first sons come first.
+        """
+        parents = self._tree._parents
+        node = self._node_index
+        if node == _NIL:
+            return False
+
+        if last_sons[node] != _NIL:
+            node = last_sons[node]
+            while first_sons[node] != _NIL:
+                node = first_sons[node]
+        else:
+            while parents[node] != _NIL and last_sons[parents[node]] == node:
+                node = parents[node]
+            node = parents[node]
+
+        self._node_index = node
+        return node != _NIL
+
+    def next(self):
+        """ Moves to the successor of the current key.
+            Complexity: O(1) amortized
+        :return: Whether the cursor is still valid.
+        """
+        return self._step(self._tree._left_sons, self._tree._right_sons)
+
+    def prev(self):
+        """ Moves to the predecessor of the current key.
+            Complexity: O(1) amortized
+        :return: Whether the cursor is still valid.
+        """
+        return self._step(self._tree._right_sons, self._tree._left_sons)
+
+    def seek(self, key):
+        """ Moves to the lowest key greater than or equal to key (finger search), like Cursor.seek:
+            the search climbs from the current node through the parent links up to the smallest
+            subtree which may hold the key, then descends from there.
+            Complexity: O(log d) typically, d being the distance between the two keys
+        :return: Whether the cursor is valid, i.e. such a key exists.
+        """
+        tree = self._tree
+        keys, parents, left_sons, right_sons = tree._keys, tree._parents, tree._left_sons, tree._right_sons
+
+        # the lowest key of the ancestors above the subtree, if the subtree has none greater than key
+        lower_bound = _NIL
+        node = self._node_index
+        if node == _NIL:
+            node = tree._root
+        elif key == keys[node]:
+            return True
+        elif keys[node] < key:
+            # climb until the subtree is bounded above by a key higher than key
+            while parents[node] != _NIL and not (left_sons[parents[node]] == node and key < keys[parents[node]]):
+                node = parents[node]
+            lower_bound = parents[node]
+        else:
+            # climb until the subtree is bounded below by a key lower than key
+            while parents[node] != _NIL and not (right_sons[parents[node]] == node and keys[parents[node]] < key):
+                node = parents[node]
+
+        while node != _NIL:
+            if key == keys[node]:
+                lower_bound = node
+                break
+            if key < keys[node]:
+                lower_bound = node
+                node = left_sons[node]
+            else:
+                node = right_sons[node]
+
+        self._node_index = lower_bound
+        return lower_bound != _NIL
+
+
+########################## Testing
+
+class TestArrayRBTreeOperations(unittest.TestCase):
+
+    def setUp(self):
+
+        self.rbtree = ArrayRBTree()
+        self.model = {}
+
+        # populate the rbtree
+        self.number_of_insertions = 10000
+        for i in range(self.number_of_insertions):
+            key = random.randint(1, 1000000)
+            value = ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(50))
+            self.rbtree.insert(key, value)
+            self.model[key] = value
+
+    @staticmethod
+    def check_rbtree(tree, node):
+        """ Checks the colours and the links below node.
+        :return: Whether the subtree is valid and its black height.
+        """
+        if node == _NIL:
+            return True, 1
+
+        check_left_son, height_left_son = TestArrayRBTreeOperations.check_rbtree(tree, tree._left_sons[node])
+        check_right_son, height_right_son = TestArrayRBTreeOperations.check_rbtree(tree, tree._right_sons[node])
+        parent = tree._parents[node]
+
+        return (check_left_son and check_right_son and
+                height_left_son == height_right_son and
+                (tree._colours[node] == _BLACK or tree._colours[parent] == _BLACK) and
+                (parent == _NIL or node in (tree._left_sons[parent], tree._right_sons[parent]))), \
+            height_left_son + tree._colours[node]
+
+    def check(self, tree, model):
+        self.assertTrue(TestArrayRBTreeOperations.check_rbtree(tree, tree.get_root())[0])
+        self.assertEqual(tree.items(), sorted(model.items()))
+        self.assertEqual(tree.size(), len(model))
+        self.assertEqual(tree._weights[tree.get_root()], len(model))
+        for node in tree._iter_indices():
+            self.assertEqual(tree._weights[node],
+                             tree._weights[tree._left_sons[node]] + tree._weights[tree._right_sons[node]] + 1)
+
+    def test_insert(self):
+
+        self.check(self.rbtree, self.model)
+        self.assertEqual(self.rbtree._colours[self.rbtree.get_root()], _BLACK)
+        for key in random.sample(list(self.model), 100):
+            self.assertEqual(self.rbtree[key], self.model[key])
+        self.assertEqual(self.rbtree.look_up(0), None)
+
+    def test_erase(self):
+
+        keys = list(self.model)
+        random.shuffle(keys)
+        for key in keys[:len(keys) // 2]:
+            self.rbtree.erase(key)
+            del self.model[key]
+        self.rbtree.erase(0)
+        self.check(self.rbtree, self.model)
+
+        # the released slots are reused
+        slots = len(self.rbtree._keys)
+        for key in keys[:len(keys) // 2]:
+            self.rbtree.insert(key, key)
+            self.model[key] = key
+        self.assertEqual(len(self.rbtree._keys), slots)
+        self.check(self.rbtree, self.model)
+
+        for key in keys:
+            self.rbtree.erase(key)
+        self.check(self.rbtree, {})
+
+    def test_from_sorted_and_snapshot(self):
+
+        for number_of_items in range(33):
+            built = ArrayRBTree.from_sorted((key, None) for key in range(number_of_items))
+            self.check(built, dict.fromkeys(range(number_of_items)))
+
+        built = ArrayRBTree.from_sorted(self.rbtree.items())
+        self.check(built, self.model)
+
+        restored = ArrayRBTree.from_snapshot(self.rbtree.snapshot())
+        self.rbtree.insert(0, "only in the original")
+        self.check(restored, self.model)
+
+    def test_bulk_updates(self):
+
+        batch = [(random.randint(1, 1000000), i) for i in range(50000)]
+        self.rbtree.insert_many(batch)
+        self.model.update(batch)
+        self.check(self.rbtree, self.model)
+
+        erased_keys = random.sample(list(self.model), 40000)
+        self.rbtree.erase_many(erased_keys)
+        for key in erased_keys:
+            del self.model[key]
+        self.check(self.rbtree, self.model)
+
+    def test_batched_look_up(self):
+
+        probes = random.sample(list(self.model), 300) + [random.randint(1, 1000000) for _ in range(300)]
+        random.shuffle(probes)
+        self.assertEqual(self.rbtree.look_up_many(probes), [self.model.get(key) for key in probes])
+        self.assertEqual(self.rbtree.contains_many(probes), [key in self.model for key in probes])
+        self.assertEqual(probes[0] in self.rbtree, probes[0] in self.model)
+
+    def test_iterators(self):
+
+        items = sorted(self.model.items())
+        self.assertEqual(list(self.rbtree), [key for key, value in items])
+        self.assertEqual(list(self.rbtree.reversed()), items[::-1])
+        self.assertEqual(self.rbtree.values(), [value for key, value in items])
+
+        keys = [key for key, value in items]
+        for i in range(100):
+            low, high = sorted(random.sample(keys, 2))
+            expected = [(key, value) for key, value in items if low < key <= high]
+            self.assertEqual(list(self.rbtree.irange(low, high, (False, True))), expected)
+            self.assertEqual(list(self.rbtree.irange(low, high, (False, True), reverse=True)), expected[::-1])
+
+        self.assertTrue(self.rbtree.get_height() <= 2 * len(items).bit_length())
+
+        stats = self.rbtree.tree_stats()
+        self.assertLessEqual(stats["max_depth_lower_bound"], self.rbtree.get_height())
+        self.assertLessEqual(self.rbtree.get_height(), stats["max_depth_bound"])
+
+    def test_order_statistics(self):
+
+        for key in random.sample(list(self.model), 3000):
+            self.rbtree.erase(key)
+            del self.model[key]
+        self.check(self.rbtree, self.model)
+
+        keys = sorted(self.model)
+        for k in random.sample(range(len(keys)), 100):
+            self.assertEqual(self.rbtree.select(k), keys[k])
+            self.assertEqual(self.rbtree.get_kth_element(k), (keys[k], self.model[keys[k]]))
+            self.assertEqual(self.rbtree.rank(keys[k]), k)
+            self.assertEqual(self.rbtree.rank(keys[k] + 0.5), k + 1)
+        self.assertEqual((self.rbtree.select(-1), self.rbtree.get_kth_element(len(keys))), (None, None))
+
+        for i in range(100):
+            low, high = sorted(random.sample(range(1000002), 2))
+            inclusive = (random.random() < 0.5, random.random() < 0.5)
+            expected = len(list(self.rbtree.irange(low, high, inclusive)))
+            self.assertEqual(self.rbtree.count_range(low, high, inclusive), expected)
+        self.assertEqual(self.rbtree.count_range(), len(keys))
+        self.assertEqual(ArrayRBTree().count_range(1, 2), 0)
+
+        ranks = [random.randrange(-5, len(keys) + 5) for _ in range(500)]
+        self.assertEqual(self.rbtree.get_kth_elements(ranks),
+                         [(keys[k], self.model[keys[k]]) if 0 <= k < len(keys) else None for k in ranks])
+
+    def test_sampling(self):
+
+        self.assertIn(self.rbtree.choose_element(), self.model.items())
+        sample = self.rbtree.sample(1000)
+        self.assertEqual(len(set(key for key, _ in sample)), 1000)
+        self.assertTrue(all(self.model[key] == value for key, value in sample))
+        self.assertEqual(len(self.rbtree.sample(50, replace=True)), 50)
+
+        self.assertIsNone(ArrayRBTree().choose_element())
+        self.assertEqual(ArrayRBTree().sample(0), [])
+        with self.assertRaises(ValueError):
+            ArrayRBTree().sample(1, replace=True)
+
+    def test_cursor(self):
+
+        keys = sorted(self.model)
+        cursor = self.rbtree.lower_bound(keys[10] - 0.5)
+        self.assertEqual(cursor.key, keys[10])
+        visited = [cursor.key]
+        while cursor.next():
+            visited.append(cursor.key)
+        self.assertEqual(visited, keys[10:])
+        self.assertFalse(cursor.valid)
+
+        cursor = self.rbtree.find_cursor(keys[-1])
+        visited = [cursor.key]
+        while cursor.prev():
+            visited.append(cursor.key)
+        self.assertEqual(visited, keys[::-1])
+
+        self.assertIsNone(self.rbtree.find_cursor(keys[0] - 0.5))
+        self.assertFalse(self.rbtree.lower_bound(keys[-1] + 1).valid)
+        self.assertTrue(cursor.seek(keys[5]))
+        cursor.value = "updated"
+        self.assertEqual((cursor.key, cursor.value, self.rbtree[keys[5]]), (keys[5], "updated", "updated"))
+        with self.assertRaises(IndexError):
+            ArrayRBTree().lower_bound(0).key
+
+        # the seeks start from the current position, wherever the key lies
+        for _ in range(500):
+            key = random.randint(keys[0] - 10, keys[-1] + 10) + random.choice((0, 0.5))
+            index = bisect.bisect_left(keys, key)
+            self.assertEqual(cursor.seek(key), index < len(keys))
+            if index < len(keys):
+                self.assertEqual(cursor.key, keys[index])
+
+    def test_finger_search(self):
+
+        comparisons = [0]
+
+        class Key(int):
+            def __lt__(self, other):
+                comparisons[0] += 1
+                return int.__lt__(self, other)
+
+        tree = ArrayRBTree.from_sorted((Key(key), None) for key in range(0, 200000, 2))
+        cursor = tree.lower_bound(Key(100000))
+        comparisons[0] = 0
+        for key in range(100001, 100401, 4):
+            self.assertTrue(cursor.seek(Key(key)))
+            self.assertEqual(cursor.key, key + 1)
+        # a few comparisons per seek, where a search from the root makes about 2 log n
+        self.assertLess(comparisons[0], 100 * 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,830 @@
+#!/usr/bin/python3
+
+from Dictionary import Dictionary, Cursor
+
+from collections import OrderedDict
+import bisect
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+
+import unittest
+import string
+import random
+
+# Page 0 holds the metadata, so 0 also stands for a missing page
+_NO_PAGE = 0
+_FREE, _LEAF, _INTERNAL = 0, 1, 2
+
+_MAGIC = b"PYBPTREE"
+# magic, page size, root, first leaf, last leaf, number of pages, head of the free list, size, height
+_META = struct.Struct("<8sIiiiiiqi")
+# kind, number of keys, previous leaf, next leaf (or next free page)
+_PAGE_HEADER = struct.Struct("<BHii")
+_LENGTH = struct.Struct("<I")
+
+
+class _Page(object):
+    """ The decoded contents of a page: the keys, along with their pickled forms, and
+        either the pickled values (leaves) or the numbers of the son pages (internal pages).
+    """
+
+    __slots__ = ('number', 'is_leaf', 'keys', 'encoded_keys', 'values', 'children',
+                 'previous', 'next', 'used_bytes', 'dirty')
+
+    def __init__(self, number, is_leaf):
+        self.number = number
+        self.is_leaf = is_leaf
+        self.keys = []
+        self.encoded_keys = []
+        self.values = []
+        self.children = []
+        self.previous = self.next = _NO_PAGE
+        self.used_bytes = _PAGE_HEADER.size
+        self.dirty = True
+
+    def entry_bytes(self, index):
+        """ The number of bytes taken by the index-th key, with its value or its following son.
+        """
+        if self.is_leaf:
+            return 2 * _LENGTH.size + len(self.encoded_keys[index]) + len(self.values[index])
+        return 2 * _LENGTH.size + len(self.encoded_keys[index])
+
+    def measure(self):
+        self.used_bytes = _PAGE_HEADER.size + sum(self.entry_bytes(index) for index in range(len(self.keys)))
+        if not self.is_leaf:
+            self.used_bytes += _LENGTH.size
+
+
+class BPlusTree(Dictionary):
+    """ A B+ tree stored in fixed-size pages of a memory-mapped file.
+
+    The (key, value) pairs are pickled into the leaves, which are chained in
+    both directions for the ordered scans, while the internal pages hold the
+    separator keys and the numbers of their sons. A page splits once its
+    entries outgrow it; a page left empty by erasures is unlinked and reused
+    through a free list, but pages are never merged.
+
+    Only up to cache_pages decoded pages are kept in memory: the least recently
+    used ones are evicted after every operation, the modified ones being
+    written back to the mapping first. flush() (or close()) makes the file
+    complete, so that it can be reopened later by passing the same path.
+    """
+
+    def __init__(self, path=None, page_size=4096, cache_pages=1024):
+        """
+        :param path: The file holding the tree, reopened if it already exists; a temporary file if None.
+                     WARNING: only reopen trusted files, since the keys and the values are unpickled.
+        :param page_size: The size of the pages of a new file, in bytes.
+        :param cache_pages: The number of decoded pages kept in memory.
+        """
+        if cache_pages < 1:
+            raise ValueError("The cache must hold at least one page.")
+
+        if path is None:
+            self._file = tempfile.TemporaryFile()
+        elif os.path.exists(path) and os.path.getsize(path) > 0:
+            self._file = open(path, "r+b")
+        else:
+            self._file = open(path, "w+b")
+        self._cache = OrderedDict()
+        self._cache_pages = cache_pages
+
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell() > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0)
+            (magic, self._page_size, self._root, self._first_leaf, self._last_leaf,
+             self._number_of_pages, self._free_head, self._size, self._height) = _META.unpack_from(self._mmap, 0)
+            if magic != _MAGIC:
+                raise ValueError("The file does not hold a B+ tree.")
+        else:
+            if page_size < 128:
+                raise ValueError("The pages must have at least 128 bytes.")
+            self._page_size = page_size
+            self._file.truncate(16 * page_size)
+            self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+            self._number_of_pages = 1
+            self._free_head = _NO_PAGE
+            self._size = 0
+            self._height = 1
+            self._root = self._first_leaf = self._last_leaf = self._new_page(True).number
+
+    def get_root(self):
+        return self._root
+
+    # Pages
+    def _grow(self):
+        """ Doubles the size of the file, mapping it again.
+        """
+        size = 2 * len(self._mmap)
+        self._mmap.close()
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+    def _read_page(self, number):
+        data = self._mmap
+        offset = number * self._page_size
+        kind, count, previous, next_page = _PAGE_HEADER.unpack_from(data, offset)
+
+        page = _Page(number, kind == _LEAF)
+        page.previous, page.next = previous, next_page
+        page.dirty = False
+
+        position = offset + _PAGE_HEADER.size
+        if not page.is_leaf:
+            page.children = list(struct.unpack_from("<{}i".format(count + 1), data, position))
+            position += (count + 1) * _LENGTH.size
+        for _ in range(count):
+            length, = _LENGTH.unpack_from(data, position)
+            position += _LENGTH.size
+            encoded_key = data[position:position + length]
+            position += length
+            page.keys.append(pickle.loads(encoded_key))
+            page.encoded_keys.append(encoded_key)
+
+            if page.is_leaf:
+                length, = _LENGTH.unpack_from(data, position)
+                position += _LENGTH.size
+                page.values.append(data[position:position + length])
+                position += length
+
+        page.used_bytes = position - offset
+        return page
+
+    def _write_page(self, page):
+        parts = [_PAGE_HEADER.pack(_LEAF if page.is_leaf else _INTERNAL, len(page.keys), page.previous, page.next)]
+        if page.is_leaf:
+            for encoded_key, encoded_value in zip(page.encoded_keys, page.values):
+                parts.extend((_LENGTH.pack(len(encoded_key)), encoded_key, _LENGTH.pack(len(encoded_value)), encoded_value))
+        else:
+            parts.append(struct.pack("<{}i".format(len(page.children)), *page.children))
+            for encoded_key in page.encoded_keys:
+                parts.extend((_LENGTH.pack(len(encoded_key)), encoded_key))
+
+        data = b"".join(parts)
+        offset = page.number * self._page_size
+        self._mmap[offset:offset + len(data)] = data
+        page.dirty = False
+
+    def _page(self, number):
+        page = self._cache.get(number)
+        if page is None:
+            page = self._read_page(number)
+            self._cache[number] = page
+        else:
+            self._cache.move_to_end(number)
+        return page
+
+    def _evict(self):
+        """ Shrinks the cache back to cache_pages pages. It is only called between operations,
+            so that the pages an operation is working on are never evicted under it.
+        """
+        while len(self._cache) > self._cache_pages:
+            _, page = self._cache.popitem(last=False)
+            if page.dirty:
+                self._write_page(page)
+
+    def _new_page(self, is_leaf):
+        if self._free_head != _NO_PAGE:
+            number = self._free_head
+            self._free_head = _PAGE_HEADER.unpack_from(self._mmap, number * self._page_size)[3]
+        else:
+            number = self._number_of_pages
+            self._number_of_pages += 1
+            while self._number_of_pages * self._page_size > len(self._mmap):
+                self._grow()
+
+        page = _Page(number, is_leaf)
+        self._cache[number] = page
+        return page
+
+    def _free_page(self, page):
+        self._cache.pop(page.number, None)
+        offset = page.number * self._page_size
+        self._mmap[offset:offset + _PAGE_HEADER.size] = _PAGE_HEADER.pack(_FREE, 0, _NO_PAGE, self._free_head)
+        self._free_head = page.number
+
+    def flush(self):
+        """ Writes the modified pages and the metadata to the file.
+        """
+        for page in self._cache.values():
+            if page.dirty:
+                self._write_page(page)
+        _META.pack_into(self._mmap, 0, _MAGIC, self._page_size, self._root, self._first_leaf, self._last_leaf,
+                        self._number_of_pages, self._free_head, self._size, self._height)
+        self._mmap.flush()
+
+    def close(self):
+        self.flush()
+        self._cache.clear()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+    # Support insertion
+    def _encode_entry(self, key, value):
+        encoded_key = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+        encoded_value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if 2 * _LENGTH.size + len(encoded_key) + len(encoded_value) > (self._page_size - _PAGE_HEADER.size) // 4:
+            raise ValueError("An entry cannot take more than a quarter of a page.")
+        return encoded_key, encoded_value
+
+    def _find_leaf(self, key, path=None):
+        """ Descends to the leaf which may hold key, recording the (page, son index) pairs in path.
+        """
+        page = self._page(self._root)
+        while not page.is_leaf:
+            index = bisect.bisect_right(page.keys, key)
+            if path is not None:
+                path.append((page, index))
+            page = self._page(page.children[index])
+        return page
+
+    def _split(self, page):
+        """ Moves about the upper half of the bytes of a page to a new page following it.
+        :return: The new page, and the key separating it from page (with its pickled form).
+        """
+        sibling = self._new_page(page.is_leaf)
+
+        half = (page.used_bytes - _PAGE_HEADER.size) // 2
+        middle, accumulated = 0, 0
+        while middle < len(page.keys) - 1 and accumulated < half:
+            accumulated += page.entry_bytes(middle)
+            middle += 1
+
+        if page.is_leaf:
+            separator = page.keys[middle], page.encoded_keys[middle]
+            sibling.keys, sibling.encoded_keys, sibling.values = \
+                page.keys[middle:], page.encoded_keys[middle:], page.values[middle:]
+            del page.keys[middle:], page.encoded_keys[middle:], page.values[middle:]
+
+            sibling.previous, sibling.next = page.number, page.next
+            if page.next != _NO_PAGE:
+                next_page = self._page(page.next)
+                next_page.previous = sibling.number
+                next_page.dirty = True
+            else:
+                self._last_leaf = sibling.number
+            page.next = sibling.number
+        else:
+            # the separator moves up, its sons being split between the two pages
+            middle = max(middle - 1, 0)
+            separator = page.keys[middle], page.encoded_keys[middle]
+            sibling.keys, sibling.encoded_keys = page.keys[middle + 1:], page.encoded_keys[middle + 1:]
+            sibling.children = page.children[middle + 1:]
+            del page.keys[middle:], page.encoded_keys[middle:], page.children[middle + 1:]
+
+        page.measure()
+        sibling.measure()
+        page.dirty = True
+        return sibling, separator
+
+    def insert(self, key, value=None):
+        self._version += 1
+        encoded_key, encoded_value = self._encode_entry(key, value)
+
+        path = []
+        page = self._find_leaf(key, path)
+        index = bisect.bisect_left(page.keys, key)
+        if index < len(page.keys) and page.keys[index] == key:
+            page.used_bytes -= len(page.values[index])
+            page.values[index] = encoded_value
+            page.used_bytes += len(encoded_value)
+        else:
+            page.keys.insert(index, key)
+            page.encoded_keys.insert(index, encoded_key)
+            page.values.insert(index, encoded_value)
+            page.used_bytes += page.entry_bytes(index)
+            self._size += 1
+        page.dirty = True
+
+        while page.used_bytes > self._page_size:
+            sibling, (separator, encoded_separator) = self._split(page)
+
+            if not path:
+                root = self._new_page(False)
+                root.keys, root.encoded_keys = [separator], [encoded_separator]
+                root.children = [page.number, sibling.number]
+                root.measure()
+                self._root = root.number
+                self._height += 1
+                break
+
+            page, index = path.pop()
+            page.keys.insert(index, separator)
+            page.encoded_keys.insert(index, encoded_separator)
+            page.children.insert(index + 1, sibling.number)
+            page.used_bytes += page.entry_bytes(index)
+            page.dirty = True
+
+        self._evict()
+
+    def insert_many(self, items):
+        """ Inserts a batch of (key, value) pairs in the order of their keys, so that
+            consecutive insertions hit the same pages while they are cached.
+            Complexity: O(m log m + m log n)
+        """
+        for key, value in self._sort_batch(items):
+            self.insert(key, value)
+
+    @classmethod
+    def from_sorted(cls, items, path=None, page_size=4096, cache_pages=1024):
+        """ Builds a B+ tree in a new file, filling the leaves then every upper level from left to right.
+            Complexity: O(n)
+        """
+        items = Dictionary._check_sorted(items)
+        tree = cls(path, page_size, cache_pages)
+        if tree._size > 0:
+            raise ValueError("A B+ tree can only be built into a new file.")
+
+        page = tree._page(tree._root)
+        children, separators = [page.number], []
+        for key, value in items:
+            encoded_key, encoded_value = tree._encode_entry(key, value)
+            entry_bytes = 2 * _LENGTH.size + len(encoded_key) + len(encoded_value)
+
+            if page.keys and page.used_bytes + entry_bytes > tree._page_size:
+                leaf = tree._new_page(True)
+                leaf.previous, page.next = page.number, leaf.number
+                children.append(leaf.number)
+                separators.append((key, encoded_key))
+                page = leaf
+                tree._evict()
+
+            page.keys.append(key)
+            page.encoded_keys.append(encoded_key)
+            page.values.append(encoded_value)
+            page.used_bytes += entry_bytes
+
+        tree._last_leaf = page.number
+        tree._size = len(items)
+
+        while len(children) > 1:
+            page = tree._new_page(False)
+            page.children.append(children[0])
+            page.measure()
+            parents, parent_separators = [page.number], []
+
+            for child, (key, encoded_key) in zip(children[1:], separators):
+                if page.used_bytes + 2 * _LENGTH.size + len(encoded_key) > tree._page_size:
+                    page = tree._new_page(False)
+                    page.children.append(child)
+                    page.measure()
+                    parents.append(page.number)
+                    parent_separators.append((key, encoded_key))
+                    tree._evict()
+                else:
+                    page.keys.append(key)
+                    page.encoded_keys.append(encoded_key)
+                    page.children.append(child)
+                    page.used_bytes += 2 * _LENGTH.size + len(encoded_key)
+
+            children, separators = parents, parent_separators
+            tree._height += 1
+
+        tree._root = children[0]
+        tree._evict()
+        return tree
+
+    # Support erasing
+    def erase(self, key):
+        self._version += 1
+        path = []
+        page = self._find_leaf(key, path)
+        index = bisect.bisect_left(page.keys, key)
+        if index == len(page.keys) or page.keys[index] != key:
+            self._evict()
+            return
+
+        page.used_bytes -= page.entry_bytes(index)
+        del page.keys[index], page.encoded_keys[index], page.values[index]
+        page.dirty = True
+        self._size -= 1
+
+        if not page.keys and path:
+            # unlink the empty leaf, then remove it from its ancestors
+            if page.previous != _NO_PAGE:
+                previous_page = self._page(page.previous)
+                previous_page.next = page.next
+                previous_page.dirty = True
+            else:
+                self._first_leaf = page.next
+            if page.next != _NO_PAGE:
+                next_page = self._page(page.next)
+                next_page.previous = page.previous
+                next_page.dirty = True
+            else:
+                self._last_leaf = page.previous
+            self._free_page(page)
+
+            while path:
+                page, index = path.pop()
+                del page.children[index]
+                if page.keys:
+                    del page.keys[max(index - 1, 0)], page.encoded_keys[max(index - 1, 0)]
+                page.measure()
+                page.dirty = True
+                if page.children:
+                    break
+                self._free_page(page)
+            else:
+                # even the root lost all its sons
+                self._root = self._first_leaf = self._last_leaf = self._new_page(True).number
+                self._height = 1
+
+            # the root is replaced by its only son, as long as it has a single one
+            root = self._page(self._root)
+            while not root.is_leaf and len(root.children) == 1:
+                self._free_page(root)
+                self._root = root.children[0]
+                self._height -= 1
+                root = self._page(self._root)
+
+        self._evict()
+
+    def erase_many(self, keys):
+        for key in sorted(set(keys)):
+            self.erase(key)
+
+    # Queries
+    def size(self):
+        return self._size
+
+    def get_height(self):
+        return self._height
+
+    def _sampled_max_depth(self):
+        # all the leaves are at the same depth, so the bound is exact
+        return self._height
+
+    def _reads_mutate(self):
+        # the reads reorder the page cache, evict pages and write the modified ones back
+        return True
+
+    def _descents_mutate(self):
+        # and the pages are not nodes which Dictionary._look_up could descend
+        return True
+
+    def look_up(self, key):
+        page = self._find_leaf(key)
+        index = bisect.bisect_left(page.keys, key)
+        value = None
+        if index < len(page.keys) and page.keys[index] == key:
+            value = pickle.loads(page.values[index])
+        self._evict()
+        return value
+
+    def __contains__(self, key):
+        page = self._find_leaf(key)
+        index = bisect.bisect_left(page.keys, key)
+        self._evict()
+        return index < len(page.keys) and page.keys[index] == key
+
+    def look_up_many(self, keys):
+        keys = list(keys)
+        values = dict((key, self.look_up(key)) for key in sorted(set(keys)))
+        return [values[key] for key in keys]
+
+    def contains_many(self, keys):
+        keys = list(keys)
+        found = dict((key, key in self) for key in sorted(set(keys)))
+        return [found[key] for key in keys]
+
+    def irange(self, low=None, high=None, inclusive=(True, True), reverse=False):
+        """ Walks the chained leaves from the first key of the range, see Dictionary.irange.
+            Complexity: O(log n + k)
+        """
+        include_low, include_high = inclusive
+
+        if not reverse:
+            if low is None:
+                page, index = self._page(self._first_leaf), 0
+            else:
+                page = self._find_leaf(low)
+                index = (bisect.bisect_left if include_low else bisect.bisect_right)(page.keys, low)
+        else:
+            if high is None:
+                page = self._page(self._last_leaf)
+                index = len(page.keys) - 1
+            else:
+                page = self._find_leaf(high)
+                index = (bisect.bisect_right if include_high else bisect.bisect_left)(page.keys, high) - 1
+
+        while True:
+            while 0 <= index < len(page.keys):
+                key = page.keys[index]
+                if not (Dictionary._before_high(key, high, include_high) if not reverse else
+                        Dictionary._after_low(key, low, include_low)):
+                    return
+                yield key, pickle.loads(page.values[index])
+                index += -1 if reverse else 1
+
+            number = page.previous if reverse else page.next
+            if number == _NO_PAGE:
+                return
+            page = self._page(number)
+            index = len(page.keys) - 1 if reverse else 0
+            self._evict()
+
+    def iter_items(self):
+        return self.irange()
+
+    def iter_keys(self):
+        return (key for key, _ in self.irange())
+
+    def iter_values(self):
+        return (value for _, value in self.irange())
+
+    def reversed(self):
+        return self.irange(reverse=True)
+
+    def __reversed__(self):
+        return (key for key, _ in self.irange(reverse=True))
+
+    def count_range(self, low=None, high=None, inclusive=(True, True)):
+        """ Counts the keys between low and high (None meaning unbounded) along the chained leaves,
+            without decoding the values. The pages keep no subtree weights, so the leaves of the
+            range are all visited.
+            Complexity: O(log n + k / b), b being the number of keys per leaf
+        """
+        include_low, include_high = inclusive
+        if low is None:
+            page, index = self._page(self._first_leaf), 0
+        else:
+            page = self._find_leaf(low)
+            index = (bisect.bisect_left if include_low else bisect.bisect_right)(page.keys, low)
+
+        count = 0
+        while True:
+            if high is not None and page.keys and not Dictionary._before_high(page.keys[-1], high, include_high):
+                stop = (bisect.bisect_right if include_high else bisect.bisect_left)(page.keys, high)
+                count += max(stop - index, 0)
+                break
+            count += len(page.keys) - index
+            if page.next == _NO_PAGE:
+                break
+            page, index = self._page(page.next), 0
+            self._evict()
+
+        self._evict()
+        return count
+
+    # Cursors
+    def lower_bound(self, key):
+        """ Returns a cursor on the lowest key greater than or equal to key, see LeafCursor.
+            Complexity: O(log n)
+        """
+        cursor = LeafCursor(self)
+        cursor.seek(key)
+        return cursor
+
+
+class LeafCursor(Cursor):
+    """ A position in a BPlusTree, see Cursor: a leaf and an index in it.
+
+    The cursor steps along the chained leaves. It keeps the number of its leaf
+    rather than the page, which may be evicted from the cache meanwhile.
+    """
+
+    __slots__ = ('_leaf', '_index')
+
+    def __init__(self, tree):
+        Cursor.__init__(self, tree)
+        self._leaf = _NO_PAGE
+        self._index = 0
+
+    @property
+    def valid(self):
+        return self._leaf != _NO_PAGE
+
+    def _node(self):
+        if self._leaf == _NO_PAGE:
+            raise IndexError("The cursor does not point to any entry.")
+        return self._tree._page(self._leaf)
+
+    @property
+    def key(self):
+        return self._node().keys[self._index]
+
+    @property
+    def value(self):
+        return pickle.loads(self._node().values[self._index])
+
+    @value.setter
+    def value(self, value):
+        # the new value may split the leaf, after which the key is sought again
+        key = self.key
+        self._tree.insert(key, value)
+        self.seek(key)
+
+    def _move_to(self, page, index):
+        """ Points to the index-th entry of page, moving on to the neighbouring leaves if it is out of it.
+        :return: Whether the cursor is still valid.
+        """
+        tree = self._tree
+        while index >= len(page.keys) and page.next != _NO_PAGE:
+            page, index = tree._page(page.next), 0
+        while index < 0 and page.previous != _NO_PAGE:
+            page = tree._page(page.previous)
+            index = len(page.keys) - 1
+        tree._evict()
+
+        if 0 <= index < len(page.keys):
+            self._leaf, self._index = page.number, index
+        else:
+            self._leaf = _NO_PAGE
+        return self.valid
+
+    def next(self):
+        """ Moves to the successor of the current key.
+            Complexity: O(1) amortized
+        :return: Whether the cursor is still valid.
+        """
+        if self._leaf == _NO_PAGE:
+            return False
+        return self._move_to(self._node(), self._index + 1)
+
+    def prev(self):
+        """ Moves to the predecessor of the current key.
+            Complexity: O(1) amortized
+        :return: Whether the cursor is still valid.
+        """
+        if self._leaf == _NO_PAGE:
+            return False
+        return self._move_to(self._node(), self._index - 1)
+
+    def seek(self, key):
+        """ Moves to the lowest key greater than or equal to key, searching from the root.
+            Complexity: O(log n)
+        :return: Whether the cursor is valid, i.e. such a key exists.
+        """
+        page = self._tree._find_leaf(key)
+        return self._move_to(page, bisect.bisect_left(page.keys, key))
+
+
+########################## Testing
+
+
+class TestBPlusTreeOperations(unittest.TestCase):
+
+    def setUp(self):
+        # small pages and a small cache, so that the pages split and get evicted often
+        self.tree = BPlusTree(page_size=256, cache_pages=4)
+        self.model = {}
+
+        # populate the tree
+        self.number_of_insertions = 5000
+        for i in range(self.number_of_insertions):
+            key = random.randint(1, 1000000)
+            value = ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(10))
+            self.tree[key] = value
+            self.model[key] = value
+
+    def tearDown(self):
+        self.tree.close()
+
+    def check_pages(self, tree):
+        """ Checks the separators of every internal page against the keys below them.
+        :return: The keys of all the leaves, in order.
+        """
+        def keys_below(number, low, high):
+            page = tree._read_page(number) if number not in tree._cache else tree._cache[number]
+            self.assertLessEqual(page.used_bytes, tree._page_size)
+            self.assertTrue(all(low is None or low <= key for key in page.keys))
+            self.assertTrue(all(high is None or key < high for key in page.keys))
+            if page.is_leaf:
+                return page.keys
+            bounds = [low] + page.keys + [high]
+            return [key for index, child in enumerate(page.children)
+                    for key in keys_below(child, bounds[index], bounds[index + 1])]
+
+        return keys_below(tree.get_root(), None, None)
+
+    def test_insert(self):
+
+        self.assertEqual(self.tree.items(), sorted(self.model.items()))
+        self.assertEqual(self.tree.size(), len(self.model))
+        self.assertEqual(self.check_pages(self.tree), sorted(self.model))
+        self.assertGreater(self.tree.get_height(), 2)
+        self.assertLessEqual(len(self.tree._cache), 4)
+
+        self.assertTrue(all(self.tree[key] == value for key, value in self.model.items()))
+        self.assertEqual(self.tree.look_up_many([0, 1, 1000001]), [None] * 3)
+        self.assertRaises(ValueError, self.tree.insert, 0, "x" * 100)
+
+    def test_erase(self):
+
+        erased_keys = random.sample(list(self.model), len(self.model) - 100)
+        self.tree.erase_many(erased_keys[:1000])
+        for key in erased_keys[1000:] + [0]:
+            self.tree.erase(key)
+        for key in erased_keys:
+            del self.model[key]
+
+        self.assertEqual(self.tree.items(), sorted(self.model.items()))
+        self.assertEqual(list(self.tree.reversed()), sorted(self.model.items(), reverse=True))
+        self.assertEqual(self.check_pages(self.tree), sorted(self.model))
+        self.assertEqual(self.tree.size(), len(self.model))
+
+        # the freed pages are reused
+        number_of_pages = self.tree._number_of_pages
+        self.tree.insert_many((key, None) for key in erased_keys[:1000])
+        self.assertLessEqual(self.tree._number_of_pages, number_of_pages)
+
+        for key in list(self.tree):
+            self.tree.erase(key)
+        self.assertEqual((self.tree.items(), self.tree.get_height()), ([], 1))
+
+    def test_persistence(self):
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "tree")
+
+        with BPlusTree.from_sorted(sorted(self.model.items()), path, page_size=512) as tree:
+            self.assertEqual(self.check_pages(tree), sorted(self.model))
+            tree.erase(min(self.model))
+            tree.insert(0, "zero")
+        del self.model[min(self.model)]
+        self.model[0] = "zero"
+
+        with BPlusTree(path, cache_pages=2) as tree:
+            self.assertEqual(tree.items(), sorted(self.model.items()))
+            self.assertEqual(tree.size(), len(self.model))
+
+        os.remove(path)
+        os.rmdir(directory)
+
+    def test_irange(self):
+
+        keys = sorted(self.model)
+        for _ in range(100):
+            low, high = sorted(random.sample(range(1000001), 2))
+            inclusive = (random.random() < 0.5, random.random() < 0.5)
+            expected_keys = [key for key in keys if Dictionary._after_low(key, low, inclusive[0]) and
+                             Dictionary._before_high(key, high, inclusive[1])]
+
+            self.assertEqual([key for key, _ in self.tree.irange(low, high, inclusive)], expected_keys)
+            self.assertEqual([key for key, _ in self.tree.irange(low, high, inclusive, reverse=True)],
+                             expected_keys[::-1])
+
+        self.assertEqual(list(self.tree.irange(high=keys[10])), [(key, self.model[key]) for key in keys[:11]])
+        self.assertEqual(list(self.tree.irange(low=keys[-10], reverse=True)),
+                         [(key, self.model[key]) for key in keys[:-11:-1]])
+
+    def test_count_range(self):
+
+        keys = sorted(self.model)
+        for _ in range(100):
+            low, high = sorted(random.sample(range(1000001), 2))
+            inclusive = (random.random() < 0.5, random.random() < 0.5)
+            self.assertEqual(self.tree.count_range(low, high, inclusive), len(list(self.tree.irange(low, high, inclusive))))
+        self.assertEqual(self.tree.count_range(), len(keys))
+        self.assertEqual(self.tree.count_range(keys[10], keys[10], (True, False)), 0)
+        self.assertEqual(self.tree.count_range(high=keys[10]), 11)
+        self.assertLessEqual(len(self.tree._cache), 4)
+        self.assertFalse(hasattr(self.tree, "rank") or hasattr(self.tree, "sample"))
+
+    def test_cursor(self):
+
+        keys = sorted(self.model)
+        cursor = self.tree.lower_bound(keys[10] - 0.5)
+        visited = [cursor.key]
+        while cursor.next():
+            visited.append(cursor.key)
+        self.assertEqual(visited, keys[10:])
+        self.assertFalse(cursor.valid)
+
+        cursor = self.tree.find_cursor(keys[-1])
+        visited = [cursor.key]
+        while cursor.prev():
+            visited.append(cursor.key)
+        self.assertEqual(visited, keys[::-1])
+
+        self.assertIsNone(self.tree.find_cursor(keys[0] - 0.5))
+        self.assertFalse(self.tree.lower_bound(keys[-1] + 1).valid)
+
+        # growing the values splits the leaves under the cursor
+        number_of_pages = self.tree._number_of_pages
+        cursor = self.tree.lower_bound(keys[100])
+        for key in keys[100:300]:
+            self.assertEqual((cursor.key, cursor.value), (key, self.model[key]))
+            cursor.value = "y" * 20
+            self.assertEqual((cursor.key, cursor.value), (key, "y" * 20))
+            cursor.next()
+        self.assertGreater(self.tree._number_of_pages, number_of_pages)
+        self.assertEqual(self.check_pages(self.tree), keys)
+        self.assertEqual(self.tree[keys[299]], "y" * 20)
+        with self.assertRaises(IndexError):
+            BPlusTree().lower_bound(0).key
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,363 @@
+#!/usr/bin/python3
+
+from RBTree import RBTree
+from Treap import Treap
+from SplayTree import SplayTree
+from ConcurrentDictionary import ConcurrentDictionary
+
+import collections
+import contextlib
+import unittest
+import random
+import threading
+
+
+# Marks the keys known to be missing from the dictionary in the cache
+_ABSENT = object()
+_UNCACHED = object()
+
+
+class _FrequencySketch(object):
+    """ Estimates how often the keys were accessed recently, for the TinyLFU admission.
+
+    A count-min sketch: every key increments one counter in each of 4 rows, and its
+    frequency is the lowest of them. The 4 counters of a key are picked by 4 slices
+    of 32 bits of the product of its hash with an odd 64 bits constant. They
+    saturate at 15, and they are all halved once sample_size accesses have been
+    counted, so that the keys which stopped being popular fade out.
+    """
+
+    __slots__ = ('_width', '_counters', '_sample_size', '_accesses')
+
+    _MULTIPLIER = 0x9E3779B97F4A7C15
+    _HALVED = bytes(counter >> 1 for counter in range(256))
+
+    def __init__(self, capacity):
+        self._width = 16
+        while self._width < 2 * capacity:
+            self._width *= 2
+        self._counters = bytearray(4 * self._width)
+        self._sample_size = 10 * capacity
+        self._accesses = 0
+
+    def _indices(self, key):
+        product = (hash(key) & 0xFFFFFFFFFFFFFFFF) * _FrequencySketch._MULTIPLIER
+        width = self._width
+        mask = width - 1
+        return (product & mask, width + (product >> 32 & mask),
+                2 * width + (product >> 64 & mask), 3 * width + (product >> 96 & mask))
+
+    def increment(self, key):
+        counters = self._counters
+        for index in self._indices(key):
+            if counters[index] < 15:
+                counters[index] += 1
+
+        self._accesses += 1
+        if self._accesses == self._sample_size:
+            self._counters = self._counters.translate(_FrequencySketch._HALVED)
+            self._accesses //= 2
+
+    def frequency(self, key):
+        counters = self._counters
+        return min(counters[index] for index in self._indices(key))
+
+
+class CachedDictionary(object):
+    """ Answers the lookups of hot keys from a bounded hash table in front of a dictionary.
+
+    The cache keeps the values of the keys looked up lately, and remembers the
+    keys found missing (negative caching). When it is full, it evicts the least
+    recently used key. With the "tinylfu" policy, a new key is only admitted if
+    it was accessed more often than that key, according to a frequency sketch,
+    so that a scan over cold keys does not flush the hot ones.
+
+    Updates made through the cache update the entries of their keys. Any other
+    update of the dictionary, e.g. a split, a join or an update made directly on
+    it, is detected through its version and empties the cache before the next
+    lookup. The keys must be hashable.
+
+    Only the lookups go through the cache: items and irange are forwarded to the
+    dictionary, and the updates of its structure (split, join, the set operations
+    of a Treap) have to be made on the dictionary itself.
+
+    Even the hits reorder the cache, so a CachedDictionary must not be shared
+    between threads. Each thread can have its own one in front of a shared
+    ConcurrentDictionary, whose version tells every cache about the updates of
+    the other threads. A ConcurrentDictionary wrapping a CachedDictionary works
+    too, but then holds its lock alone for every read.
+    """
+
+    POLICIES = ("lru", "tinylfu")
+
+    def __init__(self, dictionary, capacity=1024, policy="lru"):
+        if capacity < 1:
+            raise ValueError("The capacity of the cache must be positive.")
+        if policy not in CachedDictionary.POLICIES:
+            raise ValueError("Unknown cache policy: {}.".format(policy))
+
+        self._dictionary = dictionary
+        self._capacity = capacity
+        self._sketch = _FrequencySketch(capacity) if policy == "tinylfu" else None
+        self._entries = collections.OrderedDict()
+        # the version of the dictionary the entries were read from
+        self._cached_version = dictionary._version
+        self.hits = self.misses = 0
+
+    @property
+    def _version(self):
+        return self._dictionary._version
+
+    def _reads_mutate(self):
+        # even the hits update the order of the entries and the frequency sketch
+        return True
+
+    def _descents_mutate(self):
+        # and there is no plain descent bypassing the cache
+        return True
+
+    def _check_version(self):
+        if self._dictionary._version != self._cached_version:
+            self._entries.clear()
+            self._cached_version = self._dictionary._version
+
+    def _admit(self, key, entry):
+        entries = self._entries
+        if len(entries) >= self._capacity:
+            victim = next(iter(entries))
+            if self._sketch is not None and self._sketch.frequency(key) <= self._sketch.frequency(victim):
+                return
+            del entries[victim]
+        entries[key] = entry
+
+    def _entry(self, key):
+        """ Returns the cached value of a key, or _ABSENT if it is missing, looking it up on a cache miss.
+            Complexity: O(1) on a hit, one or two lookups in the dictionary on a miss
+        """
+        self._check_version()
+        if self._sketch is not None:
+            self._sketch.increment(key)
+
+        entry = self._entries.get(key, _UNCACHED)
+        if entry is not _UNCACHED:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = self._dictionary.look_up(key)
+        if entry is None and key not in self._dictionary:
+            entry = _ABSENT
+        self._admit(key, entry)
+        return entry
+
+    # Reads
+    def look_up(self, key):
+        entry = self._entry(key)
+        return None if entry is _ABSENT else entry
+
+    def __getitem__(self, key):
+        return self.look_up(key)
+
+    def __contains__(self, key):
+        return self._entry(key) is not _ABSENT
+
+    def look_up_many(self, keys):
+        return [self.look_up(key) for key in keys]
+
+    def contains_many(self, keys):
+        return [key in self for key in keys]
+
+    def size(self):
+        return self._dictionary.size()
+
+    def items(self):
+        return self._dictionary.items()
+
+    def irange(self, low=None, high=None, inclusive=(True, True), reverse=False):
+        return self._dictionary.irange(low, high, inclusive, reverse)
+
+    def __len__(self):
+        return self._dictionary.size()
+
+    def cache_stats(self):
+        """ Returns the counters of the cache: hits, misses, hit_ratio (None before the first lookup),
+            size (the number of cached keys) and capacity.
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / lookups if lookups else None,
+                "size": len(self._entries), "capacity": self._capacity}
+
+    def clear_cache(self):
+        self._entries.clear()
+
+    # Writes
+    def _updated(self, key, entry):
+        """ Refreshes the entry of a key after an update made through the cache.
+        """
+        if key in self._entries:
+            self._entries[key] = entry
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """ Gives the dictionary to update through the cache, whose entries then take its new version.
+            A ConcurrentDictionary is updated under its lock, so that no update of another thread
+            can slip in between the check of the version and the update, and go unnoticed.
+        """
+        if isinstance(self._dictionary, ConcurrentDictionary):
+            lock = self._dictionary.writing()
+        else:
+            lock = contextlib.nullcontext(self._dictionary)
+
+        with lock as dictionary:
+            self._check_version()
+            yield dictionary
+            self._cached_version = dictionary._version
+
+    def insert(self, key, value=None):
+        with self._writing() as dictionary:
+            dictionary.insert(key, value)
+        self._updated(key, value)
+
+    def __setitem__(self, key, value):
+        self.insert(key, value)
+
+    def erase(self, key):
+        with self._writing() as dictionary:
+            dictionary.erase(key)
+        self._updated(key, _ABSENT)
+
+    def insert_many(self, items):
+        items = list(items)
+        with self._writing() as dictionary:
+            dictionary.insert_many(items)
+        for key, _ in items:
+            self._entries.pop(key, None)
+
+    def erase_many(self, keys):
+        keys = list(keys)
+        with self._writing() as dictionary:
+            dictionary.erase_many(keys)
+        for key in keys:
+            self._updated(key, _ABSENT)
+
+########################## Testing
+
+
+class TestCachedDictionaryOperations(unittest.TestCase):
+
+    def test_look_up_and_updates(self):
+
+        for tree_type in (RBTree, Treap, SplayTree):
+            for policy in CachedDictionary.POLICIES:
+                tree = tree_type()
+                cached = CachedDictionary(tree, capacity=50, policy=policy)
+                model = {}
+                reads = 0
+
+                for i in range(5000):
+                    key = random.randint(1, 200)
+                    operation = random.random()
+                    if operation < 0.1:
+                        cached[key] = i
+                        model[key] = i
+                    elif operation < 0.15:
+                        cached.erase(key)
+                        model.pop(key, None)
+                    elif operation < 0.2:
+                        # updates bypassing the cache
+                        tree.insert(key, -i)
+                        model[key] = -i
+                    else:
+                        self.assertEqual(cached[key], model.get(key))
+                        self.assertEqual(key in cached, key in model)
+                        reads += 2
+
+                stats = cached.cache_stats()
+                self.assertLessEqual(stats["size"], 50)
+                self.assertGreater(stats["hits"], 0)
+                self.assertEqual(stats["hits"] + stats["misses"], reads)
+                self.assertEqual(cached.look_up_many(range(201)), [model.get(key) for key in range(201)])
+
+    def test_split_and_join(self):
+
+        treap = Treap.from_sorted([(key, key) for key in range(100)])
+        cached = CachedDictionary(treap, capacity=10)
+        self.assertEqual((cached[10], cached[90], 200 in cached), (10, 90, False))
+        self.assertEqual(cached.cache_stats()["size"], 3)
+
+        lower, higher = treap.split(49)
+        self.assertEqual((cached[10], cached[90]), (None, None))
+        lower.join(higher)
+        treap.insert(200, 0)
+        self.assertEqual(cached[200], 0)
+
+    def test_tinylfu_admission(self):
+
+        tree = RBTree.from_sorted([(key, key) for key in range(10000)])
+        hit_ratios = {}
+        for policy in CachedDictionary.POLICIES:
+            cached = CachedDictionary(tree, capacity=100, policy=policy)
+            # every hot key comes back after 200 distinct keys, too late for an LRU cache of 100 keys
+            for cold_key in range(100, 10000):
+                cached.look_up(cold_key)
+                cached.look_up(cold_key % 100)
+            hit_ratios[policy] = cached.cache_stats()["hit_ratio"]
+
+        self.assertLess(hit_ratios["lru"], 0.1)
+        self.assertGreater(hit_ratios["tinylfu"], 0.4)
+
+    def test_threads(self):
+
+        # one cache per thread, in front of a shared concurrent dictionary
+        concurrent_dictionary = ConcurrentDictionary(Treap.from_sorted((key, 0) for key in range(1000)))
+        caches = [CachedDictionary(concurrent_dictionary, capacity=100) for _ in range(4)]
+        errors = []
+
+        def update_and_read(thread):
+            cached = caches[thread]
+            for i in range(2000):
+                key = random.randrange(1000)
+                if key % 4 == thread:
+                    # only this thread updates the key
+                    cached[key] = i
+                    if cached[key] != i:
+                        errors.append(key)
+                else:
+                    cached.look_up(key)
+
+        threads = [threading.Thread(target=update_and_read, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        # the updates of the other threads have emptied the caches
+        values = [value for _, value in concurrent_dictionary.items()]
+        for cached in caches:
+            self.assertEqual(cached.look_up_many(range(1000)), values)
+            self.assertEqual(cached.items(), concurrent_dictionary.items())
+
+        # a cache shared through a concurrent dictionary, which holds its lock alone for the reads
+        cached = CachedDictionary(RBTree.from_sorted((key, key) for key in range(1000)), capacity=100)
+        shared = ConcurrentDictionary(cached)
+
+        def read(thread):
+            for i in range(2000):
+                key = random.randrange(1000)
+                if shared[key] != key or key not in shared:
+                    errors.append(key)
+
+        threads = [threading.Thread(target=read, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(shared.irange(10, 12), [(10, 10), (11, 11), (12, 12)])
+        self.assertEqual(cached.cache_stats()["hits"] + cached.cache_stats()["misses"], 16000)
+
+
+if __name__ == "__main__":
+    unittest.main()
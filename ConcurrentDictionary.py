@@ -0,0 +1,396 @@
+#!/usr/bin/python3
+
+from Dictionary import Dictionary
+from RBTree import RBTree
+from Treap import Treap
+from SplayTree import SplayTree
+from BPlusTree import BPlusTree
+
+import contextlib
+import unittest
+import random
+import sys
+import threading
+
+
+class ReadWriteLock(object):
+    """ A lock held either by any number of readers or by a single writer.
+
+    Writers are preferred: once a writer waits, new readers wait behind it, so
+    a steady stream of readers cannot starve the writers. The lock is not
+    reentrant, a thread must not acquire it again while holding it.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class WriteBatch(object):
+    """ Records insertions and erasures, which ConcurrentDictionary.batch applies together.
+    """
+
+    def __init__(self):
+        self._operations = []
+
+    def insert(self, key, value=None):
+        self._operations.append((True, key, value))
+
+    def __setitem__(self, key, value):
+        self.insert(key, value)
+
+    def erase(self, key):
+        self._operations.append((False, key, None))
+
+    def _apply(self, dictionary):
+        """ Applies the operations in order, each run of insertions or erasures as one bulk update.
+        """
+        start = 0
+        while start < len(self._operations):
+            is_insertion = self._operations[start][0]
+            end = start
+            while end < len(self._operations) and self._operations[end][0] == is_insertion:
+                end += 1
+
+            if is_insertion:
+                dictionary.insert_many([(key, value) for _, key, value in self._operations[start:end]])
+            else:
+                dictionary.erase_many([key for _, key, _ in self._operations[start:end]])
+            start = end
+
+
+class ConcurrentDictionary(object):
+    """ Makes a dictionary safe to share between threads.
+
+    The reads share a ReadWriteLock, so they run in parallel, while the updates
+    hold it alone. The updates of a batch() take the lock only once, and are
+    applied with the bulk updates of the dictionary.
+
+    The reads of a dictionary whose reads write into it (see
+    Dictionary._reads_mutate, e.g. those of a splaying SplayTree) cannot share
+    the lock, and hold it alone. With pure_reads, its lookups are answered by a
+    plain descent that leaves the tree unchanged instead, so they keep running
+    in parallel, as long as such a descent does not write either (see
+    Dictionary._descents_mutate); without it, the tree keeps adapting to them.
+    """
+
+    def __init__(self, dictionary, pure_reads=True):
+        self._dictionary = dictionary
+        self._pure_reads = pure_reads
+        self._lock = ReadWriteLock()
+
+    def _read_mode(self, look_up=False):
+        dictionary = self._dictionary
+        if not dictionary._reads_mutate():
+            return "shared"
+        if look_up and self._pure_reads and not dictionary._descents_mutate():
+            return "pure"
+        return "exclusive"
+
+    @contextlib.contextmanager
+    def _read_lock(self, look_up=False):
+        """ Holds the lock for a read, alone if the reads of the dictionary write into it.
+            The mode is checked again once the lock is held for reading, since an update
+            may have changed it meanwhile (e.g. the first range_add of a Treap).
+        :param look_up: Whether the read is a lookup, which may be answered by a pure descent.
+        :return: A context manager telling whether the lookup must be a pure descent.
+        """
+        while True:
+            mode = self._read_mode(look_up)
+            with (self._lock.writing() if mode == "exclusive" else self._lock.reading()):
+                if mode == "exclusive" or self._read_mode(look_up) == mode:
+                    yield mode == "pure"
+                    return
+
+    @contextlib.contextmanager
+    def reading(self):
+        """ Holds the lock for reading, for the queries not wrapped below. It is held alone
+            if the reads of the dictionary write into it.
+            Complexity: O(1) once no writer holds nor waits for the lock
+        :return: A context manager giving the underlying dictionary, which must not be updated.
+        """
+        with self._read_lock():
+            yield self._dictionary
+
+    @contextlib.contextmanager
+    def writing(self):
+        """ Holds the lock for writing, for the updates not wrapped below.
+        :return: A context manager giving the underlying dictionary.
+        """
+        with self._lock.writing():
+            yield self._dictionary
+
+    @property
+    def _version(self):
+        # a single int, which can be read without the lock
+        return self._dictionary._version
+
+    # Reads
+    def look_up(self, key):
+        with self._read_lock(look_up=True) as pure:
+            if pure:
+                return Dictionary._look_up(self._dictionary.get_root(), key)
+            return self._dictionary.look_up(key)
+
+    def __getitem__(self, key):
+        return self.look_up(key)
+
+    def __contains__(self, key):
+        with self._read_lock():
+            return key in self._dictionary
+
+    def look_up_many(self, keys):
+        with self._read_lock():
+            return self._dictionary.look_up_many(keys)
+
+    def contains_many(self, keys):
+        with self._read_lock():
+            return self._dictionary.contains_many(keys)
+
+    def size(self):
+        with self._read_lock():
+            return self._dictionary.size()
+
+    def items(self):
+        with self._read_lock():
+            return self._dictionary.items()
+
+    def irange(self, low=None, high=None, inclusive=(True, True), reverse=False):
+        """ Returns the (key, value) pairs of a range, see Dictionary.irange.
+            They are materialized as a list, so that the lock is not held between them.
+            Complexity: O(log n + k)
+        """
+        with self._read_lock():
+            return list(self._dictionary.irange(low, high, inclusive, reverse))
+
+    # Writes
+    def insert(self, key, value=None):
+        with self._lock.writing():
+            self._dictionary.insert(key, value)
+
+    def __setitem__(self, key, value):
+        self.insert(key, value)
+
+    def erase(self, key):
+        with self._lock.writing():
+            self._dictionary.erase(key)
+
+    def insert_many(self, items):
+        items = list(items)
+        with self._lock.writing():
+            self._dictionary.insert_many(items)
+
+    def erase_many(self, keys):
+        keys = list(keys)
+        with self._lock.writing():
+            self._dictionary.erase_many(keys)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """ Collects updates and applies them at the end of the block, under a single
+            acquisition of the lock. Nothing is applied if the block raises.
+        :return: A context manager giving a WriteBatch.
+        """
+        write_batch = WriteBatch()
+        yield write_batch
+        with self._lock.writing():
+            write_batch._apply(self._dictionary)
+
+
+########################## Testing
+
+
+def read_while_shared(concurrent_dictionary, read):
+    """ Runs a read in another thread while holding the lock for reading, and tells
+        whether it could complete meanwhile, i.e. whether it shares the lock.
+    """
+    reader = threading.Thread(target=read)
+    with concurrent_dictionary._lock.reading():
+        reader.start()
+        reader.join(timeout=0.5)
+        shared = not reader.is_alive()
+    reader.join()
+    return shared
+
+
+class TestConcurrentDictionaryOperations(unittest.TestCase):
+
+    def test_concurrent_updates(self):
+
+        for dictionary in (RBTree(), Treap(), SplayTree()):
+            concurrent_dictionary = ConcurrentDictionary(dictionary)
+
+            def update(thread):
+                for i in range(500):
+                    concurrent_dictionary[thread * 1000 + i] = thread
+                    concurrent_dictionary.look_up(random.randrange(4000))
+                for i in range(0, 500, 2):
+                    concurrent_dictionary.erase(thread * 1000 + i)
+
+            threads = [threading.Thread(target=update, args=(thread,)) for thread in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            expected_items = [(thread * 1000 + i, thread) for thread in range(4) for i in range(1, 500, 2)]
+            self.assertEqual(concurrent_dictionary.items(), expected_items)
+            self.assertEqual(concurrent_dictionary.size(), len(expected_items))
+            self.assertEqual(concurrent_dictionary.irange(1001, 1006), [(1001, 1), (1003, 1), (1005, 1)])
+
+    def test_batch(self):
+
+        concurrent_dictionary = ConcurrentDictionary(RBTree.from_sorted((key, 0) for key in range(100)))
+        with concurrent_dictionary.batch() as write_batch:
+            for key in range(50, 150):
+                write_batch[key] = 1
+            for key in range(0, 100, 2):
+                write_batch.erase(key)
+            write_batch.insert(0, 2)
+
+        expected_items = [(0, 2)] + [(key, 0 if key < 50 else 1) for key in range(1, 150) if key >= 100 or key % 2]
+        self.assertEqual(concurrent_dictionary.items(), expected_items)
+
+        with self.assertRaises(KeyError):
+            with concurrent_dictionary.batch() as write_batch:
+                write_batch.erase(1)
+                raise KeyError(1)
+        self.assertIn(1, concurrent_dictionary)
+
+    def test_parallel_reads(self):
+
+        splay_tree = SplayTree.from_sorted((key, str(key)) for key in range(1000))
+        root = splay_tree.get_root()
+
+        # with pure reads the lookups share the lock, and the splay tree is left as it is
+        concurrent_dictionary = ConcurrentDictionary(splay_tree)
+        results = []
+        self.assertTrue(read_while_shared(concurrent_dictionary, lambda: results.append(concurrent_dictionary[7])))
+        self.assertEqual(results, ["7"])
+        self.assertIs(splay_tree.get_root(), root)
+
+        # the other reads of a splaying tree hold it alone
+        self.assertFalse(read_while_shared(concurrent_dictionary, lambda: results.append(7 in concurrent_dictionary)))
+        self.assertFalse(read_while_shared(concurrent_dictionary, concurrent_dictionary.items))
+
+        # otherwise the lookups hold it alone too, and still splay
+        concurrent_dictionary = ConcurrentDictionary(splay_tree, pure_reads=False)
+        self.assertFalse(read_while_shared(concurrent_dictionary, lambda: concurrent_dictionary.look_up(7)))
+        self.assertEqual(splay_tree.get_root().key, 7)
+
+        # the reads of a tree whose reads do not write share it
+        concurrent_dictionary = ConcurrentDictionary(RBTree.from_sorted((key, key) for key in range(1000)))
+        self.assertTrue(read_while_shared(concurrent_dictionary, concurrent_dictionary.items))
+        self.assertTrue(read_while_shared(concurrent_dictionary, lambda: 7 in concurrent_dictionary))
+
+
+    def test_lazy_treap_reads(self):
+
+        # the reads of a lazy treap push its pending updates down, so they must not overlap
+        treap = Treap.from_sorted((key, 0) for key in range(20000))
+        treap.range_add(None, None, 1)
+        concurrent_dictionary = ConcurrentDictionary(treap)
+        self.assertTrue(treap._descents_mutate())
+
+        results = []
+
+        def read(thread):
+            if thread % 2:
+                results.append(all(value == 1 for _, value in concurrent_dictionary.items()))
+            else:
+                results.append(all(concurrent_dictionary[key] == 1 for key in range(0, 20000, 7)))
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=read, args=(thread,)) for thread in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        self.assertEqual(results, [True] * 4)
+        self.assertEqual(treap.items(), [(key, 1) for key in range(20000)])
+
+    def test_b_plus_tree_reads(self):
+
+        # the reads of a B+ tree update its page cache, here much smaller than the working set
+        with BPlusTree(page_size=256, cache_pages=1) as tree:
+            tree.insert_many((key, key) for key in range(5000))
+            concurrent_dictionary = ConcurrentDictionary(tree)
+            # so they take the lock alone, lookups included
+            self.assertFalse(read_while_shared(concurrent_dictionary, lambda: concurrent_dictionary.look_up(7)))
+            self.assertFalse(read_while_shared(concurrent_dictionary, lambda: 7 in concurrent_dictionary))
+            errors = []
+
+            def read():
+                try:
+                    for _ in range(1000):
+                        key = random.randrange(5000)
+                        if concurrent_dictionary.look_up(key) != key or key not in concurrent_dictionary:
+                            errors.append(key)
+                except Exception as error:
+                    errors.append(error)
+
+            switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(1e-6)
+            try:
+                threads = [threading.Thread(target=read) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            finally:
+                sys.setswitchinterval(switch_interval)
+
+            self.assertEqual(errors, [])
+            self.assertLessEqual(len(tree._cache), 1)
+            self.assertEqual(concurrent_dictionary.irange(10, 12), [(10, 10), (11, 11), (12, 12)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,19 @@
 #!/usr/bin/python3
 
 import abc
+import bisect
+import random
+
+import Snapshot
 
 
 class Dictionary(object):
     __metaclass__ = abc.ABCMeta
 
+    # Incremented by every update of the keys or the values, so that the views
+    # built from a dictionary (see freeze) can tell whether they are outdated
+    _version = 0
+
     @abc.abstractmethod
     def insert(self, key, value=None):
         """ Associates a value to a key.
@@ -26,6 +34,131 @@ class Dictionary(object):
         :return: None
         """
 
+    @classmethod
+    @abc.abstractmethod
+    def from_sorted(cls, items):
+        """ Builds a dictionary from (key, value) pairs sorted by strictly increasing keys.
+            Complexity: O(n)
+        :param items: An iterable of (key, value) pairs.
+        :return: The new dictionary.
+        """
+
+    @staticmethod
+    def _check_sorted(items):
+        """ Materializes items as a list, making sure that their keys are strictly increasing.
+            Complexity: O(n)
+        """
+        items = list(items)
+        for index in range(1, len(items)):
+            if not items[index - 1][0] < items[index][0]:
+                raise ValueError("The items must be sorted by strictly increasing keys.")
+        return items
+
+    # Bulk updates
+
+    # A batch is applied by rebuilding the tree once m log n exceeds this many times n + m
+    _REBUILD_FACTOR = 5
+
+    def _rebuild_is_cheaper(self, batch_size):
+        size = self.size()
+        return batch_size * (size + 1).bit_length() > self._REBUILD_FACTOR * (size + batch_size)
+
+    @staticmethod
+    def _sort_batch(items):
+        """ Sorts a batch of (key, value) pairs, keeping only the last pair of each key.
+            Complexity: O(m log m)
+        """
+        items = sorted(items, key=lambda item: item[0])
+        return [item for index, item in enumerate(items)
+                if index + 1 == len(items) or items[index + 1][0] != item[0]]
+
+    def _adopt(self, tree):
+        """ Takes over the nodes of another dictionary of the same type.
+        """
+        self._version += 1
+        self._root = tree._root
+        if hasattr(tree, '_size'):
+            self._size = tree._size
+
+    def insert_many(self, items):
+        """ Inserts a batch of (key, value) pairs; the last pair wins for repeated keys.
+            Small batches are inserted one by one, while large ones are merged with the
+            sorted items of the tree, which is then rebuilt with from_sorted.
+            Complexity: O(min(m log n, n + m log m))
+        """
+        items = list(items)
+        if not self._rebuild_is_cheaper(len(items)):
+            for key, value in items:
+                self.insert(key, value)
+            return
+
+        def merged(old_items, new_items):
+            new_items = iter(new_items)
+            new_item = next(new_items, None)
+            for old_item in old_items:
+                while new_item is not None and new_item[0] < old_item[0]:
+                    yield new_item
+                    new_item = next(new_items, None)
+                if new_item is not None and new_item[0] == old_item[0]:
+                    yield new_item
+                    new_item = next(new_items, None)
+                else:
+                    yield old_item
+            if new_item is not None:
+                yield new_item
+                yield from new_items
+
+        self._adopt(type(self).from_sorted(merged(self.iter_items(), Dictionary._sort_batch(items))))
+
+    def erase_many(self, keys):
+        """ Erases a batch of keys, ignoring the missing ones.
+            Small batches are erased one by one, while for large ones the tree is rebuilt
+            with from_sorted from its sorted items, skipping the erased keys.
+            Complexity: O(min(m log n, n + m log m))
+        """
+        keys = list(keys)
+        if not self._rebuild_is_cheaper(len(keys)):
+            for key in keys:
+                self.erase(key)
+            return
+
+        def remaining(old_items, erased_keys):
+            erased_keys = iter(erased_keys)
+            erased_key = next(erased_keys, None)
+            for old_item in old_items:
+                while erased_key is not None and erased_key < old_item[0]:
+                    erased_key = next(erased_keys, None)
+                if erased_key is None or old_item[0] < erased_key:
+                    yield old_item
+
+        self._adopt(type(self).from_sorted(remaining(self.iter_items(), sorted(keys))))
+
+    # Serialization
+    def dump(self, file):
+        """ Streams the (key, value) pairs to a binary file, in the format of Snapshot.
+            Complexity: O(n)
+        """
+        Snapshot.write(file, self.iter_items())
+
+    @classmethod
+    def load(cls, file):
+        """ Restores a dictionary written by dump, with from_sorted.
+            WARNING: only for trusted files, since the keys and the values which are neither ints nor
+            floats are unpickled, which can run arbitrary code (see Snapshot).
+            Complexity: O(n)
+        """
+        items, _ = Snapshot.read(file)
+        return cls.from_sorted(items)
+
+    def freeze(self):
+        """ Returns a read-only view of the (key, value) pairs in NumPy arrays, which answers
+            batches of queries with vectorized binary searches, see FrozenDictionary.
+            Complexity: O(n), then O(n) again at the first query after every update
+        """
+        # imported here, so that NumPy is only loaded by the programs freezing dictionaries
+        import FrozenDictionary
+        return FrozenDictionary.FrozenDictionary(self)
+
     # Queries
 
     @property
@@ -35,6 +168,9 @@ class Dictionary(object):
         :return The size of the dictionary.
         """
 
+    def __len__(self):
+        return self.size()
+
     @property
     @abc.abstractmethod
     def get_root(self):
@@ -45,38 +181,157 @@ class Dictionary(object):
         return self._root
 
     @staticmethod
-    def _items(node, items_list):
+    def _iter_nodes(node, reverse=False):
+        """ Yields the nodes of the subtree rooted in node sorted by keys, using an explicit stack.
+            Complexity: O(n), O(height) memory
+        :param node: The root of the traversed subtree.
+        :param reverse: Whether the nodes are yielded in decreasing order of keys.
+        """
+        stack = []
+        if not reverse:
+            while True:
+                while node is not None:
+                    stack.append(node)
+                    node = node.left_son
+                if not stack:
+                    return
+                node = stack.pop()
+                yield node
+                node = node.right_son
+        else:
+            while True:
+                while node is not None:
+                    stack.append(node)
+                    node = node.right_son
+                if not stack:
+                    return
+                node = stack.pop()
+                yield node
+                node = node.left_son
 
-        if node is None:
-            return
+    def iter_items(self):
+        """ Lazily yields all the (key, value) pairs sorted by keys.
+            Complexity: O(n), O(height) memory
+        """
+        return ((node.key, node.value) for node in self._iter_nodes(self._root))
 
-        Dictionary._items(node.left_son, items_list)
-        items_list.append((node.key, node.value))
-        Dictionary._items(node.right_son, items_list)
+    def iter_keys(self):
+        """ Lazily yields the sorted keys.
+            Complexity: O(n), O(height) memory
+        """
+        return (node.key for node in self._iter_nodes(self._root))
+
+    def iter_values(self):
+        """ Lazily yields the values sorted by their keys.
+            Complexity: O(n), O(height) memory
+        """
+        return (node.value for node in self._iter_nodes(self._root))
+
+    def reversed(self):
+        """ Lazily yields all the (key, value) pairs in decreasing order of keys.
+            Complexity: O(n), O(height) memory
+        """
+        return ((node.key, node.value) for node in self._iter_nodes(self._root, True))
+
+    def __iter__(self):
+        return self.iter_keys()
+
+    def __reversed__(self):
+        return (node.key for node in self._iter_nodes(self._root, True))
+
+    @staticmethod
+    def _after_low(key, low, include_low):
+        """ Checks whether key is not below the lower bound low (None means unbounded).
+        """
+        return low is None or low < key or (include_low and key == low)
+
+    @staticmethod
+    def _before_high(key, high, include_high):
+        """ Checks whether key is not above the upper bound high (None means unbounded).
+        """
+        return high is None or key < high or (include_high and key == high)
+
+    @staticmethod
+    def _iter_range_nodes(node, low, high, inclusive, reverse=False):
+        """ Yields the nodes of the subtree rooted in node whose keys lie between low and high.
+            Complexity: O(log n + k) on balanced trees, where k is the number of yielded nodes
+        """
+        include_low, include_high = inclusive
+        stack = []
+        if not reverse:
+            while True:
+                while node is not None:
+                    if Dictionary._after_low(node.key, low, include_low):
+                        stack.append(node)
+                        node = node.left_son
+                    else:
+                        node = node.right_son
+                if not stack:
+                    return
+                node = stack.pop()
+                if not Dictionary._before_high(node.key, high, include_high):
+                    return
+                yield node
+                node = node.right_son
+        else:
+            while True:
+                while node is not None:
+                    if Dictionary._before_high(node.key, high, include_high):
+                        stack.append(node)
+                        node = node.right_son
+                    else:
+                        node = node.left_son
+                if not stack:
+                    return
+                node = stack.pop()
+                if not Dictionary._after_low(node.key, low, include_low):
+                    return
+                yield node
+                node = node.left_son
+
+    def irange(self, low=None, high=None, inclusive=(True, True), reverse=False):
+        """ Lazily yields the (key, value) pairs whose keys lie between low and high.
+            Complexity: O(log n + k) on balanced trees, where k is the number of yielded pairs
+        :param low: The lower bound of the keys, None for no lower bound.
+        :param high: The upper bound of the keys, None for no upper bound.
+        :param inclusive: Whether each of the two bounds belongs to the range.
+        :param reverse: Whether the pairs are yielded in decreasing order of keys.
+        """
+        return ((node.key, node.value)
+                for node in self._iter_range_nodes(self._root, low, high, inclusive, reverse))
 
     def items(self):
         """ Returns a list with all the (key, value) pairs sorted by keys.
             Complexity: O(n)
         """
-
-        items_list = []
-        Dictionary._items(self._root, items_list)
-        return items_list
+        return list(self.iter_items())
 
     def keys(self):
         """ Returns the sorted list of keys.
             Complexity: O(n)
         """
-        return [key for key, value in self.items()]
+        return list(self.iter_keys())
+
+    def values(self):
+        """ Returns the list of values sorted by their keys.
+            Complexity: O(n)
+        """
+        return list(self.iter_values())
 
     @staticmethod
     def _get_height(node, current_height):
-        if node is None:
-            return 0
+        height = 0
+        stack = [(node, current_height)] if node is not None else []
+        while stack:
+            node, current_height = stack.pop()
+            if current_height > height:
+                height = current_height
+            if node.left_son is not None:
+                stack.append((node.left_son, current_height + 1))
+            if node.right_son is not None:
+                stack.append((node.right_son, current_height + 1))
 
-        return max(current_height,
-                   Dictionary._get_height(node.left_son, current_height+1),
-                   Dictionary._get_height(node.right_son, current_height+1))
+        return height
 
     def get_height(self):
         """ Returns the height of the tree.
@@ -84,17 +339,64 @@ class Dictionary(object):
         """
         return Dictionary._get_height(self._root, 1)
 
+    # The number of random nodes whose depth is measured by _sampled_max_depth
+    DEPTH_SAMPLES = 8
+
+    @staticmethod
+    def _depth_samples(size):
+        """ Returns the ranks of the nodes whose depth is measured: the first, the last and a few random ones.
+        """
+        return [0, size - 1] + [random.randrange(size) for _ in range(Dictionary.DEPTH_SAMPLES)]
+
+    def _sampled_max_depth(self):
+        """ Returns the largest depth (the root being at depth 1) among the sampled nodes, reached
+            through the weights of the subtrees. It is a lower bound of the height, which may miss
+            the deepest paths: e.g. on a treap, it is typically about half of the height.
+            The descents stop after 4 log2(n) + 4 levels, so that a degenerate tree (e.g. a
+            splay tree after increasing insertions) is not walked through, and reports that depth.
+            Complexity: O(log n)
+        """
+        root = self.get_root()
+        if root is None:
+            return 0
+
+        size = root.weight_of_subtree
+        depth_limit = 4 * size.bit_length() + 4
+        max_depth = 0
+        for k in Dictionary._depth_samples(size):
+            node, depth = root, 1
+            while depth < depth_limit:
+                left_son_weight = node.left_son.weight_of_subtree if node.left_son is not None else 0
+                if k == left_son_weight:
+                    break
+                if k < left_son_weight:
+                    node = node.left_son
+                else:
+                    k -= left_son_weight + 1
+                    node = node.right_son
+                depth += 1
+            max_depth = max(max_depth, depth)
+
+        return max_depth
+
+    def tree_stats(self):
+        """ Returns health metrics which are cheap enough to be polled on large trees:
+                size                    the number of keys
+                max_depth_lower_bound   a sampled lower bound of the height, see _sampled_max_depth
+            Subclasses add the metrics specific to their balancing. None of them is stored in
+            the tree: they are computed on demand, so that the updates do not pay for them.
+            Complexity: O(log n)
+        """
+        return {"size": self.size(), "max_depth_lower_bound": self._sampled_max_depth()}
+
     @staticmethod
     def _look_up(node, key):
-        if node is None:
-            return None
+        while node is not None:
+            if key == node.key:
+                return node.value
+            node = node.left_son if key < node.key else node.right_son
 
-        if key == node.key:
-            return node.value
-        if key < node.key:
-            return Dictionary._look_up(node.left_son, key)
-        else:
-            return Dictionary._look_up(node.right_son, key)
+        return None
 
     def look_up(self, key):
         return self._look_up(self._root, key)
@@ -102,23 +404,383 @@ class Dictionary(object):
     def __getitem__(self, key):
         return self.look_up(key)
 
+    def _reads_mutate(self):
+        """ Whether any read (a lookup, an iteration, a range or an order statistic query)
+            may write into the dictionary or its nodes, e.g. to restructure the tree, to push
+            pending updates down or to count the accesses. Such reads cannot run concurrently
+            with other accesses, and ConcurrentDictionary makes them hold its lock alone, so
+            every tree, node type or option whose reads write anything must return True.
+        """
+        return False
+
+    def _descents_mutate(self):
+        """ Whether the plain descents of Dictionary._look_up write into the nodes, when the
+            reads mutate the dictionary. Otherwise, ConcurrentDictionary answers the lookups
+            with such descents while sharing its lock, see its pure_reads.
+        """
+        return False
+
+    def __contains__(self, key):
+        return Dictionary._find(self._root, key)[0] is not None
+
+    # Batches this small are cheaper to finish with plain descents than to keep splitting
+    _SMALL_BATCH = 8
+
+    @staticmethod
+    def _find_many(node, keys):
+        """ Finds the nodes of many keys in a single ordered traversal.
+            The keys are sorted once, then every node splits its batch among its sons,
+            so the common prefixes of the search paths are walked only once.
+            Complexity: O(k log n) for k keys, visiting every node at most once
+        :return: The nodes holding the keys (None for the missing ones), in the order of keys.
+        """
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        sorted_keys = [keys[index] for index in order]
+        nodes = [None] * len(keys)
+
+        stack = [(node, 0, len(sorted_keys))] if node is not None and keys else []
+        while stack:
+            node, low, high = stack.pop()
+
+            if high - low <= Dictionary._SMALL_BATCH:
+                for index in range(low, high):
+                    key = sorted_keys[index]
+                    current = node
+                    while current is not None:
+                        if key == current.key:
+                            nodes[order[index]] = current
+                            break
+                        current = current.left_son if key < current.key else current.right_son
+                continue
+
+            first_equal = bisect.bisect_left(sorted_keys, node.key, low, high)
+            first_higher = first_equal
+            while first_higher < high and sorted_keys[first_higher] == node.key:
+                nodes[order[first_higher]] = node
+                first_higher += 1
+
+            if low < first_equal and node.left_son is not None:
+                stack.append((node.left_son, low, first_equal))
+            if first_higher < high and node.right_son is not None:
+                stack.append((node.right_son, first_higher, high))
+
+        return nodes
+
+    def look_up_many(self, keys):
+        """ Looks up a batch of keys together, see _find_many.
+        :return: The values of the keys (None for the missing ones), in the order of keys.
+        """
+        return [node.value if node is not None else None
+                for node in self._find_many(self._root, list(keys))]
+
+    def contains_many(self, keys):
+        """ Checks a batch of keys together, see _find_many.
+        :return: Whether each key is in the dictionary, in the order of keys.
+        """
+        return [node is not None for node in self._find_many(self._root, list(keys))]
+
+    # Cursors
+    def lower_bound(self, key):
+        """ Returns a cursor on the lowest key greater than or equal to key.
+            Complexity: O(log n) on balanced trees
+        :return: A Cursor, which is not valid if all the keys are lower than key.
+        """
+        cursor = Cursor(self)
+        cursor.seek(key)
+        return cursor
+
+    def _assign_value(self, path, value):
+        """ Changes the value of the last node on a path from the root, see Cursor.value.
+        """
+        self._version += 1
+        path[-1].value = value
+
+    def find_cursor(self, key):
+        """ Returns a cursor on the given key, or None if the key is missing.
+            Complexity: O(log n) on balanced trees
+        """
+        cursor = self.lower_bound(key)
+        if cursor.valid and cursor.key == key:
+            return cursor
+        return None
+
     @staticmethod
     def _find(node, key, parent=None):
-        if node is None:
-            return None, parent
+        """ Searches the subtree rooted in node for the given key.
+        :return: The node holding the key (or None) and the last node visited above it.
+        """
+        while node is not None:
+            if key == node.key:
+                return node, parent
+            parent = node
+            node = node.left_son if key < node.key else node.right_son
 
-        if key == node.key:
-            return node, parent
-        if key < node.key:
-            return Dictionary._find(node.left_son, key, parent)
-        else:
-            return Dictionary._find(node.right_son, key, parent)
+        return None, parent
 
     @staticmethod
     def _get_left_most(node):
         if node is None:
             return None
 
-        if node.left_son is None:
-            return node
-        return Dictionary._get_left_most(node.left_son)
\ No newline at end of file
+        while node.left_son is not None:
+            node = node.left_son
+        return node
+
+    @staticmethod
+    def _get_right_most(node):
+        if node is None:
+            return None
+
+        while node.right_son is not None:
+            node = node.right_son
+        return node
+
+
+class OrderStatistics(object):
+    """ The order statistic queries, sampling and range counts of the trees keeping
+    weight_of_subtree in their nodes, mixed into their Dictionary subclasses. The
+    trees without subtree weights (e.g. BPlusTree) do not offer them.
+    """
+
+    @staticmethod
+    def _count_lower(node, key, inclusive):
+        """ Counts the keys lower than key (or equal to it, if inclusive) in the subtree of node.
+            Complexity: O(log n) on balanced trees
+        """
+        count = 0
+        while node is not None:
+            if node.key < key or (inclusive and node.key == key):
+                count += 1 + (node.left_son.weight_of_subtree if node.left_son is not None else 0)
+                node = node.right_son
+            else:
+                node = node.left_son
+
+        return count
+
+    @staticmethod
+    def _get_kth_node(node, k):
+        if node is None or not 0 <= k < node.weight_of_subtree:
+            return None
+
+        while True:
+            left_son_weight = node.left_son.weight_of_subtree if node.left_son is not None else 0
+            if k == left_son_weight:
+                return node
+            if k < left_son_weight:
+                node = node.left_son
+            else:
+                k -= left_son_weight + 1
+                node = node.right_son
+
+    def rank(self, key):
+        """ Returns the number of keys lower than key.
+            Complexity: O(log n) on balanced trees
+        """
+        return OrderStatistics._count_lower(self._root, key, False)
+
+    def get_kth_element(self, k):
+        """ Returns the (key, value) pair with the k-th lowest key, counting from 0.
+            Complexity: O(log n) on balanced trees
+        :return: The pair, or None if k is out of range.
+        """
+        node = OrderStatistics._get_kth_node(self._root, k)
+        return (node.key, node.value) if node is not None else None
+
+    def select(self, k):
+        """ Returns the k-th lowest key, counting from 0, or None if k is out of range.
+            Complexity: O(log n) on balanced trees
+        """
+        node = OrderStatistics._get_kth_node(self._root, k)
+        return node.key if node is not None else None
+
+    def get_kth_elements(self, ranks):
+        """ Resolves many k-th element queries in a single ordered traversal.
+            The ranks are sorted once, then every node splits its batch among its sons.
+            Complexity: O(k log n) for k ranks, visiting every node at most once
+        :param ranks: The ranks (counting from 0) to look up.
+        :return: The (key, value) pairs, in the order of ranks; None for out of range ranks.
+        """
+        order = sorted(range(len(ranks)), key=ranks.__getitem__)
+        sorted_ranks = [ranks[index] for index in order]
+        results = [None] * len(ranks)
+
+        # each entry holds a subtree, its batch of sorted ranks and the rank of its lowest key
+        stack = [(self._root, 0, len(sorted_ranks), 0)]
+        while stack:
+            node, low, high, offset = stack.pop()
+            if node is None or low >= high:
+                continue
+
+            node_rank = offset + (node.left_son.weight_of_subtree if node.left_son is not None else 0)
+            first_equal = bisect.bisect_left(sorted_ranks, node_rank, low, high)
+            first_higher = bisect.bisect_right(sorted_ranks, node_rank, first_equal, high)
+            for index in range(first_equal, first_higher):
+                results[order[index]] = node.key, node.value
+
+            stack.append((node.left_son, low, first_equal, offset))
+            stack.append((node.right_son, first_higher, high, node_rank + 1))
+
+        return results
+
+    # Sampling
+    def choose_element(self):
+        """ Returns a uniformly random (key, value) pair, or None if the dictionary is empty.
+            Complexity: O(log n) on balanced trees
+        """
+        size = self.size()
+        if size == 0:
+            return None
+        return self.get_kth_element(random.randrange(size))
+
+    def sample(self, k, replace=False):
+        """ Returns k uniformly random (key, value) pairs, in the order they were drawn.
+            The ranks are drawn first and then resolved together by get_kth_elements.
+            Complexity: O(k log n)
+        :param k: The number of pairs.
+        :param replace: Whether a pair may be drawn several times.
+        """
+        size = self.size()
+        if replace:
+            if size == 0 and k > 0:
+                raise ValueError("Cannot sample from an empty dictionary.")
+            ranks = [random.randrange(size) for _ in range(k)]
+        else:
+            if not 0 <= k <= size:
+                raise ValueError("Sample larger than the dictionary or negative.")
+            ranks = random.sample(range(size), k)
+
+        return self.get_kth_elements(ranks)
+
+    def count_range(self, low=None, high=None, inclusive=(True, True)):
+        """ Counts the keys lying between low and high, with the bounds of irange.
+            Complexity: O(log n) on balanced trees
+        """
+        if self._root is None:
+            return 0
+
+        include_low, include_high = inclusive
+        count_high = (self._root.weight_of_subtree if high is None else
+                      OrderStatistics._count_lower(self._root, high, include_high))
+        count_low = 0 if low is None else OrderStatistics._count_lower(self._root, low, not include_low)
+        return max(count_high - count_low, 0)
+
+
+class Cursor(object):
+    """ A position in a Dictionary, which can step to the neighbouring keys.
+
+    The cursor keeps the path from the root to its node, so it also works on
+    trees without parent pointers. Any insertion or erasure in the tree (and
+    any splaying) invalidates it; updating the value through the cursor does not.
+    """
+
+    __slots__ = ('_tree', '_path')
+
+    def __init__(self, tree):
+        self._tree = tree
+        self._path = []
+
+    @property
+    def valid(self):
+        """ Whether the cursor points to an entry, i.e. it has not moved past either end.
+        """
+        return bool(self._path)
+
+    def _node(self):
+        if not self._path:
+            raise IndexError("The cursor does not point to any entry.")
+        return self._path[-1]
+
+    @property
+    def key(self):
+        return self._node().key
+
+    @property
+    def value(self):
+        return self._node().value
+
+    @value.setter
+    def value(self, value):
+        self._node()
+        self._tree._assign_value(self._path, value)
+
+    def next(self):
+        """ Moves to the successor of the current key.
+            Complexity: O(1) amortized
+        :return: Whether the cursor is still valid.
+        """
+        path = self._path
+        if not path:
+            return False
+
+        node = path[-1]
+        if node.right_son is not None:
+            node = node.right_son
+            while node is not None:
+                path.append(node)
+                node = node.left_son
+            return True
+
+        path.pop()
+        while path and path[-1].right_son is node:
+            node = path.pop()
+        return bool(path)
+
+    def prev(self):
+        """ Moves to the predecessor of the current key.
+            Complexity: O(1) amortized
+        :return: Whether the cursor is still valid.
+        """
+        path = self._path
+        if not path:
+            return False
+
+        node = path[-1]
+        if node.left_son is not None:
+            node = node.left_son
+            while node is not None:
+                path.append(node)
+                node = node.right_son
+            return True
+
+        path.pop()
+        while path and path[-1].left_son is node:
+            node = path.pop()
+        return bool(path)
+
+    def _descend(self, node, key):
+        path = self._path
+        while node is not None:
+            path.append(node)
+            if key == node.key:
+                return
+            node = node.left_son if key < node.key else node.right_son
+
+        # the last node is the lower bound, unless the search stopped at its right
+        if path and path[-1].key < key:
+            self.next()
+
+    def seek(self, key):
+        """ Moves to the lowest key greater than or equal to key (finger search).
+            Instead of starting from the root, the search only climbs from the
+            current node up to the smallest subtree which may hold the key.
+            Complexity: O(log d) typically, d being the distance between the two keys
+        :return: Whether the cursor is valid, i.e. such a key exists.
+        """
+        path = self._path
+        if not path:
+            self._descend(self._tree.get_root(), key)
+            return bool(path)
+
+        if key == path[-1].key:
+            return True
+        if path[-1].key < key:
+            # climb until the subtree is bounded above by a key higher than key
+            while len(path) > 1 and not (path[-2].left_son is path[-1] and key < path[-2].key):
+                path.pop()
+        else:
+            # climb until the subtree is bounded below by a key lower than key
+            while len(path) > 1 and not (path[-2].right_son is path[-1] and path[-2].key < key):
+                path.pop()
+
+        self._descend(path.pop(), key)
+        return bool(path)
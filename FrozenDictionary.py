@@ -0,0 +1,278 @@
+#!/usr/bin/python3
+
+""" Read-only views of dictionaries in NumPy arrays, answering batches of queries
+with vectorized binary searches. NumPy is an optional dependency: without it,
+freeze() raises ImportError and nothing else is affected.
+"""
+
+from RBTree import RBTree
+from Treap import Treap
+from SplayTree import SplayTree
+
+import unittest
+import random
+import string
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FrozenDictionary(object):
+    """ The keys and the values of a dictionary, materialised in arrays sorted by keys.
+
+    A column holding only ints (fitting in 64 bits) or only floats becomes an int64
+    or a float64 array, the other ones object arrays. A batch of keys is then found
+    with a single numpy.searchsorted call instead of one descent per key, the object
+    arrays being searched with the Python comparisons of their elements.
+
+    The view remembers the version of the dictionary it was built from, and every
+    query rebuilds the arrays first if the dictionary has been updated since.
+    """
+
+    # From this many numeric keys, a batch is searched in increasing order, so that
+    # the consecutive binary searches walk through the same cached parts of the keys
+    _SORTED_SEARCH = 1 << 12
+
+    def __init__(self, dictionary):
+        if numpy is None:
+            raise ImportError("Freezing a dictionary requires NumPy.")
+
+        self._dictionary = dictionary
+        self._version = None
+        self._refresh()
+
+    @staticmethod
+    def _column(elements):
+        """ Returns the array of a list of elements, see the numeric columns of Snapshot.
+        """
+        dtype = None
+        if elements and all(type(element) is int for element in elements):
+            dtype = numpy.int64
+        elif elements and all(type(element) is float for element in elements):
+            dtype = numpy.float64
+
+        if dtype is not None:
+            try:
+                return numpy.array(elements, dtype=dtype)
+            except OverflowError:
+                pass
+        return numpy.fromiter(elements, dtype=object, count=len(elements))
+
+    def _refresh(self):
+        """ Rebuilds the arrays if the dictionary has been updated since they were built.
+            Complexity: O(1), O(n) for a rebuild
+        """
+        version = self._dictionary._version
+        if version == self._version:
+            return
+
+        items = self._dictionary.items()
+        self._keys = FrozenDictionary._column([key for key, _ in items])
+        self._values = FrozenDictionary._column([value for _, value in items])
+        self._version = version
+
+    def _probes(self, keys):
+        """ Returns the searched keys as an array comparable with the keys of the view.
+        """
+        if isinstance(keys, numpy.ndarray) and (keys.dtype == object) == (self._keys.dtype == object):
+            return keys
+        return FrozenDictionary._column(list(keys))
+
+    def _find(self, probes):
+        """ Returns the positions of the searched keys, clipped to the arrays, and whether they were found.
+        """
+        keys = self._keys
+        if len(keys) == 0:
+            return numpy.zeros(len(probes), dtype=numpy.intp), numpy.zeros(len(probes), dtype=bool)
+
+        if keys.dtype != object and len(probes) >= self._SORTED_SEARCH:
+            order = numpy.argsort(probes)
+            indices = numpy.empty(len(probes), dtype=numpy.intp)
+            indices[order] = numpy.searchsorted(keys, probes[order])
+        else:
+            indices = numpy.searchsorted(keys, probes)
+        indices = numpy.minimum(indices, len(keys) - 1)
+        return indices, numpy.asarray(keys[indices] == probes, dtype=bool)
+
+    def __len__(self):
+        self._refresh()
+        return len(self._keys)
+
+    def keys(self):
+        """ Returns the array of the keys, in increasing order.
+        """
+        self._refresh()
+        return self._keys
+
+    def values(self):
+        """ Returns the array of the values, in the order of their keys.
+        """
+        self._refresh()
+        return self._values
+
+    def look_up_many(self, keys, default=None):
+        """ Looks up a batch of keys.
+            Complexity: O(m log n)
+        :param keys: An iterable or an array of keys.
+        :param default: The value of the missing keys. The values stay in a numeric array if the default
+                        fits in the same type (e.g. an int for int values); otherwise, e.g. with None or a
+                        string, the result becomes an object array as soon as a key is missing, rather
+                        than coercing the values and the default to a common type.
+        :return: The array of the values.
+        """
+        self._refresh()
+        probes = self._probes(keys)
+        indices, found = self._find(probes)
+        values = self._values
+
+        if len(values) and found.all():
+            return values[indices]
+        default_column = FrozenDictionary._column([default])
+        if default_column.dtype != object and len(values) == 0:
+            return numpy.full(len(probes), default_column[0])
+        if default_column.dtype != object and default_column.dtype == values.dtype:
+            return numpy.where(found, values[indices], default_column[0])
+
+        values = values[indices].astype(object) if len(values) else numpy.empty(len(probes), dtype=object)
+        for index in numpy.flatnonzero(~found):
+            values[index] = default
+        return values
+
+    def contains_many(self, keys):
+        """ Returns the boolean array telling which of a batch of keys are in the dictionary.
+            Complexity: O(m log n)
+        """
+        self._refresh()
+        return self._find(self._probes(keys))[1]
+
+    def _search(self, bound, side):
+        if isinstance(bound, numpy.ndarray):
+            return numpy.searchsorted(self._keys, self._probes(bound), side)
+        # a single key, which must not be taken for a sequence of keys (e.g. a tuple)
+        return int(numpy.searchsorted(self._keys, FrozenDictionary._column([bound]), side)[0])
+
+    def _bounds(self, low, high, inclusive):
+        """ Returns the start and the stop positions of the keys between low and high (None meaning unbounded).
+        """
+        include_low, include_high = inclusive
+        start = 0 if low is None else self._search(low, 'left' if include_low else 'right')
+        stop = len(self._keys) if high is None else self._search(high, 'right' if include_high else 'left')
+        if isinstance(start, int) and isinstance(stop, int):
+            return start, max(start, stop)
+        return start, numpy.maximum(start, stop)
+
+    def count_range(self, low=None, high=None, inclusive=(True, True)):
+        """ Counts the keys between low and high (None meaning unbounded).
+            Complexity: O(log n), O(m log n) for m ranges
+        :param low: A key, or an array of m lower bounds.
+        :param high: A key, or an array of m upper bounds.
+        :return: The count, or the array of the m counts if a bound is an array.
+        """
+        self._refresh()
+        start, stop = self._bounds(low, high, inclusive)
+        return stop - start
+
+    def range_slice(self, low=None, high=None, inclusive=(True, True)):
+        """ Returns the arrays of the keys and of the values between low and high (None meaning unbounded).
+            They are views sharing the memory of the frozen arrays, which must not be modified.
+            Complexity: O(log n)
+        """
+        self._refresh()
+        start, stop = self._bounds(low, high, inclusive)
+        return self._keys[start:stop], self._values[start:stop]
+
+
+########################## Testing
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed.")
+class TestFrozenDictionaryOperations(unittest.TestCase):
+
+    def test_queries(self):
+
+        tree = RBTree.from_sorted([(key, key / 2) for key in range(0, 20000, 2)])
+        frozen = tree.freeze()
+
+        probes = numpy.arange(-10, 20010)
+        self.assertEqual(frozen.look_up_many(probes).tolist(), tree.look_up_many(probes.tolist()))
+        self.assertEqual(frozen.look_up_many(probes, default=-1.0).dtype, numpy.float64)
+        self.assertEqual(frozen.look_up_many([2, 3], default='x').tolist(), [1.0, 'x'])
+        self.assertEqual(frozen.look_up_many([2, 3], default=-1).tolist(), [1.0, -1])
+        self.assertEqual(frozen.contains_many(probes).tolist(), tree.contains_many(probes.tolist()))
+
+        lows, highs = numpy.sort(numpy.random.randint(-100, 20100, (2, 1000)), axis=0)
+        self.assertEqual(frozen.count_range(lows, highs, (False, True)).tolist(),
+                         [tree.count_range(low, high, (False, True)) for low, high in zip(lows.tolist(), highs.tolist())])
+        self.assertEqual(frozen.count_range(high=101), 51)
+        keys, values = frozen.range_slice(100, 200, (True, False))
+        self.assertEqual(list(zip(keys.tolist(), values.tolist())), list(tree.irange(100, 200, (True, False))))
+
+        # the view follows the updates of the tree
+        tree.insert(1, 'a')
+        tree.erase(2)
+        tree.find_cursor(4).value = 'b'
+        self.assertEqual(frozen.look_up_many([1, 2, 4, 6]).tolist(), ['a', None, 'b', 3.0])
+        self.assertEqual(len(frozen), tree.size())
+
+        # int values with an int default, or a default they must not be coerced to
+        frozen = RBTree.from_sorted([(1, 10), (2, 20)]).freeze()
+        self.assertEqual(frozen.look_up_many([1, 100], default=0).dtype, numpy.int64)
+        self.assertEqual(frozen.look_up_many([1, 100], default='x').tolist(), [10, 'x'])
+        self.assertEqual(frozen.look_up_many([1, 100], default=(0, 0)).tolist(), [10, (0, 0)])
+
+    def test_empty_dictionary(self):
+
+        frozen = RBTree().freeze()
+        self.assertEqual(len(frozen), 0)
+        self.assertEqual(frozen.look_up_many([1, 2]).tolist(), [None, None])
+        self.assertEqual(frozen.look_up_many([1], default=3).tolist(), [3])
+        self.assertEqual(frozen.contains_many([1]).tolist(), [False])
+        self.assertEqual(frozen.count_range(0, 10), 0)
+        self.assertEqual(frozen.count_range(numpy.array([0, 5]), numpy.array([1, 10])).tolist(), [0, 0])
+        self.assertEqual([column.tolist() for column in frozen.range_slice()], [[], []])
+
+    def test_non_numeric_keys(self):
+
+        words = sorted(set(''.join(random.choice(string.ascii_lowercase) for _ in range(5)) for _ in range(2000)))
+        tree = Treap.from_sorted((word, len(word)) for word in words)
+        frozen = tree.freeze()
+        self.assertEqual(frozen.keys().dtype, object)
+
+        probes = random.sample(words, 100) + ['', 'zzzzzz', 'm']
+        self.assertEqual(frozen.look_up_many(probes).tolist(), tree.look_up_many(probes))
+        self.assertEqual(frozen.contains_many(probes).tolist(), tree.contains_many(probes))
+        self.assertEqual(frozen.count_range('c', 'f', (True, False)), tree.count_range('c', 'f', (True, False)))
+        keys, values = frozen.range_slice('m', 'n')
+        self.assertEqual(list(zip(keys.tolist(), values.tolist())), list(tree.irange('m', 'n')))
+
+        # a tuple is a single key, not a sequence of keys
+        frozen = SplayTree.from_sorted([((key // 10, key % 10), key) for key in range(100)]).freeze()
+        self.assertEqual(frozen.look_up_many([(3, 4), (3, 10)]).tolist(), [34, None])
+        self.assertEqual(frozen.count_range((2, 5), (3, 0)), 6)
+        self.assertEqual(frozen.range_slice(low=(9, 8))[1].tolist(), [98, 99])
+
+    def test_invalidation(self):
+
+        for tree_type in (Treap, SplayTree, RBTree):
+            tree = tree_type.from_sorted((key, key) for key in range(100))
+            frozen = tree.freeze()
+            self.assertEqual(len(frozen), 100)
+
+            tree.insert_many((key, -key) for key in range(50, 150))
+            self.assertEqual(frozen.look_up_many([0, 50, 149]).tolist(), [0, -50, -149])
+            self.assertEqual(len(frozen), 150)
+            tree.erase_many(range(0, 150, 2))
+            self.assertEqual(frozen.count_range(), 75)
+
+            if tree_type is RBTree:
+                continue
+            # the split and the join leave their operands empty
+            lower, higher = tree.split(99)
+            self.assertEqual(len(frozen), 0)
+            frozen_lower, frozen_higher = lower.freeze(), higher.freeze()
+            self.assertEqual((len(frozen_lower), len(frozen_higher)), (50, 25))
+            joined = lower.join(higher)
+            self.assertEqual((len(frozen_lower), len(frozen_higher)), (0, 0))
+            self.assertEqual(joined.freeze().keys().tolist(), list(range(1, 150, 2)))
@@ -0,0 +1,363 @@
+#!/usr/bin/python3
+
+""" Opt-in instrumentation of the trees.
+
+enable() replaces the operations of the tree classes, and the rotations and
+rebalancing steps they call, by wrappers which count what the operations do
+and time them; disable() puts the original methods back, so the trees do not
+pay anything while the instrumentation is off.
+
+Every outermost operation (the operations it calls itself are counted as part
+of it) produces an event with:
+    comparisons     the comparisons made with the searched key
+    nodes_visited   the keys it was compared with, consecutive comparisons with the same key counting once
+    rotations       the rotations of nodes
+    fixups          the number of calls of every rebalancing step, e.g. {"RBTree._checkCase4": 2}
+    seconds         its latency
+
+The comparisons and the visited nodes are only counted by the operations which
+search a key without storing it (look_up, __contains__, erase and rank), whose
+key gets wrapped in a counting proxy. The other operations (the insertions, the
+bulk and range operations...) report None for them rather than 0, since they do
+compare keys but are not measured.
+
+stats() aggregates the events by structure and operation, with a histogram of
+the latencies in power of two buckets of nanoseconds, and the callback given to
+enable() receives every event, e.g. to log the slowest ones.
+"""
+
+from Dictionary import Dictionary, OrderStatistics
+from RBTree import RBTree, RBNode
+from SplayTree import SplayTree, SplayNode
+from Treap import Treap, _TreapNode
+from PersistentTreap import PersistentTreap
+from ArrayRBTree import ArrayRBTree
+from BPlusTree import BPlusTree
+
+import functools
+import threading
+import time
+import unittest
+import random
+
+
+_STRUCTURES = (Dictionary, OrderStatistics, RBTree, SplayTree, Treap, PersistentTreap, ArrayRBTree, BPlusTree)
+
+_OPERATIONS = ("insert", "erase", "look_up", "__contains__", "insert_many", "erase_many",
+               "look_up_many", "contains_many", "rank", "get_kth_element", "count_range",
+               "split", "join", "union", "intersection", "difference",
+               "range_aggregate", "range_add", "range_assign")
+
+_PROBING_OPERATIONS = frozenset(("look_up", "__contains__", "erase", "rank"))
+
+_ROTATIONS = ((RBNode, "rotate_right"), (RBNode, "rotate_left"),
+              (SplayNode, "rotate_right"), (SplayNode, "rotate_left"),
+              (_TreapNode, "rotate_right"), (_TreapNode, "rotate_left"),
+              (ArrayRBTree, "_rotate_right"), (ArrayRBTree, "_rotate_left"))
+
+_FIXUPS = tuple((RBTree, "_checkCase{}".format(case)) for case in range(1, 6)) + (
+    (SplayTree, "splay"), (SplayTree, "semi_splay"),
+    (ArrayRBTree, "_insert_fixup"), (ArrayRBTree, "_erase_fixup"))
+
+# The upper bound of the last latency bucket is 2 ** (_BUCKETS - 1) nanoseconds
+_BUCKETS = 64
+
+_lock = threading.Lock()
+_local = threading.local()
+# The (class, name, function) triples replaced by enable()
+_originals = []
+_callback = None
+_records = {}
+
+
+class _Event(object):
+
+    __slots__ = ('structure', 'operation', 'comparisons', 'nodes_visited', 'rotations', 'fixups',
+                 'nanoseconds', 'last_key')
+
+    def __init__(self, structure, operation, probing):
+        self.structure = structure
+        self.operation = operation
+        # None when the comparisons are not counted
+        self.comparisons = self.nodes_visited = 0 if probing else None
+        self.rotations = self.nanoseconds = 0
+        self.fixups = {}
+        self.last_key = None
+
+    def as_dict(self):
+        return {"structure": self.structure, "operation": self.operation,
+                "comparisons": self.comparisons, "nodes_visited": self.nodes_visited,
+                "rotations": self.rotations, "fixups": dict(self.fixups),
+                "seconds": self.nanoseconds / 1e9}
+
+
+class _CountingKey(object):
+    """ Stands for the searched key, counting the comparisons made with it.
+    """
+
+    __slots__ = ('key', 'event')
+
+    def __init__(self, key, event):
+        self.key = key
+        self.event = event
+
+    def _count(self, other):
+        event = self.event
+        event.comparisons += 1
+        if other is not event.last_key:
+            event.last_key = other
+            event.nodes_visited += 1
+
+    def __eq__(self, other):
+        self._count(other)
+        return self.key == other
+
+    def __ne__(self, other):
+        self._count(other)
+        return self.key != other
+
+    def __lt__(self, other):
+        self._count(other)
+        return self.key < other
+
+    def __le__(self, other):
+        self._count(other)
+        return self.key <= other
+
+    def __gt__(self, other):
+        self._count(other)
+        return self.key > other
+
+    def __ge__(self, other):
+        self._count(other)
+        return self.key >= other
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+class _Record(object):
+    """ The aggregated events of an operation of a structure.
+    """
+
+    __slots__ = ('count', 'comparisons', 'nodes_visited', 'rotations', 'fixups', 'nanoseconds',
+                 'max_nanoseconds', 'histogram')
+
+    def __init__(self):
+        self.count = self.rotations = 0
+        # None until an event counts the comparisons
+        self.comparisons = self.nodes_visited = None
+        self.nanoseconds = self.max_nanoseconds = 0
+        self.fixups = {}
+        # histogram[b] counts the latencies of [2 ** (b - 1), 2 ** b) nanoseconds
+        self.histogram = [0] * _BUCKETS
+
+    def add(self, event):
+        self.count += 1
+        if event.comparisons is not None:
+            self.comparisons = (self.comparisons or 0) + event.comparisons
+            self.nodes_visited = (self.nodes_visited or 0) + event.nodes_visited
+        self.rotations += event.rotations
+        for name, calls in event.fixups.items():
+            self.fixups[name] = self.fixups.get(name, 0) + calls
+        self.nanoseconds += event.nanoseconds
+        self.max_nanoseconds = max(self.max_nanoseconds, event.nanoseconds)
+        self.histogram[min(event.nanoseconds.bit_length(), _BUCKETS - 1)] += 1
+
+    def _percentile(self, fraction):
+        """ Returns the upper bound of the bucket holding the given fraction of the latencies.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return 2 ** bucket / 1e9
+        return 0.0
+
+    def snapshot(self):
+        return {"count": self.count, "comparisons": self.comparisons, "nodes_visited": self.nodes_visited,
+                "rotations": self.rotations, "fixups": dict(self.fixups),
+                "total_seconds": self.nanoseconds / 1e9, "max_seconds": self.max_nanoseconds / 1e9,
+                "p50_seconds": self._percentile(0.5), "p99_seconds": self._percentile(0.99),
+                "histogram": dict((2 ** bucket, count) for bucket, count in enumerate(self.histogram) if count)}
+
+
+def _record(event):
+    with _lock:
+        record = _records.get((event.structure, event.operation))
+        if record is None:
+            record = _records[(event.structure, event.operation)] = _Record()
+        record.add(event)
+
+    callback = _callback
+    if callback is not None:
+        callback(event.as_dict())
+
+
+# Wrappers
+def _wrap_operation(function, operation):
+    probing = operation in _PROBING_OPERATIONS
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        if getattr(_local, 'event', None) is not None:
+            # called by another operation, which is being measured
+            return function(self, *args, **kwargs)
+
+        event = _Event(type(self).__name__, operation, probing and bool(args))
+        if event.comparisons is not None:
+            args = (_CountingKey(args[0], event),) + args[1:]
+
+        _local.event = event
+        start = time.perf_counter_ns()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            event.nanoseconds = time.perf_counter_ns() - start
+            _local.event = None
+            _record(event)
+
+    return wrapper
+
+
+def _wrap_rotation(function):
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        event = getattr(_local, 'event', None)
+        if event is not None:
+            event.rotations += 1
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+def _wrap_fixup(function, name):
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        event = getattr(_local, 'event', None)
+        if event is not None:
+            event.fixups[name] = event.fixups.get(name, 0) + 1
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+def _replace(cls, name, wrapper):
+    function = cls.__dict__[name]
+    _originals.append((cls, name, function))
+    setattr(cls, name, wrapper)
+
+
+# Public interface
+def enable(callback=None):
+    """ Starts instrumenting all the trees, replacing the callback if it is already enabled.
+    :param callback: Called with the dict of every event, in the thread of its operation.
+    """
+    global _callback
+    _callback = callback
+    if _originals:
+        return
+
+    for cls in _STRUCTURES:
+        for operation in _OPERATIONS:
+            if callable(cls.__dict__.get(operation)):
+                _replace(cls, operation, _wrap_operation(cls.__dict__[operation], operation))
+    for cls, name in _ROTATIONS:
+        _replace(cls, name, _wrap_rotation(cls.__dict__[name]))
+    for cls, name in _FIXUPS:
+        _replace(cls, name, _wrap_fixup(cls.__dict__[name], "{}.{}".format(cls.__name__, name)))
+
+
+def disable():
+    """ Restores the original methods, keeping the statistics gathered so far.
+    """
+    global _callback
+    _callback = None
+    while _originals:
+        cls, name, function = _originals.pop()
+        setattr(cls, name, function)
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def reset():
+    with _lock:
+        _records.clear()
+
+
+def stats():
+    """ Returns a snapshot of the aggregated events, by "Structure.operation".
+        Every entry holds the totals of the event counters, the total, maximum,
+        median and 99th percentile latencies in seconds (the percentiles being
+        bucket upper bounds), and the histogram of the latencies as a dict from
+        bucket upper bounds in nanoseconds to counts.
+    """
+    with _lock:
+        return dict(("{}.{}".format(*key), record.snapshot()) for key, record in _records.items())
+
+
+########################## Testing
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        reset()
+        self.events = []
+        enable(self.events.append)
+
+    def tearDown(self):
+        disable()
+        reset()
+
+    def test_counters(self):
+
+        keys = random.sample(range(1000000), 2000)
+        rbtree, treap, splay_tree = RBTree(), Treap(), SplayTree()
+        for key in keys:
+            rbtree.insert(key, key)
+            treap.insert(key, key)
+            splay_tree.insert(key, key)
+        for key in keys[:500]:
+            self.assertEqual(rbtree.look_up(key), key)
+            self.assertEqual(splay_tree[key], key)
+        rbtree.insert_many((key, None) for key in range(-10, 0))
+        for key in keys[:100]:
+            treap.erase(key)
+
+        statistics = stats()
+        self.assertEqual(statistics["RBTree.insert"]["count"], len(keys))
+        self.assertEqual(statistics["RBTree.insert_many"]["count"], 1)
+        self.assertGreater(statistics["RBTree.insert"]["rotations"], 0)
+        self.assertIn("RBTree._checkCase4", statistics["RBTree.insert"]["fixups"])
+        self.assertGreater(statistics["Treap.insert"]["rotations"], 0)
+        self.assertEqual(statistics["SplayTree.look_up"]["fixups"]["SplayTree.splay"], 500)
+
+        look_ups = statistics["RBTree.look_up"]
+        self.assertGreaterEqual(look_ups["comparisons"], look_ups["nodes_visited"])
+        self.assertLessEqual(look_ups["nodes_visited"], 500 * (rbtree.get_height() + 1))
+        self.assertGreater(statistics["Treap.erase"]["nodes_visited"], 100)
+        # the operations which do not count their comparisons do not pass for free
+        self.assertIsNone(statistics["RBTree.insert"]["comparisons"])
+        self.assertIsNone(statistics["RBTree.insert_many"]["nodes_visited"])
+        self.assertTrue(all(event["comparisons"] is None for event in self.events if event["operation"] == "insert"))
+
+        self.assertEqual(sum(record["count"] for record in statistics.values()), len(self.events))
+        self.assertEqual(sum(look_ups["histogram"].values()), 500)
+        self.assertLessEqual(look_ups["p50_seconds"], look_ups["p99_seconds"])
+        self.assertEqual(treap.keys(), sorted(keys[100:]))
+        self.assertTrue(all(type(key) is int for key in treap.keys()))
+
+        disable()
+        self.assertFalse(hasattr(RBTree.insert, '__wrapped__') or hasattr(RBNode.rotate_left, '__wrapped__'))
+        rbtree.insert(-100)
+        self.assertEqual(stats()["RBTree.insert"]["count"], len(keys))
+
+
+if __name__ == "__main__":
+    unittest.main()
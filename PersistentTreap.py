@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+
+from Dictionary import Dictionary, OrderStatistics
+from Treap import Treap, _TreapNode
+
+import unittest
+import string
+import random
+import threading
+
+
+class PersistentTreap(Dictionary, OrderStatistics):
+    """ A treap whose nodes are never modified once they are built.
+
+    An update copies only the nodes on the path it walks (O(log n) of them) and
+    shares all the other subtrees with the previous version. The previous root
+    stays a complete, consistent tree, so snapshot() costs O(1) and readers of
+    a snapshot never see the updates made after it, nor need any locking.
+    """
+
+    def __init__(self, root=None):
+        self._root = root
+
+    def get_root(self):
+        return self._root
+
+    # Support insertion
+    @staticmethod
+    def _insert(node, key, value, priority):
+
+        if node is None:
+            return _TreapNode(key, value, priority=priority)
+
+        if key == node.key:
+            return _TreapNode(key, value, node.left_son, node.right_son, node.priority)
+
+        if key < node.key:
+            left_son = PersistentTreap._insert(node.left_son, key, value, priority)
+            if left_son.priority > node.priority:
+                # rotate right, copying the demoted node
+                demoted_node = _TreapNode(node.key, node.value, left_son.right_son, node.right_son, node.priority)
+                return _TreapNode(left_son.key, left_son.value, left_son.left_son, demoted_node, left_son.priority)
+            return _TreapNode(node.key, node.value, left_son, node.right_son, node.priority)
+        else:
+            right_son = PersistentTreap._insert(node.right_son, key, value, priority)
+            if right_son.priority > node.priority:
+                # rotate left, copying the demoted node
+                demoted_node = _TreapNode(node.key, node.value, node.left_son, right_son.left_son, node.priority)
+                return _TreapNode(right_son.key, right_son.value, demoted_node, right_son.right_son, right_son.priority)
+            return _TreapNode(node.key, node.value, node.left_son, right_son, node.priority)
+
+    def inserted(self, key, value=None, priority=None):
+        """ Returns the version with the key inserted, leaving the current one unchanged.
+            Complexity: O(log n)
+        """
+        return PersistentTreap(PersistentTreap._insert(self._root, key, value, priority))
+
+    def insert(self, key, value=None, priority=None):
+        self._version += 1
+        self._root = PersistentTreap._insert(self._root, key, value, priority)
+
+    # Support erasing
+    @staticmethod
+    def _merge(lower, higher):
+        if lower is None:
+            return higher
+        if higher is None:
+            return lower
+
+        if lower.priority >= higher.priority:
+            return _TreapNode(lower.key, lower.value, lower.left_son,
+                              PersistentTreap._merge(lower.right_son, higher), lower.priority)
+        else:
+            return _TreapNode(higher.key, higher.value, PersistentTreap._merge(lower, higher.left_son),
+                              higher.right_son, higher.priority)
+
+    @staticmethod
+    def _erase(node, key):
+
+        if node is None:
+            return None
+
+        if key < node.key:
+            left_son = PersistentTreap._erase(node.left_son, key)
+            if left_son is node.left_son:
+                # the key is missing, nothing has to be copied
+                return node
+            return _TreapNode(node.key, node.value, left_son, node.right_son, node.priority)
+        if node.key < key:
+            right_son = PersistentTreap._erase(node.right_son, key)
+            if right_son is node.right_son:
+                return node
+            return _TreapNode(node.key, node.value, node.left_son, right_son, node.priority)
+
+        return PersistentTreap._merge(node.left_son, node.right_son)
+
+    def erased(self, key):
+        """ Returns the version without the key, leaving the current one unchanged.
+            Complexity: O(log n)
+        """
+        return PersistentTreap(PersistentTreap._erase(self._root, key))
+
+    def erase(self, key):
+        self._version += 1
+        self._root = PersistentTreap._erase(self._root, key)
+
+    def _assign_value(self, path, value):
+        # the node cannot change: insert a new version and follow it
+        key = path[-1].key
+        self.insert(key, value)
+
+        del path[:]
+        node = self._root
+        while node is not None:
+            path.append(node)
+            if key == node.key:
+                break
+            node = node.left_son if key < node.key else node.right_son
+
+    @classmethod
+    def from_sorted(cls, items, priorities=None):
+        return cls(Treap.from_sorted(items, priorities).get_root())
+
+    dump = Treap.dump
+    load = classmethod(Treap.load.__func__)
+
+    # Versions
+    def snapshot(self):
+        """ Returns the current version, which the following updates leave unchanged.
+            Complexity: O(1)
+        """
+        return PersistentTreap(self._root)
+
+    # Queries
+    _iter_range_nodes = staticmethod(Treap._iter_range_nodes)
+
+    def size(self):
+        return self._root.weight_of_subtree if self._root is not None else 0
+
+
+########################## Testing
+
+
+class TestPersistentTreapOperations(unittest.TestCase):
+
+    def setUp(self):
+        self.treap = PersistentTreap()
+        self.model = {}
+
+        # populate the treap
+        self.number_of_insertions = 10000
+        for i in range(self.number_of_insertions):
+            key = random.randint(1, 1000000)
+            value = ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(50))
+            self.treap[key] = value
+            self.model[key] = value
+
+    @staticmethod
+    def check_treap(node):
+        """ Checks the priorities and the fields of all the nodes below node.
+        """
+        for current in Dictionary._iter_nodes(node):
+            sons = [son for son in (current.left_son, current.right_son) if son is not None]
+            if (any(son.priority > current.priority for son in sons) or
+                    current.weight_of_subtree != 1 + sum(son.weight_of_subtree for son in sons)):
+                return False
+        return True
+
+    def test_insert_and_erase(self):
+
+        self.assertEqual(self.treap.items(), sorted(self.model.items()))
+        self.assertEqual(self.treap.size(), len(self.model))
+        self.assertTrue(TestPersistentTreapOperations.check_treap(self.treap.get_root()))
+
+        for key in random.sample(list(self.model), 5000) + [0]:
+            self.treap.erase(key)
+            self.model.pop(key, None)
+        self.assertEqual(self.treap.items(), sorted(self.model.items()))
+        self.assertTrue(TestPersistentTreapOperations.check_treap(self.treap.get_root()))
+
+    def test_snapshots(self):
+
+        versions = []
+        for i in range(20):
+            versions.append((self.treap.snapshot(), sorted(self.model.items())))
+            for key in random.sample(list(self.model), 100):
+                self.treap.erase(key)
+                del self.model[key]
+            for j in range(100):
+                key = random.randint(1, 1000000)
+                self.treap.insert(key, j)
+                self.model[key] = j
+
+        for version, items in versions:
+            self.assertEqual(version.items(), items)
+            self.assertTrue(TestPersistentTreapOperations.check_treap(version.get_root()))
+
+        key = next(iter(self.model))
+        version = self.treap.snapshot()
+        newer_version = version.inserted(key, "newer").erased(0)
+        self.assertEqual(version[key], self.model[key])
+        self.assertEqual(newer_version[key], "newer")
+
+        cursor = version.find_cursor(key)
+        cursor.value = "through the cursor"
+        self.assertEqual((cursor.key, cursor.value), (key, "through the cursor"))
+        self.assertEqual(version[key], "through the cursor")
+        self.assertEqual(self.treap[key], self.model[key])
+
+    def test_concurrent_readers(self):
+
+        snapshot = self.treap.snapshot()
+        expected_items = snapshot.items()
+        results = []
+
+        def read():
+            results.append(list(snapshot.iter_items()) == expected_items and
+                           snapshot.count_range() == len(expected_items))
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for i in range(2000):
+            self.treap.insert(random.randint(1, 1000000), i)
+            self.treap.erase(random.choice(expected_items)[0])
+        for reader in readers:
+            reader.join()
+
+        self.assertEqual(results, [True] * 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
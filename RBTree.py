@@ -1,14 +1,18 @@
 #!/usr/bin/python3
 
-from Dictionary import Dictionary
+from Dictionary import Dictionary, OrderStatistics
 
 import unittest
 import string
 import random
+import bisect
+import io
 
 
 class RBNode(object):
 
+    __slots__ = ('colour', 'key', 'value', 'parent', 'left_son', 'right_son', 'weight_of_subtree')
+
     def __init__(self, colour, key, value=None, parent=None, left_son=None, right_son=None):
 
         self.colour = colour
@@ -17,6 +21,14 @@ class RBNode(object):
         self.parent = parent
         self.left_son = left_son
         self.right_son = right_son
+        self.weight_of_subtree = 1
+
+    # Assumes that his sons are already updated
+    def update_fields(self):
+
+        self.weight_of_subtree = 1
+        self.weight_of_subtree += self.left_son.weight_of_subtree if self.left_son is not None else 0
+        self.weight_of_subtree += self.right_son.weight_of_subtree if self.right_son is not None else 0
 
     def set_black(self):
         self.colour = True
@@ -55,6 +67,8 @@ class RBNode(object):
             root = left_son
         left_son.parent = self.parent
         self.parent = left_son
+        self.update_fields()
+        left_son.update_fields()
 
         return root
 
@@ -74,6 +88,8 @@ class RBNode(object):
             root = right_son
         right_son.parent = self.parent
         self.parent = right_son
+        self.update_fields()
+        right_son.update_fields()
 
         return root
 
@@ -94,7 +110,7 @@ class RBNode(object):
         return not RBNode.is_black(node)
 
 
-class RBTree(Dictionary):
+class RBTree(Dictionary, OrderStatistics):
 
     def __init__(self, root=None):
         self._root = root
@@ -118,6 +134,8 @@ class RBTree(Dictionary):
             new_son, inserted_node = self._insert(node.right_son, node, key, value)
             node.right_son = new_son
 
+        if inserted_node is not None:
+            node.weight_of_subtree += 1
         return node, inserted_node
 
     def _checkCase1(self, node):
@@ -171,6 +189,7 @@ class RBTree(Dictionary):
             raise AssertionError
 
     def insert(self, key, value=None):
+        self._version += 1
         self._root, inserted_node = self._insert(self._root, None, key, value)
         if inserted_node is not None:
             self._size += 1
@@ -184,11 +203,16 @@ class RBTree(Dictionary):
         if existing_son is not None:
             if RBNode.is_black(existing_son):
                 raise AssertionError
+            RBTree._decrease_weights(node)
             node.key, node.value = existing_son.key, existing_son.value
             node.left_son = node.right_son = None
             existing_son.detach()
         else:
 
+            # the node stays in place during the fixup, but no longer counts
+            node.weight_of_subtree = 0
+            RBTree._decrease_weights(node.parent)
+
             double_black_node = node
             while double_black_node != self._root and RBNode.is_black(double_black_node):
 
@@ -259,7 +283,14 @@ class RBTree(Dictionary):
 
             node.detach()
 
+    @staticmethod
+    def _decrease_weights(node):
+        while node is not None:
+            node.weight_of_subtree -= 1
+            node = node.parent
+
     def erase(self, key):
+        self._version += 1
         node_to_be_erased = Dictionary._find(self._root, key)[0]
         if node_to_be_erased is None:
             return
@@ -278,10 +309,60 @@ class RBTree(Dictionary):
             # Delete the root
             self._root = None
 
+    @staticmethod
+    def _build(items, low, high, parent, depth, red_depth):
+        if low >= high:
+            return None
+
+        middle = (low + high) // 2
+        key, value = items[middle]
+        node = RBNode(depth != red_depth, key, value, parent)
+        node.left_son = RBTree._build(items, low, middle, node, depth + 1, red_depth)
+        node.right_son = RBTree._build(items, middle + 1, high, node, depth + 1, red_depth)
+        node.update_fields()
+
+        return node
+
+    @classmethod
+    def from_sorted(cls, items):
+        items = Dictionary._check_sorted(items)
+
+        # Halving the items leaves every empty son on the last two levels, so
+        # colouring the (incomplete) last level red keeps all black heights equal.
+        red_depth = (len(items) + 1).bit_length() - 1
+
+        tree = cls()
+        tree._root = RBTree._build(items, 0, len(items), None, 0, red_depth)
+        tree._size = len(items)
+        return tree
+
     # Queries
     def size(self):
         return self._size
 
+    def black_height(self):
+        """ Returns the number of black nodes on the paths from the root to the leaves,
+            counted along the leftmost path rather than maintained by the updates.
+            Complexity: O(log n)
+        """
+        black_height = 0
+        node = self._root
+        while node is not None:
+            if RBNode.is_black(node):
+                black_height += 1
+            node = node.left_son
+        return black_height
+
+    def tree_stats(self):
+        """ Adds the black height to the metrics of Dictionary.tree_stats, and the bound of the
+            height by twice the black height (a red node has black sons).
+            Complexity: O(log n)
+        """
+        stats = Dictionary.tree_stats(self)
+        stats["black_height"] = self.black_height()
+        stats["max_depth_bound"] = 2 * stats["black_height"]
+        return stats
+
 ########################## Testing
 
 class TestRBTreeOperations(unittest.TestCase):
@@ -332,6 +413,158 @@ class TestRBTreeOperations(unittest.TestCase):
             self.rbtree.erase(random_key)
             self.assertTrue(TestRBTreeOperations.check_rbtree(self.rbtree._root)[0])
 
+    @staticmethod
+    def check_weights(tree):
+        return all(node.weight_of_subtree == 1 + sum(son.weight_of_subtree for son in (node.left_son, node.right_son)
+                                                     if son is not None)
+                   for node in tree._iter_nodes(tree.get_root()))
+
+    def test_order_statistics(self):
+
+        keys = self.rbtree.keys()
+        for key in random.sample(keys, 50):
+            self.rbtree.erase(key)
+            keys.remove(key)
+        self.assertTrue(TestRBTreeOperations.check_weights(self.rbtree))
+        self.assertEqual(self.rbtree.get_root().weight_of_subtree, self.rbtree.size())
+
+        for k in random.sample(range(len(keys)), 200):
+            self.assertEqual(self.rbtree.select(k), keys[k])
+            self.assertEqual(self.rbtree.get_kth_element(k), (keys[k], self.rbtree[keys[k]]))
+            self.assertEqual(self.rbtree.rank(keys[k]), k)
+            self.assertEqual(self.rbtree.rank(keys[k] + 0.5), k + 1)
+        self.assertEqual(self.rbtree.get_kth_element(len(keys)), None)
+        self.assertEqual(self.rbtree.select(-1), None)
+        self.assertEqual(self.rbtree.count_range(keys[10], keys[20], (True, False)), 10)
+
+        self.assertTrue(TestRBTreeOperations.check_weights(RBTree.from_sorted(self.rbtree.items())))
+
+    def test_from_sorted(self):
+
+        items = self.rbtree.items()
+        built = RBTree.from_sorted(items)
+        self.assertEqual(built.items(), items)
+        self.assertEqual(built.size(), len(items))
+        self.assertTrue(TestRBTreeOperations.check_rbtree(built._root)[0])
+        self.assertTrue(RBNode.is_black(built._root))
+
+        for number_of_items in range(65):
+            built = RBTree.from_sorted((key, None) for key in range(number_of_items))
+            self.assertTrue(TestRBTreeOperations.check_rbtree(built._root)[0])
+            built.insert(number_of_items)
+            built.erase(0)
+            self.assertTrue(TestRBTreeOperations.check_rbtree(built._root)[0])
+            self.assertEqual(built.keys(), list(range(1, number_of_items + 1)))
+
+        self.assertRaises(ValueError, RBTree.from_sorted, [(2, None), (1, None)])
+
+    def test_tree_stats(self):
+
+        stats = self.rbtree.tree_stats()
+        self.assertEqual(stats["size"], len(self.rbtree))
+        self.assertEqual(stats["black_height"], TestRBTreeOperations.check_rbtree(self.rbtree.get_root())[1])
+        self.assertLessEqual(stats["max_depth_lower_bound"], self.rbtree.get_height())
+        self.assertLessEqual(self.rbtree.get_height(), stats["max_depth_bound"])
+        self.assertEqual(RBTree().tree_stats(), {"size": 0, "max_depth_lower_bound": 0, "black_height": 0, "max_depth_bound": 0})
+
+    def test_dump_and_load(self):
+
+        file = io.BytesIO()
+        self.rbtree.dump(file)
+        file.seek(0)
+        loaded = RBTree.load(file)
+        self.assertEqual(loaded.items(), self.rbtree.items())
+        self.assertTrue(TestRBTreeOperations.check_rbtree(loaded._root)[0])
+
+    def test_irange(self):
+
+        keys = self.rbtree.keys()
+        for i in range(100):
+            low, high = sorted(random.sample(keys, 2))
+            expected = [(key, self.rbtree[key]) for key in keys if low <= key < high]
+
+            self.assertEqual(list(self.rbtree.irange(low, high, (True, False))), expected)
+            self.assertEqual(list(self.rbtree.irange(low, high, (True, False), reverse=True)), expected[::-1])
+
+        self.assertEqual(list(self.rbtree.irange(low=keys[-2], inclusive=(False, True))), [(keys[-1], self.rbtree[keys[-1]])])
+
+    def test_cursor(self):
+
+        keys = self.rbtree.keys()
+        cursor = self.rbtree.lower_bound(keys[0])
+        stepped_keys = [cursor.key]
+        while cursor.next():
+            stepped_keys.append(cursor.key)
+        self.assertEqual(stepped_keys, keys)
+        self.assertFalse(cursor.valid)
+
+        cursor = self.rbtree.find_cursor(keys[-1])
+        stepped_keys = [cursor.key]
+        while cursor.prev():
+            stepped_keys.append(cursor.key)
+        self.assertEqual(stepped_keys, keys[::-1])
+
+        # finger search, moving both forwards and backwards
+        cursor = self.rbtree.lower_bound(keys[len(keys) // 2])
+        for i in range(1000):
+            target = cursor.key + random.randint(-5000, 5000) if cursor.valid else random.randint(0, 1000001)
+            expected = bisect.bisect_left(keys, target)
+            self.assertEqual(cursor.seek(target), expected < len(keys))
+            if expected < len(keys):
+                self.assertEqual(cursor.key, keys[expected])
+
+        self.assertEqual(self.rbtree.find_cursor(0), None)
+        self.assertFalse(self.rbtree.lower_bound(keys[-1] + 1).valid)
+
+        cursor = self.rbtree.find_cursor(keys[1])
+        cursor.value = "updated"
+        self.assertEqual(self.rbtree[keys[1]], "updated")
+        self.assertTrue(cursor.prev())
+        self.assertEqual((cursor.key, cursor.value), self.rbtree.items()[0])
+        self.assertFalse(cursor.prev())
+        self.assertRaises(IndexError, lambda: cursor.key)
+
+    def test_batched_look_up(self):
+
+        keys = self.rbtree.keys()
+        probes = random.sample(keys, 500) + [random.randint(1, 1000000) for _ in range(500)] + keys[:5] * 2
+        random.shuffle(probes)
+
+        self.assertEqual(self.rbtree.look_up_many(probes), [self.rbtree.look_up(key) for key in probes])
+        self.assertEqual(self.rbtree.contains_many(iter(probes)), [key in keys for key in probes])
+        self.assertTrue(keys[0] in self.rbtree)
+        self.assertFalse(0 in self.rbtree)
+        self.assertEqual(self.rbtree.look_up_many([]), [])
+
+    def test_bulk_updates(self):
+
+        model = dict(self.rbtree.items())
+        for batch_size in (10, 50000):
+            batch = [(random.randint(1, 1000000), i) for i in range(batch_size)]
+            self.rbtree.insert_many(batch)
+            model.update(batch)
+            self.assertEqual(self.rbtree.items(), sorted(model.items()))
+            self.assertEqual(self.rbtree.size(), len(model))
+            self.assertTrue(TestRBTreeOperations.check_rbtree(self.rbtree._root)[0])
+
+            erased_keys = random.sample(list(model), batch_size // 2) + [0]
+            self.rbtree.erase_many(erased_keys)
+            for key in erased_keys:
+                model.pop(key, None)
+            self.assertEqual(self.rbtree.items(), sorted(model.items()))
+            self.assertEqual(self.rbtree.size(), len(model))
+            self.assertTrue(TestRBTreeOperations.check_rbtree(self.rbtree._root)[0])
+            self.assertTrue(TestRBTreeOperations.check_weights(self.rbtree))
+
+    def test_iterators(self):
+
+        items = self.rbtree.items()
+        self.assertEqual(list(self.rbtree.iter_items()), items)
+        self.assertEqual(list(self.rbtree), [key for key, value in items])
+        self.assertEqual(self.rbtree.values(), [value for key, value in items])
+        self.assertEqual(list(self.rbtree.reversed()), items[::-1])
+        self.assertEqual(list(reversed(self.rbtree)), [key for key, value in items[::-1]])
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,338 @@
+#!/usr/bin/python3
+
+import random
+
+import unittest
+
+
+class _RopeNode(object):
+
+    __slots__ = ('value', 'priority', 'left_son', 'right_son', 'weight_of_subtree', 'reversed')
+
+    def __init__(self, value, priority=None):
+        self.value = value
+        self.priority = priority if priority is not None else random.random()
+        self.left_son = self.right_son = None
+        self.weight_of_subtree = 1
+        # whether the order of the subtree still has to be reversed below this node
+        self.reversed = False
+
+    def push(self):
+        if self.reversed:
+            self.left_son, self.right_son = self.right_son, self.left_son
+            if self.left_son is not None:
+                self.left_son.reversed = not self.left_son.reversed
+            if self.right_son is not None:
+                self.right_son.reversed = not self.right_son.reversed
+            self.reversed = False
+
+    # Assumes that his sons are already updated
+    def update_fields(self):
+        self.weight_of_subtree = 1
+        self.weight_of_subtree += self.left_son.weight_of_subtree if self.left_son is not None else 0
+        self.weight_of_subtree += self.right_son.weight_of_subtree if self.right_son is not None else 0
+
+
+class Rope(object):
+    """ A sequence stored in a treap ordered by position instead of keys (an implicit treap).
+
+    The position of a node is the weight of everything on its left, so it is
+    found while descending and never stored. Inserting, deleting, splitting and
+    concatenating anywhere in the sequence then cost O(log n), and reverse()
+    only flags the root of the reversed part, its sons being swapped lazily by
+    the following descents.
+    """
+
+    def __init__(self, values=()):
+        """ Builds the rope of values, keeping the right spine of the treap on a stack.
+            Complexity: O(n)
+        """
+        right_spine = []
+        for value in values:
+            node = _RopeNode(value)
+
+            last_popped = None
+            while right_spine and right_spine[-1].priority < node.priority:
+                last_popped = right_spine.pop()
+                last_popped.update_fields()
+            node.left_son = last_popped
+
+            if right_spine:
+                right_spine[-1].right_son = node
+            right_spine.append(node)
+
+        self._root = None
+        while right_spine:
+            self._root = right_spine.pop()
+            self._root.update_fields()
+
+    @classmethod
+    def _with_root(cls, root):
+        rope = cls()
+        rope._root = root
+        return rope
+
+    def __len__(self):
+        return self._root.weight_of_subtree if self._root is not None else 0
+
+    def _check_index(self, index):
+        """ Turns a negative index into the matching non-negative one.
+        """
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("Rope index out of range.")
+        return index
+
+    def _slice_bounds(self, index):
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("Only contiguous slices are supported.")
+        return start, max(start, stop)
+
+    # Split and merge
+    @staticmethod
+    def _split(node, count):
+        """ Splits the subtree of node into its first count values and the other ones.
+            Complexity: O(log n)
+        """
+        if node is None:
+            return None, None
+
+        node.push()
+        left_weight = node.left_son.weight_of_subtree if node.left_son is not None else 0
+        if count <= left_weight:
+            lower, node.left_son = Rope._split(node.left_son, count)
+            node.update_fields()
+            return lower, node
+        else:
+            node.right_son, higher = Rope._split(node.right_son, count - left_weight - 1)
+            node.update_fields()
+            return node, higher
+
+    @staticmethod
+    def _merge(lower, higher):
+        """ Concatenates two subtrees.
+            Complexity: O(log n)
+        """
+        if lower is None:
+            return higher
+        if higher is None:
+            return lower
+
+        if lower.priority >= higher.priority:
+            lower.push()
+            lower.right_son = Rope._merge(lower.right_son, higher)
+            lower.update_fields()
+            return lower
+        else:
+            higher.push()
+            higher.left_son = Rope._merge(lower, higher.left_son)
+            higher.update_fields()
+            return higher
+
+    def split(self, index):
+        """ Splits the rope into the values before index and the other ones.
+            The nodes are moved to the two new ropes, leaving the current one empty.
+            Complexity: O(log n)
+        """
+        lower, higher = Rope._split(self._root, index)
+        self._root = None
+        return Rope._with_root(lower), Rope._with_root(higher)
+
+    def join(self, other):
+        """ Concatenates two ropes. The nodes are moved to the new rope, leaving both operands empty.
+            Complexity: O(log n)
+        """
+        root = Rope._merge(self._root, other._root)
+        self._root = other._root = None
+        return Rope._with_root(root)
+
+    def __add__(self, other):
+        return self.join(other)
+
+    # Positional access
+    def _get_node(self, index):
+        node = self._root
+        while True:
+            node.push()
+            left_weight = node.left_son.weight_of_subtree if node.left_son is not None else 0
+            if index == left_weight:
+                return node
+            if index < left_weight:
+                node = node.left_son
+            else:
+                index -= left_weight + 1
+                node = node.right_son
+
+    def __getitem__(self, index):
+        """ Returns the value at an index, or a new rope with the values of a contiguous slice.
+            Complexity: O(log n), O(log n + k) for a slice of k values
+        """
+        if isinstance(index, slice):
+            start, stop = self._slice_bounds(index)
+            lower, higher = Rope._split(self._root, stop)
+            lower, middle = Rope._split(lower, start)
+            values = Rope._with_root(middle).values()
+            self._root = Rope._merge(Rope._merge(lower, middle), higher)
+            return Rope(values)
+
+        return self._get_node(self._check_index(index)).value
+
+    def __setitem__(self, index, value):
+        self._get_node(self._check_index(index)).value = value
+
+    def __delitem__(self, index):
+        """ Deletes the value at an index, or the values of a contiguous slice.
+            Complexity: O(log n)
+        """
+        if isinstance(index, slice):
+            start, stop = self._slice_bounds(index)
+        else:
+            start = self._check_index(index)
+            stop = start + 1
+
+        lower, higher = Rope._split(self._root, stop)
+        lower, _ = Rope._split(lower, start)
+        self._root = Rope._merge(lower, higher)
+
+    def insert(self, index, value):
+        """ Inserts a value before index, like list.insert.
+            Complexity: O(log n)
+        """
+        size = len(self)
+        if index < 0:
+            index = max(0, index + size)
+        lower, higher = Rope._split(self._root, min(index, size))
+        self._root = Rope._merge(Rope._merge(lower, _RopeNode(value)), higher)
+
+    def append(self, value):
+        self._root = Rope._merge(self._root, _RopeNode(value))
+
+    def extend(self, values):
+        """ Complexity: O(k + log n) for k values
+        """
+        self._root = Rope._merge(self._root, Rope(values)._root)
+
+    def pop(self, index=-1):
+        index = self._check_index(index)
+        value = self[index]
+        del self[index]
+        return value
+
+    def reverse(self, start=0, stop=None):
+        """ Reverses the values between start and stop (the end of the rope if None).
+            Complexity: O(log n)
+        """
+        start, stop = self._slice_bounds(slice(start, stop))
+        lower, higher = Rope._split(self._root, stop)
+        lower, middle = Rope._split(lower, start)
+        if middle is not None:
+            middle.reversed = not middle.reversed
+        self._root = Rope._merge(Rope._merge(lower, middle), higher)
+
+    # Iteration
+    def _iter_nodes(self, reverse=False):
+        """ Yields the nodes in the order of the sequence, using an explicit stack.
+            Complexity: O(n), O(height) memory
+        """
+        stack = []
+        node = self._root
+        while True:
+            while node is not None:
+                node.push()
+                stack.append(node)
+                node = node.right_son if reverse else node.left_son
+            if not stack:
+                return
+            node = stack.pop()
+            yield node
+            node = node.left_son if reverse else node.right_son
+
+    def __iter__(self):
+        return (node.value for node in self._iter_nodes())
+
+    def __reversed__(self):
+        return (node.value for node in self._iter_nodes(True))
+
+    def values(self):
+        """ Returns a list with all the values.
+            Complexity: O(n)
+        """
+        return list(self)
+
+    def __repr__(self):
+        return "Rope({!r})".format(self.values())
+
+
+########################## Testing
+
+
+class TestRopeOperations(unittest.TestCase):
+
+    def setUp(self):
+        self.model = [random.randint(1, 1000000) for _ in range(5000)]
+        self.rope = Rope(self.model)
+
+    def test_positional_updates(self):
+
+        self.assertEqual(self.rope.values(), self.model)
+        for i in range(2000):
+            index = random.randint(-len(self.model), len(self.model))
+            operation = random.random()
+            if operation < 0.4:
+                self.rope.insert(index, i)
+                self.model.insert(index, i)
+            elif operation < 0.7 and index != len(self.model):
+                self.assertEqual(self.rope.pop(index), self.model.pop(index))
+            elif index != len(self.model):
+                self.rope[index] = -i
+                self.model[index] = -i
+                self.assertEqual(self.rope[index], self.model[index])
+
+        self.assertEqual(self.rope.values(), self.model)
+        self.assertEqual(len(self.rope), len(self.model))
+        self.assertEqual(list(reversed(self.rope)), self.model[::-1])
+        self.assertRaises(IndexError, self.rope.__getitem__, len(self.model))
+
+        self.rope.append(1)
+        self.rope.extend(range(10))
+        self.model.append(1)
+        self.model.extend(range(10))
+        self.assertEqual(self.rope.values(), self.model)
+
+    def test_slices_and_reverse(self):
+
+        for _ in range(300):
+            start, stop = sorted(random.sample(range(len(self.model) + 1), 2))
+            operation = random.random()
+            if operation < 0.4:
+                self.rope.reverse(start, stop)
+                self.model[start:stop] = self.model[start:stop][::-1]
+            elif operation < 0.6:
+                stop = min(stop, start + 20)
+                del self.rope[start:stop]
+                del self.model[start:stop]
+            else:
+                self.assertEqual(self.rope[start:stop].values(), self.model[start:stop])
+                self.assertEqual(self.rope[start - len(self.model):].values(), self.model[start:])
+
+        self.assertEqual(self.rope.values(), self.model)
+        self.assertRaises(ValueError, self.rope.__getitem__, slice(None, None, 2))
+
+    def test_split_and_join(self):
+
+        index = len(self.model) // 3
+        lower, higher = self.rope.split(index)
+        self.assertEqual((lower.values(), higher.values()), (self.model[:index], self.model[index:]))
+        self.assertEqual(len(self.rope), 0)
+
+        higher.reverse()
+        joined = higher + lower
+        self.assertEqual(joined.values(), self.model[index:][::-1] + self.model[:index])
+        self.assertEqual((len(lower), len(higher)), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+
+from Dictionary import Dictionary
+from RBTree import RBTree
+from Treap import Treap
+from SplayTree import SplayTree
+
+from concurrent.futures import ProcessPoolExecutor
+import bisect
+import functools
+import itertools
+import operator
+import unittest
+import random
+
+
+# The tasks run in the worker processes, so they have to be top-level functions
+
+def _sort_items(items):
+    return Dictionary._sort_batch(items)
+
+
+def _map_items(function, items):
+    return [function(key, value) for key, value in items]
+
+
+def _apply(function, items):
+    return function(items)
+
+
+class ShardedDictionary(object):
+    """ A dictionary partitioned by key ranges over several trees (the shards).
+
+    Shard i holds the keys from boundaries[i - 1] (inclusive) to boundaries[i]
+    (exclusive), so a key is routed to its shard by a binary search. A shard
+    growing over max_shard_size is split in two halves, with split() for the
+    trees supporting it; a shard shrinking under a quarter of it is joined to
+    a neighbour, when both fit in half of it (empty shards are always joined).
+
+    The bulk operations (insert_many, map_range, aggregate) hand one task per
+    shard to an optional concurrent.futures executor, e.g. a ProcessPoolExecutor,
+    but only the sorting of the batches and the functions given to map_range and
+    aggregate run in these tasks. The trees stay in the calling process: the
+    insertions into the shards and the scans of their ranges run there, one shard
+    after the other, since shipping a tree to a worker and back (even as a flat
+    Snapshot) costs more than building it locally. The tasks receive and return
+    (key, value) lists, and the functions given to them must be picklable.
+
+    So the bulk loads and the range scans do not use more than one core: only the
+    sorting and the functions given to map_range and aggregate scale with the workers,
+    which pays off for costly functions rather than for building or scanning the index.
+    Spreading the trees themselves would take workers owning their shards for good,
+    which a concurrent.futures executor cannot provide.
+    """
+
+    def __init__(self, tree_type=Treap, max_shard_size=1 << 16, executor=None):
+        if max_shard_size < 2:
+            raise ValueError("The shards must be able to hold at least 2 keys.")
+
+        self._tree_type = tree_type
+        self._max_shard_size = max_shard_size
+        self._executor = executor
+        self._shards = [tree_type()]
+        self._boundaries = []
+
+    @classmethod
+    def from_sorted(cls, items, tree_type=Treap, max_shard_size=1 << 16, executor=None):
+        """ Builds a sharded dictionary from (key, value) pairs sorted by strictly increasing keys,
+            filling every shard up to half of max_shard_size.
+            Complexity: O(n)
+        """
+        dictionary = cls(tree_type, max_shard_size, executor)
+        items = Dictionary._check_sorted(items)
+        if items:
+            step = max(1, max_shard_size // 2)
+            dictionary._shards = [tree_type.from_sorted(items[start:start + step])
+                                  for start in range(0, len(items), step)]
+            dictionary._boundaries = [items[start][0] for start in range(step, len(items), step)]
+        return dictionary
+
+    def _map(self, function, *iterables):
+        if self._executor is None:
+            return list(map(function, *iterables))
+        return list(self._executor.map(function, *iterables))
+
+    @staticmethod
+    def _shard_size(shard):
+        return shard.size()
+
+    def _shard_index(self, key):
+        return bisect.bisect_right(self._boundaries, key)
+
+    # Shard boundaries
+    def _split_shard(self, index):
+        """ Splits a shard in two halves, moving the boundaries accordingly.
+        """
+        shard = self._shards[index]
+        middle = ShardedDictionary._shard_size(shard) // 2
+
+        if hasattr(shard, 'split'):
+            boundary = shard.get_kth_element(middle)[0]
+            lower, higher = shard.split(shard.get_kth_element(middle - 1)[0])
+        else:
+            items = shard.items()
+            boundary = items[middle][0]
+            lower = self._tree_type.from_sorted(items[:middle])
+            higher = self._tree_type.from_sorted(items[middle:])
+
+        self._shards[index:index + 1] = [lower, higher]
+        self._boundaries.insert(index, boundary)
+
+    def _join_shards(self, index):
+        """ Joins a shard with the following one.
+        """
+        lower, higher = self._shards[index], self._shards[index + 1]
+
+        if hasattr(lower, 'join'):
+            joined = lower.join(higher)
+        else:
+            joined = self._tree_type.from_sorted(itertools.chain(lower.iter_items(), higher.iter_items()))
+
+        self._shards[index:index + 2] = [joined]
+        del self._boundaries[index]
+
+    def _rebalance(self, index):
+        """ Restores the size bounds of a shard after it has been updated.
+        """
+        size = ShardedDictionary._shard_size(self._shards[index])
+
+        if size > self._max_shard_size:
+            self._split_shard(index)
+            # the higher half is rebalanced first, so that the index of the lower one stays valid
+            self._rebalance(index + 1)
+            self._rebalance(index)
+        elif size < self._max_shard_size // 4 and len(self._shards) > 1:
+            neighbours = [neighbour for neighbour in (index - 1, index + 1) if 0 <= neighbour < len(self._shards)]
+            neighbour = min(neighbours, key=lambda neighbour: ShardedDictionary._shard_size(self._shards[neighbour]))
+            if size == 0 or size + ShardedDictionary._shard_size(self._shards[neighbour]) <= self._max_shard_size // 2:
+                self._join_shards(min(index, neighbour))
+
+    def number_of_shards(self):
+        return len(self._shards)
+
+    # Updates
+    def insert(self, key, value=None):
+        index = self._shard_index(key)
+        self._shards[index].insert(key, value)
+        self._rebalance(index)
+
+    def __setitem__(self, key, value):
+        self.insert(key, value)
+
+    def erase(self, key):
+        index = self._shard_index(key)
+        self._shards[index].erase(key)
+        self._rebalance(index)
+
+    def insert_many(self, items):
+        """ Inserts a batch of (key, value) pairs; the last pair wins for repeated keys.
+            The batch is partitioned by shard and the parts are sorted by parallel tasks,
+            then the calling process inserts each one into its shard with insert_many.
+            Complexity: O(m log m) work in the tasks, plus the serial bulk insertions into the shards
+        """
+        items = list(items)
+        if not items:
+            return
+
+        if self.size() == 0:
+            # pick the boundaries from the batch itself, so that it is spread over the shards
+            keys = sorted(set(item[0] for item in items))
+            step = max(1, self._max_shard_size // 2)
+            self._shards = [self._tree_type() for _ in range(0, len(keys), step)]
+            self._boundaries = keys[step::step]
+
+        parts = [[] for _ in self._shards]
+        for item in items:
+            parts[self._shard_index(item[0])].append(item)
+
+        indices = [index for index, part in enumerate(parts) if part]
+        sorted_parts = self._map(_sort_items, [parts[index] for index in indices])
+        for index, sorted_part in zip(indices, sorted_parts):
+            self._shards[index].insert_many(sorted_part)
+
+        for index in reversed(indices):
+            self._rebalance(index)
+
+    # Queries
+    def look_up(self, key):
+        return self._shards[self._shard_index(key)].look_up(key)
+
+    def __getitem__(self, key):
+        return self.look_up(key)
+
+    def __contains__(self, key):
+        return key in self._shards[self._shard_index(key)]
+
+    def size(self):
+        return sum(ShardedDictionary._shard_size(shard) for shard in self._shards)
+
+    def _range_shards(self, low, high):
+        """ Returns the shards which may hold keys between low and high (None meaning unbounded).
+        """
+        first = self._shard_index(low) if low is not None else 0
+        last = self._shard_index(high) if high is not None else len(self._shards) - 1
+        return self._shards[first:last + 1]
+
+    def irange(self, low=None, high=None, inclusive=(True, True), reverse=False):
+        """ Iterates over the (key, value) pairs between low and high, see Dictionary.irange.
+            Complexity: O(s log n + k) for s shards
+        """
+        shards = self._range_shards(low, high)
+        for shard in (reversed(shards) if reverse else shards):
+            for item in shard.irange(low, high, inclusive, reverse):
+                yield item
+
+    def iter_items(self):
+        return self.irange()
+
+    def items(self):
+        return list(self.irange())
+
+    def _range_parts(self, low, high, inclusive):
+        parts = [list(shard.irange(low, high, inclusive)) for shard in self._range_shards(low, high)]
+        return [part for part in parts if part]
+
+    def map_range(self, function, low=None, high=None, inclusive=(True, True)):
+        """ Applies function(key, value) to the pairs between low and high, one parallel task per shard.
+            The pairs are collected from the shards by the calling process.
+            Complexity: O(s log n + k) serial work for s shards, plus the calls of function in the tasks
+        :return: The results, in the order of the keys.
+        """
+        parts = self._range_parts(low, high, inclusive)
+        results = self._map(_map_items, itertools.repeat(function, len(parts)), parts)
+        return list(itertools.chain.from_iterable(results))
+
+    def aggregate(self, function, combine, low=None, high=None, inclusive=(True, True)):
+        """ Aggregates the pairs between low and high: function reduces the list of pairs
+            of every shard in a parallel task, then combine folds these partial results
+            in the order of the keys. The pairs are collected from the shards by the
+            calling process.
+            Complexity: O(s log n + k) serial work for s shards, plus the calls of function in the tasks
+        :return: The aggregate, or None if the range is empty.
+        """
+        parts = self._range_parts(low, high, inclusive)
+        if not parts:
+            return None
+        return functools.reduce(combine, self._map(_apply, itertools.repeat(function, len(parts)), parts))
+
+
+########################## Testing
+
+
+def _sum_of_values(items):
+    return sum(value for _, value in items)
+
+
+def _key_and_square(key, value):
+    return key, value * value
+
+
+class TestShardedDictionaryOperations(unittest.TestCase):
+
+    def check_shards(self, dictionary):
+        for index, shard in enumerate(dictionary._shards):
+            keys = shard.keys()
+            self.assertLessEqual(len(keys), dictionary._max_shard_size)
+            if index > 0:
+                self.assertLessEqual(dictionary._boundaries[index - 1], keys[0])
+            if index < len(dictionary._boundaries):
+                self.assertLess(keys[-1], dictionary._boundaries[index])
+
+    def test_insert_and_erase(self):
+
+        for tree_type in (RBTree, Treap, SplayTree):
+            dictionary = ShardedDictionary(tree_type, max_shard_size=64)
+            model = {}
+
+            for i in range(3000):
+                key = random.randint(1, 10000)
+                dictionary[key] = i
+                model[key] = i
+            self.assertGreater(dictionary.number_of_shards(), 10)
+            self.assertEqual(dictionary.items(), sorted(model.items()))
+            self.check_shards(dictionary)
+
+            for key in random.sample(list(model), len(model) - 10) + [0]:
+                dictionary.erase(key)
+                model.pop(key, None)
+            self.assertEqual(dictionary.items(), sorted(model.items()))
+            self.assertEqual(dictionary.size(), len(model))
+            self.assertTrue(all(shard.get_root() for shard in dictionary._shards))
+            self.assertTrue(all(dictionary[key] == value and key in dictionary for key, value in model.items()))
+
+    def test_bulk_operations(self):
+
+        items = [(random.randint(1, 100000), random.randint(1, 100)) for _ in range(5000)]
+        model = dict(items)
+
+        with ProcessPoolExecutor(2) as executor:
+            dictionary = ShardedDictionary(max_shard_size=500, executor=executor)
+            dictionary.insert_many(items)
+            dictionary.insert_many([(key, 1) for key in range(0, 100000, 50)])
+            model.update((key, 1) for key in range(0, 100000, 50))
+
+            expected_items = sorted(model.items())
+            self.assertEqual(dictionary.items(), expected_items)
+            self.assertEqual(dictionary.size(), len(model))
+            self.check_shards(dictionary)
+
+            ranged_items = [(key, value) for key, value in expected_items if 2000 <= key < 70000]
+            self.assertEqual(list(dictionary.irange(2000, 70000, (True, False), reverse=True)), ranged_items[::-1])
+            self.assertEqual(dictionary.map_range(_key_and_square, 2000, 70000, (True, False)),
+                             [(key, value * value) for key, value in ranged_items])
+            self.assertEqual(dictionary.aggregate(_sum_of_values, operator.add, 2000, 70000, (True, False)),
+                             sum(value for _, value in ranged_items))
+            self.assertIsNone(dictionary.aggregate(_sum_of_values, operator.add, 100001))
+
+        sorted_dictionary = ShardedDictionary.from_sorted(expected_items, RBTree, max_shard_size=500)
+        self.assertEqual(sorted_dictionary.items(), expected_items)
+        self.check_shards(sorted_dictionary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+
+""" A compact binary format for the sorted (key, value) pairs of a dictionary.
+
+    header      b"PTSN", the format version and a flags byte (bit 0: priorities follow the values)
+    chunks      a little-endian uint32 count of pairs, then the key column, the value
+                column and, if flagged, the priority column of these pairs
+    end         a chunk counting 0 pairs
+
+Every column starts with a kind byte: b"q" for int64 and b"d" for float64 fixed-width
+columns, b"n" for a column of None (without payload), or b"p" for any other column,
+pickled as a list after a uint64 length. Writing streams the pairs chunk by chunk.
+
+WARNING: only read snapshots from trusted sources. The pickled columns are loaded with
+pickle, so a crafted snapshot can run arbitrary code while it is read.
+"""
+
+from array import array
+import io
+import itertools
+import pickle
+import struct
+import sys
+import unittest
+import random
+
+_MAGIC = b"PTSN"
+_VERSION = 1
+_WITH_PRIORITIES = 1
+
+_HEADER = struct.Struct("<4sBB")
+_COUNT = struct.Struct("<I")
+_LENGTH = struct.Struct("<Q")
+
+# The number of pairs written per chunk
+CHUNK_SIZE = 1 << 14
+
+
+def _write_column(file, column):
+    if all(element is None for element in column):
+        file.write(b"n")
+        return
+
+    kind = None
+    if all(type(element) is int for element in column):
+        kind = "q"
+    elif all(type(element) is float for element in column):
+        kind = "d"
+
+    if kind is not None:
+        try:
+            column = array(kind, column)
+        except OverflowError:
+            kind = None
+
+    if kind is not None:
+        if sys.byteorder != "little":
+            column.byteswap()
+        file.write(kind.encode())
+        file.write(column.tobytes())
+    else:
+        payload = pickle.dumps(column, pickle.HIGHEST_PROTOCOL)
+        file.write(b"p")
+        file.write(_LENGTH.pack(len(payload)))
+        file.write(payload)
+
+
+def _read_exactly(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError("The snapshot is truncated.")
+    return data
+
+
+def _read_column(file, count):
+    kind = _read_exactly(file, 1)
+    if kind == b"n":
+        return [None] * count
+    if kind == b"p":
+        length, = _LENGTH.unpack(_read_exactly(file, _LENGTH.size))
+        return pickle.loads(_read_exactly(file, length))
+    if kind not in (b"q", b"d"):
+        raise ValueError("Unknown column kind: {}.".format(kind))
+
+    column = array(kind.decode())
+    column.frombytes(_read_exactly(file, count * column.itemsize))
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column.tolist()
+
+
+def write(file, records, with_priorities=False):
+    """ Streams sorted records to a binary file.
+        Complexity: O(n)
+    :param records: (key, value) pairs sorted by key, or (key, value, priority) triples with with_priorities.
+    """
+    file.write(_HEADER.pack(_MAGIC, _VERSION, _WITH_PRIORITIES if with_priorities else 0))
+
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, CHUNK_SIZE))
+        file.write(_COUNT.pack(len(chunk)))
+        if not chunk:
+            break
+
+        columns = list(zip(*chunk))
+        for column in columns:
+            _write_column(file, list(column))
+
+
+def read(file):
+    """ Reads back a snapshot written by write.
+        WARNING: only for trusted files, since the pickled columns can run arbitrary code when loaded.
+        Complexity: O(n)
+    :return: The list of (key, value) pairs, and the list of their priorities (None if they were not written).
+    """
+    magic, version, flags = _HEADER.unpack(_read_exactly(file, _HEADER.size))
+    if magic != _MAGIC:
+        raise ValueError("The file is not a tree snapshot.")
+    if version != _VERSION:
+        raise ValueError("Unsupported snapshot version: {}.".format(version))
+
+    items = []
+    priorities = [] if flags & _WITH_PRIORITIES else None
+    while True:
+        count, = _COUNT.unpack(_read_exactly(file, _COUNT.size))
+        if count == 0:
+            break
+
+        keys = _read_column(file, count)
+        values = _read_column(file, count)
+        items.extend(zip(keys, values))
+        if priorities is not None:
+            priorities.extend(_read_column(file, count))
+
+    return items, priorities
+
+
+########################## Testing
+
+
+class TestSnapshotOperations(unittest.TestCase):
+
+    def test_write_and_read(self):
+
+        columns = [
+            [random.randint(-2 ** 63, 2 ** 63 - 1) for _ in range(CHUNK_SIZE + 10)],
+            [random.random() for _ in range(CHUNK_SIZE + 10)],
+            [str(random.random()) for _ in range(CHUNK_SIZE + 10)],
+            [None] * (CHUNK_SIZE + 10),
+            [2 ** 64 + i for i in range(CHUNK_SIZE + 10)],
+            [i if i % 2 else float(i) for i in range(CHUNK_SIZE + 10)],
+        ]
+
+        for keys, values, priorities in zip(columns, reversed(columns), columns[1:] + columns[:1]):
+            # the format itself does not rely on the order of the records
+            records = list(zip(keys, values, priorities))
+            items = [(key, value) for key, value, _ in records]
+
+            file = io.BytesIO()
+            write(file, items)
+            file.seek(0)
+            self.assertEqual(read(file), (items, None))
+
+            file = io.BytesIO()
+            write(file, records, with_priorities=True)
+            file.seek(0)
+            read_items, read_priorities = read(file)
+            self.assertEqual(read_items, items)
+            self.assertEqual(read_priorities, [priority for _, _, priority in records])
+            self.assertEqual([type(key) for key, _ in read_items], [type(key) for key in keys])
+
+        file = io.BytesIO()
+        write(file, [])
+        self.assertEqual(read(io.BytesIO(file.getvalue())), ([], None))
+        self.assertRaises(ValueError, read, io.BytesIO(file.getvalue()[:-1]))
+        self.assertRaises(ValueError, read, io.BytesIO(b"PICKLE" + file.getvalue()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,19 +1,31 @@
 #!/usr/bin/python3
 
-from Dictionary import Dictionary
+from Dictionary import Dictionary, OrderStatistics
 
 import unittest
 import string
 import random
+import sys
+import io
 
 
 class SplayNode(object):
 
+    __slots__ = ('key', 'value', 'parent', 'left_son', 'right_son', 'weight_of_subtree')
+
     def __init__(self, key, value=None):
         self.key = key
         self.value = value
         self.parent = None
         self.left_son = self.right_son = None
+        self.weight_of_subtree = 1
+
+    # Assumes that his sons are already updated
+    def update_fields(self):
+
+        self.weight_of_subtree = 1
+        self.weight_of_subtree += self.left_son.weight_of_subtree if self.left_son is not None else 0
+        self.weight_of_subtree += self.right_son.weight_of_subtree if self.right_son is not None else 0
 
     def rotate_right(self, root=None):
 
@@ -31,6 +43,8 @@ class SplayNode(object):
             root = left_son
         left_son.parent = self.parent
         self.parent = left_son
+        self.update_fields()
+        left_son.update_fields()
 
         return root
 
@@ -50,6 +64,8 @@ class SplayNode(object):
             root = right_son
         right_son.parent = self.parent
         self.parent = right_son
+        self.update_fields()
+        right_son.update_fields()
 
         return root
 
@@ -63,11 +79,44 @@ class SplayNode(object):
                 parent.right_son = None
 
 
-class SplayTree(Dictionary):
+class SplayTree(Dictionary, OrderStatistics):
 
-    def __init__(self, root=None):
+    # How look_up restructures the tree:
+    #   "full"      splays the accessed node to the root
+    #   "semi"      semi-splays it, halving the depth of its path instead
+    #   "periodic"  fully splays only every splay_parameter-th access
+    #   "deep"      fully splays only the nodes found deeper than splay_parameter
+    #   "none"      never restructures, lookups are pure reads
+    SPLAY_POLICIES = ("full", "semi", "periodic", "deep", "none")
+
+    def __init__(self, root=None, splay_policy="full", splay_parameter=None):
         self._root = root
         self._size = 0
+        # the sum of the depths of the nodes met by look_up, and the number of lookups
+        self._access_depths = self._number_of_accesses = 0
+        self.set_splay_policy(splay_policy, splay_parameter)
+
+    def set_splay_policy(self, splay_policy, splay_parameter=None):
+        """ Chooses how look_up restructures the tree, see SPLAY_POLICIES.
+        :param splay_parameter: The period of "periodic" (default 2) or the depth threshold of "deep"
+                                (default 16), counting the root at depth 0.
+        """
+        if splay_policy not in SplayTree.SPLAY_POLICIES:
+            raise ValueError("Unknown splay policy: {}.".format(splay_policy))
+        if splay_parameter is None:
+            splay_parameter = {"periodic": 2, "deep": 16}.get(splay_policy)
+
+        self._splay_policy = splay_policy
+        self._splay_parameter = splay_parameter
+        self._accesses = 0
+
+    def _reads_mutate(self):
+        return self._splay_policy != "none"
+
+    def _with_root(self, root):
+        """ Returns a new splay tree with the given root and the splay policy of the current one.
+        """
+        return SplayTree(root, self._splay_policy, self._splay_parameter)
 
     def get_root(self):
         return self._root
@@ -99,71 +148,220 @@ class SplayTree(Dictionary):
                 else:  # parent.right_son == node
                     self._root = parent.rotate_left(self._root)
 
+    def semi_splay(self, node):
+        """ Moves node up with the semi-splaying of Sleator and Tarjan: a zig-zig step
+            rotates only the parent and continues from it, which halves the depth
+            of the access path with about half of the rotations of a splay.
+        """
+        while node.parent is not None:
+            parent = node.parent
+            grand_parent = parent.parent
+
+            if grand_parent is None:
+                if parent.left_son == node:
+                    self._root = parent.rotate_right(self._root)
+                else:
+                    self._root = parent.rotate_left(self._root)
+            elif grand_parent.left_son == parent and parent.left_son == node:
+                self._root = grand_parent.rotate_right(self._root)
+                node = parent
+            elif grand_parent.right_son == parent and parent.right_son == node:
+                self._root = grand_parent.rotate_left(self._root)
+                node = parent
+            elif grand_parent.left_son == parent:
+                self._root = parent.rotate_left(self._root)
+                self._root = grand_parent.rotate_right(self._root)
+            else:
+                self._root = parent.rotate_right(self._root)
+                self._root = grand_parent.rotate_left(self._root)
+
+    def _access(self, node, depth):
+        """ Restructures the tree after an access to node, found at the given depth.
+        """
+        splay_policy = self._splay_policy
+        if splay_policy == "none":
+            # the lookups of a static tree may run concurrently (see _reads_mutate), so they are not counted
+            return
+        self._access_depths += depth
+        self._number_of_accesses += 1
+
+        if splay_policy == "full":
+            self.splay(node)
+        elif splay_policy == "semi":
+            self.semi_splay(node)
+        elif splay_policy == "periodic":
+            self._accesses += 1
+            if self._accesses % self._splay_parameter == 0:
+                self.splay(node)
+        elif splay_policy == "deep":
+            if depth > self._splay_parameter:
+                self.splay(node)
+
+    def look_up(self, key):
+        """ Looks up a key, then restructures the tree according to the splay policy
+            (on a miss, around the last node visited).
+        """
+        node, parent = self._root, None
+        depth = 0
+        while node is not None:
+            if key == node.key:
+                break
+            parent = node
+            node = node.left_son if key < node.key else node.right_son
+            depth += 1
+
+        if node is not None:
+            value = node.value
+            self._access(node, depth)
+            return value
+        if parent is not None:
+            self._access(parent, depth - 1)
+        return None
+
     @staticmethod
     def _insert(node, key, value):
         if node is None:
             new_node = SplayNode(key, value)
             return new_node, new_node, True
 
-        if key == node.key:
-            node.value = value
-            return node, node, False
-        if key < node.key:
-            node.left_son, new_node, was_created = SplayTree._insert(node.left_son, key, value)
-            node.left_son.parent = node
-        else:
-            node.right_son, new_node, was_created = SplayTree._insert(node.right_son, key, value)
-            node.right_son.parent = node
-        return node, new_node, was_created
+        # descend iteratively, since an unsplayed path can be as long as the tree
+        root = node
+        while True:
+            if key == node.key:
+                node.value = value
+                return root, node, False
+            if key < node.key:
+                if node.left_son is None:
+                    new_node = SplayNode(key, value)
+                    new_node.parent = node
+                    node.left_son = new_node
+                    return root, new_node, True
+                node = node.left_son
+            else:
+                if node.right_son is None:
+                    new_node = SplayNode(key, value)
+                    new_node.parent = node
+                    node.right_son = new_node
+                    return root, new_node, True
+                node = node.right_son
 
     def insert(self, key, value=None):
+        self._version += 1
         self._root, new_node, was_created = SplayTree._insert(self._root, key, value)
         if was_created:
             self._size += 1
+            ancestor = new_node.parent
+            while ancestor is not None:
+                ancestor.weight_of_subtree += 1
+                ancestor = ancestor.parent
         self.splay(new_node)
 
     def erase(self, key):
 
+        self._version += 1
         node_to_be_erased, node_to_be_splayed = Dictionary._find(self._root, key, None)
-        if node_to_be_erased is not None:
-            self._size -= 1
-
-            node_to_be_replaced = Dictionary._get_left_most(node_to_be_erased.right_son)
-            if node_to_be_replaced is None:
-                node_to_be_replaced = node_to_be_erased
-
-            node_to_be_erased.key, node_to_be_erased.value = node_to_be_replaced.key, node_to_be_replaced.value
-            if node_to_be_replaced.left_son is not None:
-                node_to_be_replaced.key, node_to_be_replaced.value = node_to_be_replaced.left_son.key, node_to_be_replaced.left_son.value
-                node_to_be_replaced.left_son.detach()
-            elif node_to_be_replaced.right_son is not None:
-                node_to_be_replaced.key, node_to_be_replaced.value = node_to_be_replaced.right_son.key, node_to_be_replaced.right_son.value
-                node_to_be_replaced.right_son.detach()
-            else:
-                if node_to_be_replaced.parent is not None:
-                    node_to_be_replaced.detach()
-                else:
-                    self._root = None
+        if node_to_be_erased is None:
+            if node_to_be_splayed is not None:
+                self.splay(node_to_be_splayed)
+            return
+
+        self._size -= 1
+
+        # bring the node to the root, then join its two subtrees
+        self.splay(node_to_be_erased)
+        left_son, right_son = node_to_be_erased.left_son, node_to_be_erased.right_son
+        if left_son is None:
+            self._root = right_son
+        else:
+            left_son.parent = None
+            self._root = left_son
+            self.splay(Dictionary._get_right_most(left_son))
+            self._root.right_son = right_son
+            if right_son is not None:
+                right_son.parent = self._root
+            self._root.update_fields()
+
+        if self._root is not None:
+            self._root.parent = None
+
+    @staticmethod
+    def _build(items, low, high, parent):
+        if low >= high:
+            return None
 
-        if node_to_be_splayed is not None:
-            self.splay(node_to_be_splayed)
+        middle = (low + high) // 2
+        node = SplayNode(*items[middle])
+        node.parent = parent
+        node.left_son = SplayTree._build(items, low, middle, node)
+        node.right_son = SplayTree._build(items, middle + 1, high, node)
+        node.update_fields()
+
+        return node
+
+    @classmethod
+    def from_sorted(cls, items):
+        items = Dictionary._check_sorted(items)
+
+        tree = cls(SplayTree._build(items, 0, len(items), None))
+        tree._size = len(items)
+        return tree
 
     def split(self, key):
-        self.insert(key)
-        t1, t2 = SplayTree(self._root.left_son), SplayTree(self._root.right_son)
-        t1._size, t2._size = len(t1.keys()), len(t2.keys())
+        """ Splits the tree into the keys lower than or equal to key and the higher ones.
+            The current tree is left empty.
+        """
+        node, parent = Dictionary._find(self._root, key)
+        if node is None:
+            node = parent
+        if node is None:
+            return self._with_root(None), self._with_root(None)
+
+        self.splay(node)
+        root = self._root
+        if key < root.key:
+            lower_root, higher_root = root.left_son, root
+            root.left_son = None
+        else:
+            lower_root, higher_root = root, root.right_son
+            root.right_son = None
+        root.update_fields()
+
+        t1, t2 = self._with_root(lower_root), self._with_root(higher_root)
+        for tree in (t1, t2):
+            if tree._root is not None:
+                tree._root.parent = None
+                tree._size = tree._root.weight_of_subtree
+
+        self._root, self._size = None, 0
+        self._version += 1
         return t1, t2
 
     def join(self, other_splay_tree):
-        if other_splay_tree is None:
-            return self
-
-        other_splay_tree.splay(Dictionary._get_left_most(other_splay_tree.get_root()))
-        new_root = other_splay_tree.get_root()
-        new_root.left_son = self._root
-
-        new_splay_tree = SplayTree(new_root)
-        new_splay_tree._size = self.size() + other_splay_tree.size()
+        """ Joins the tree with another one whose keys are all higher.
+            Both trees are left empty.
+        """
+        if other_splay_tree is None or other_splay_tree.get_root() is None:
+            new_splay_tree = self._with_root(self._root)
+        elif self._root is None:
+            new_splay_tree = self._with_root(other_splay_tree.get_root())
+        else:
+            if not Dictionary._get_right_most(self._root).key < Dictionary._get_left_most(other_splay_tree.get_root()).key:
+                raise ValueError("All keys from the current splay tree must be lower than those of the argument splay tree.")
+
+            other_splay_tree.splay(Dictionary._get_left_most(other_splay_tree.get_root()))
+            new_root = other_splay_tree.get_root()
+            new_root.left_son = self._root
+            self._root.parent = new_root
+            new_root.update_fields()
+
+            new_splay_tree = self._with_root(new_root)
+
+        new_splay_tree._size = self.size() + (other_splay_tree.size() if other_splay_tree is not None else 0)
+        self._root, self._size = None, 0
+        self._version += 1
+        if other_splay_tree is not None:
+            other_splay_tree._root, other_splay_tree._size = None, 0
+            other_splay_tree._version += 1
         return new_splay_tree
 
     def __add__(self, other):
@@ -173,8 +371,16 @@ class SplayTree(Dictionary):
     def size(self):
         return self._size
 
-    def choose_element(self):
-        return random.choice(self.items())
+    def tree_stats(self):
+        """ Adds to the metrics of Dictionary.tree_stats the average depth (the root being at
+            depth 0) of the nodes met by the lookups so far, None before the first one. The
+            lookups are not counted with the "none" policy, see _access.
+            Complexity: O(log n)
+        """
+        stats = Dictionary.tree_stats(self)
+        stats["average_access_depth"] = (self._access_depths / self._number_of_accesses
+                                         if self._number_of_accesses else None)
+        return stats
 
 
 ########################## Testing
@@ -192,6 +398,7 @@ class TestSplayOperations(unittest.TestCase):
             value = ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(50))
             # self.splay.insert(key, value)
             self.splay[key] = value
+        self.number_of_keys = len(self.splay.keys())
 
     @staticmethod
     def is_sorted(L):
@@ -213,6 +420,27 @@ class TestSplayOperations(unittest.TestCase):
 
         # the items list must be sorted by keys
         self.assertTrue(TestSplayOperations.is_sorted(self.splay.keys()))
+        self.assertEqual(len(self.splay.keys()), self.number_of_keys - number_of_deletions)
+        self.assertEqual(self.splay.size(), self.number_of_keys - number_of_deletions)
+
+    def test_order_statistics(self):
+
+        for i in range(50):
+            self.splay.erase(random.choice(self.splay.keys()))
+        self.splay.erase(0)
+        keys = self.splay.keys()
+        self.assertTrue(all(node.weight_of_subtree == 1 + sum(son.weight_of_subtree for son in (node.left_son, node.right_son)
+                                                              if son is not None)
+                            for node in self.splay._iter_nodes(self.splay.get_root())))
+
+        for k in random.sample(range(len(keys)), 200):
+            self.assertEqual(self.splay.select(k), keys[k])
+            self.assertEqual(self.splay.rank(keys[k]), k)
+        self.assertEqual(self.splay.get_kth_element(len(keys) - 1)[0], keys[-1])
+
+        t1, t2 = self.splay.split(keys[100])
+        self.assertEqual((t1.size(), t2.size()), (101, len(keys) - 101))
+        self.assertEqual(t2.select(0), keys[101])
 
     def test_split_and_join(self):
 
@@ -228,10 +456,156 @@ class TestSplayOperations(unittest.TestCase):
         self.assertTrue(all(current_key <= k for current_key in t1.keys()))
         self.assertTrue(all(current_key > k  for current_key in t2.keys()))
 
+        # the split key stays in the lower tree
+        self.assertEqual(t1.keys()[-1], k)
+        self.assertEqual(t1.size() + t2.size(), self.number_of_keys)
+
         # Test the join
         t = t1 + t2
         # the items lists must be sorted by keys
         self.assertTrue(TestSplayOperations.is_sorted(t.keys()))
+        self.assertEqual(t.size(), self.number_of_keys)
+        self.assertEqual(len(t.keys()), self.number_of_keys)
+
+    def test_cursor(self):
+
+        keys = self.splay.keys()
+        cursor = self.splay.find_cursor(keys[-1])
+        for key in reversed(keys):
+            self.assertEqual(cursor.key, key)
+            cursor.prev()
+        self.assertFalse(cursor.valid)
+
+        self.assertTrue(cursor.seek(keys[0]))
+        for next_key in keys[1:200]:
+            self.assertTrue(cursor.seek(cursor.key + 1))
+            self.assertEqual(cursor.key, next_key)
+
+    @staticmethod
+    def depth(tree, key):
+        node, depth = tree.get_root(), 0
+        while node.key != key:
+            node = node.left_son if key < node.key else node.right_son
+            depth += 1
+        return depth
+
+    def test_splay_policies(self):
+
+        items = self.splay.items()
+        key = items[0][0]
+        for splay_policy in SplayTree.SPLAY_POLICIES:
+            tree = SplayTree.from_sorted(items)
+            tree.set_splay_policy(splay_policy, 3 if splay_policy == "periodic" else None)
+
+            initial_depth = TestSplayOperations.depth(tree, key)
+            self.assertEqual(tree.look_up(key), items[0][1])
+            depth = TestSplayOperations.depth(tree, key)
+
+            if splay_policy == "full":
+                self.assertEqual(depth, 0)
+            elif splay_policy == "semi":
+                self.assertTrue(0 < depth <= initial_depth // 2 + 1)
+            elif splay_policy == "periodic":
+                self.assertEqual(depth, initial_depth)
+                tree[key], tree[key]
+                self.assertEqual(TestSplayOperations.depth(tree, key), 0)
+            else:
+                # the key is in the (shallow) balanced tree, so "deep" leaves it in place too
+                self.assertEqual(depth, initial_depth)
+
+            for i in range(1000):
+                tree.look_up(random.randint(1, 1000000))
+            self.assertEqual(tree.items(), items)
+            self.assertTrue(all(node.weight_of_subtree == 1 + sum(son.weight_of_subtree for son in (node.left_son, node.right_son)
+                                                                  if son is not None)
+                                for node in tree._iter_nodes(tree.get_root())))
+            self.assertTrue(all(node.parent.left_son is node or node.parent.right_son is node
+                                for node in tree._iter_nodes(tree.get_root()) if node is not tree.get_root()))
+
+        # a missing key splays the last node of its search path
+        self.splay.look_up(0)
+        self.assertEqual(self.splay.get_root().key, items[0][0])
+
+        chain = SplayTree(splay_policy="deep", splay_parameter=100)
+        for key in range(1000):
+            chain.insert(key)
+        chain.look_up(900)
+        self.assertEqual(chain.get_root().key, 999)
+        chain.look_up(0)
+        self.assertEqual(chain.get_root().key, 0)
+
+        self.assertRaises(ValueError, SplayTree, None, "sometimes")
+
+    def test_from_sorted(self):
+
+        items = self.splay.items()
+        built = SplayTree.from_sorted(items)
+        self.assertEqual(built.items(), items)
+        self.assertEqual(built.size(), len(items))
+        self.assertEqual(built.get_height(), len(items).bit_length())
+        self.assertTrue(all(node.parent.left_son is node or node.parent.right_son is node
+                            for node in built._iter_nodes(built._root) if node is not built._root))
+
+        self.assertRaises(ValueError, SplayTree.from_sorted, [(1, None), (1, None)])
+
+    def test_irange(self):
+
+        keys = self.splay.keys()
+        for i in range(100):
+            low, high = sorted(random.sample(keys, 2))
+            expected = [(key, self.splay[key]) for key in keys if low <= key < high]
+
+            self.assertEqual(list(self.splay.irange(low, high, (True, False))), expected)
+            self.assertEqual(list(self.splay.irange(low, high, (True, False), reverse=True)), expected[::-1])
+
+        self.assertEqual(list(self.splay.irange(low=keys[-2], inclusive=(False, True))), [(keys[-1], self.splay[keys[-1]])])
+
+    def test_tree_stats(self):
+
+        self.assertIsNone(self.splay.tree_stats()["average_access_depth"])
+
+        key = random.choice(self.splay.keys())
+        node, depth = self.splay.get_root(), 0
+        while node.key != key:
+            node = node.left_son if key < node.key else node.right_son
+            depth += 1
+        self.splay.look_up(key)
+        self.splay.look_up(key)
+
+        stats = self.splay.tree_stats()
+        self.assertEqual(stats["average_access_depth"], depth / 2)
+
+        static_tree = SplayTree.from_sorted(self.splay.items())
+        static_tree.set_splay_policy("none")
+        static_tree.look_up(key)
+        self.assertIsNone(static_tree.tree_stats()["average_access_depth"])
+        self.assertEqual(stats["size"], self.number_of_keys)
+        self.assertLessEqual(stats["max_depth_lower_bound"], self.splay.get_height())
+
+    def test_degenerate_tree(self):
+
+        # increasing insertions leave a path as long as the tree
+        chain = SplayTree()
+        number_of_keys = 5 * sys.getrecursionlimit()
+        for key in range(number_of_keys):
+            chain.insert(key, str(key))
+        self.assertEqual(chain.get_height(), number_of_keys)
+        # without walking down the chain
+        self.assertEqual(chain.tree_stats()["max_depth_lower_bound"], 4 * number_of_keys.bit_length() + 4)
+
+        # dump walks the chain iteratively and load rebuilds it balanced
+        file = io.BytesIO()
+        chain.dump(file)
+        file.seek(0)
+        balanced = SplayTree.load(file)
+        self.assertEqual(balanced.keys(), list(range(number_of_keys)))
+        self.assertEqual(balanced.get_height(), number_of_keys.bit_length())
+
+        chain.insert(-1)
+        self.assertEqual(list(chain), list(range(-1, number_of_keys)))
+        self.assertEqual(next(chain.reversed()), (number_of_keys - 1, str(number_of_keys - 1)))
+        self.assertEqual(chain.look_up(0), "0")
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
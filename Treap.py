@@ -1,15 +1,81 @@
 #!/usr/bin/python3
 
-from Dictionary import Dictionary
+from Dictionary import Dictionary, OrderStatistics
+import Snapshot
+import operator
 import random
 
 import unittest
 import string
+import io
+
+
+def _min(first, second):
+    return first if second is None or (first is not None and first <= second) else second
+
+
+def _max(first, second):
+    return first if second is None or (first is not None and first >= second) else second
+
+
+class Monoid(object):
+    """ An associative operation with an identity element, which a treap can aggregate
+        over the values of every subtree, see Treap.add_augmentation.
+    """
+
+    __slots__ = ('combine', 'identity', 'lift', 'add')
+
+    def __init__(self, combine, identity, lift=None, add=None):
+        """
+        :param combine: The associative operation, called as combine(lower_aggregate, higher_aggregate).
+        :param identity: The aggregate of no values.
+        :param lift: Maps a value to its own aggregate (the value itself by default).
+        :param add: Optional add(aggregate, delta, count), the aggregate of count values once delta
+                    is added to each of them; Treap.range_add needs it.
+        """
+        self.combine = combine
+        self.identity = identity
+        self.lift = lift if lift is not None else (lambda value: value)
+        self.add = add
+
+    def power(self, aggregate, count):
+        """ Combines count copies of an aggregate, by repeated squaring.
+            Complexity: O(log count) combinations
+        """
+        result = self.identity
+        while count:
+            if count & 1:
+                result = self.combine(result, aggregate)
+            aggregate = self.combine(aggregate, aggregate)
+            count >>= 1
+        return result
+
+    @staticmethod
+    def sum():
+        return Monoid(operator.add, 0, add=lambda aggregate, delta, count: aggregate + delta * count)
+
+    @staticmethod
+    def min():
+        return Monoid(_min, None, add=lambda aggregate, delta, count: aggregate + delta)
+
+    @staticmethod
+    def max():
+        return Monoid(_max, None, add=lambda aggregate, delta, count: aggregate + delta)
+
+    @staticmethod
+    def count_if(predicate):
+        return Monoid(operator.add, 0, lambda value: 1 if predicate(value) else 0)
 
 
 class _TreapNode(object):
 
-    def __init__(self, key, value, left_son=None, right_son=None, priority=None):
+    __slots__ = ('key', 'value', 'priority', 'left_son', 'right_son',
+                 'weight_of_subtree', 'min_key', 'max_key')
+
+    # only the nodes of the augmented treaps have room for augmentations, see _AugmentedTreapNode
+    augmentations = aggregates = ()
+
+    def __init__(self, key, value, left_son=None, right_son=None, priority=None, augmentations=()):
 
         self.key = key
         self.value = value
@@ -33,6 +99,19 @@ class _TreapNode(object):
             self.min_key = min(self.min_key, right_son.min_key)
             self.max_key = max(self.max_key, right_son.max_key)
 
+    def _aggregate(self):
+        """ Combines the aggregates of the sons with the value of the node, in the order of the keys.
+        """
+        aggregates = []
+        for index, (_, monoid) in enumerate(self.augmentations):
+            aggregate = monoid.lift(self.value)
+            if self.left_son is not None:
+                aggregate = monoid.combine(self.left_son.aggregates[index], aggregate)
+            if self.right_son is not None:
+                aggregate = monoid.combine(aggregate, self.right_son.aggregates[index])
+            aggregates.append(aggregate)
+        return tuple(aggregates)
+
     def rotate_right(self):
 
         his_left_node = self.left_son
@@ -66,11 +145,137 @@ class _TreapNode(object):
             self.min_key = min(self.min_key, self.right_son.min_key)
             self.max_key = max(self.max_key, self.right_son.max_key)
 
+        if self.augmentations:
+            self.aggregates = self._aggregate()
+
+
+class _AugmentedTreapNode(_TreapNode):
+    """ A treap node which also holds the aggregates of its subtree under the monoids
+    of the augmentations of its treap.
+
+    Only these nodes have room for them, so the nodes of a treap are replaced by
+    copies when it first gets an augmentation, see Treap._refresh_nodes.
+    """
+
+    __slots__ = ('augmentations', 'aggregates')
+
+    def __init__(self, key, value, left_son=None, right_son=None, priority=None, augmentations=()):
+        _TreapNode.__init__(self, key, value, left_son, right_son, priority)
+        # the (name, monoid) pairs of the treap, shared by all its nodes
+        self.augmentations = augmentations
+        self.aggregates = self._aggregate()
+
+
+_left_son_slot = _TreapNode.left_son
+_right_son_slot = _TreapNode.right_son
+
 
-class Treap(Dictionary):
+class _LazyTreapNode(_TreapNode):
+    """ A treap node which can hold a range update pending for its sons.
+
+    A tag (assigned, assigned_value, delta) stands for "replace every value by
+    assigned_value if assigned, then add delta". It is already applied to the
+    value and the aggregates of its node, and gets pushed to the sons before
+    they are read or replaced, so that every descent, including the ones of the
+    generic algorithms of Dictionary, only meets up to date nodes.
+
+    Only these nodes have room for a tag, so the nodes of a treap are replaced by
+    copies when it first gets a range update, see Treap._refresh_nodes.
+    """
+
+    __slots__ = ('tag',)
+
+    def __init__(self, key, value, left_son=None, right_son=None, priority=None, augmentations=()):
+        # the range update pending for the sons, read as soon as they are assigned
+        self.tag = None
+        _TreapNode.__init__(self, key, value, left_son, right_son, priority, augmentations)
+
+    @staticmethod
+    def _compose(tag, later_tag):
+        if tag is None or later_tag[0]:
+            return later_tag
+        assigned, assigned_value, delta = tag
+        return assigned, assigned_value, delta + later_tag[2]
+
+    @staticmethod
+    def _updated(value, tag):
+        assigned, assigned_value, delta = tag
+        if assigned:
+            value = assigned_value
+        return value + delta if delta else value
+
+    def _apply(self, tag):
+        """ Applies a range update to the whole subtree, leaving it pending for the sons.
+            Complexity: O(1), besides the monoids
+        """
+        self.value = _LazyTreapNode._updated(self.value, tag)
+
+        if self.augmentations:
+            if tag[0]:
+                new_value = _LazyTreapNode._updated(None, tag)
+                self.aggregates = tuple(monoid.power(monoid.lift(new_value), self.weight_of_subtree)
+                                        for _, monoid in self.augmentations)
+            else:
+                self.aggregates = tuple(monoid.add(aggregate, tag[2], self.weight_of_subtree)
+                                        for (_, monoid), aggregate in zip(self.augmentations, self.aggregates))
+
+        if _left_son_slot.__get__(self) is not None or _right_son_slot.__get__(self) is not None:
+            self.tag = _LazyTreapNode._compose(self.tag, tag)
+
+    def _push(self):
+        tag = self.tag
+        if tag is not None:
+            self.tag = None
+            for son in (_left_son_slot.__get__(self), _right_son_slot.__get__(self)):
+                if son is not None:
+                    son._apply(tag)
+
+    def _get_left_son(self):
+        self._push()
+        return _left_son_slot.__get__(self)
+
+    def _set_left_son(self, son):
+        self._push()
+        _left_son_slot.__set__(self, son)
+
+    def _get_right_son(self):
+        self._push()
+        return _right_son_slot.__get__(self)
+
+    def _set_right_son(self, son):
+        self._push()
+        _right_son_slot.__set__(self, son)
+
+    left_son = property(_get_left_son, _set_left_son)
+    right_son = property(_get_right_son, _set_right_son)
+
+
+class _LazyAugmentedTreapNode(_LazyTreapNode):
+    """ A lazy treap node with room for augmentations, like _AugmentedTreapNode.
+    """
+
+    __slots__ = ('augmentations', 'aggregates')
+
+    def __init__(self, key, value, left_son=None, right_son=None, priority=None, augmentations=()):
+        _LazyTreapNode.__init__(self, key, value, left_son, right_son, priority)
+        self.augmentations = augmentations
+        self.aggregates = self._aggregate()
+
+
+class Treap(Dictionary, OrderStatistics):
 
     def __init__(self, root=None):
         self._root = root
+        self._augmentations = root.augmentations if root is not None else ()
+        self._node_type = type(root) if root is not None else _TreapNode
+
+    def _with_root(self, root):
+        """ Returns a new treap with the given root, the augmentations and the node type of the current one.
+        """
+        treap = Treap(root)
+        treap._augmentations = self._augmentations
+        treap._node_type = self._node_type
+        return treap
 
     def get_root(self):
         return self._root
@@ -92,20 +297,21 @@ class Treap(Dictionary):
 
     # Support insertion
     @staticmethod
-    def _insert(node, key, value, _priority):
+    def _insert(node, key, value, _priority, augmentations=(), node_type=_TreapNode):
 
         if node is None:
-            return _TreapNode(key, value, priority=_priority)
+            return node_type(key, value, priority=_priority, augmentations=augmentations)
 
         if node.key == key:
             # replace the old value with the new one
             node.value = value
+            node.update_fields()
             return node
 
         if node.key > key:
-            node.left_son = Treap._insert(node.left_son, key, value, _priority)
+            node.left_son = Treap._insert(node.left_son, key, value, _priority, augmentations, node_type)
         else:
-            node.right_son = Treap._insert(node.right_son, key, value, _priority)
+            node.right_son = Treap._insert(node.right_son, key, value, _priority, augmentations, node_type)
 
         node = Treap._balance(node)
         node.update_fields()
@@ -114,7 +320,68 @@ class Treap(Dictionary):
 
     def insert(self, key, value=None, priority=None):
 
-        self._root = Treap._insert(self._root, key, value, priority)
+        self._version += 1
+        self._root = Treap._insert(self._root, key, value, priority, self._augmentations, self._node_type)
+
+    def _assign_value(self, path, value):
+        self._version += 1
+        path[-1].value = value
+        if self._augmentations:
+            for node in reversed(path):
+                node.update_fields()
+
+    @classmethod
+    def from_sorted(cls, items, priorities=None):
+        """ Builds the Cartesian tree of the items, keeping its right spine on a stack.
+            Complexity: O(n)
+        :param items: (key, value) pairs sorted by strictly increasing keys.
+        :param priorities: Optional priorities of the items; random ones are drawn otherwise.
+        """
+        items = Dictionary._check_sorted(items)
+        if priorities is None:
+            priorities = [None] * len(items)
+        elif len(priorities) != len(items):
+            raise ValueError("There must be exactly one priority for each item.")
+
+        right_spine = []
+        for (key, value), priority in zip(items, priorities):
+            node = _TreapNode(key, value, priority=priority)
+
+            # the nodes with lower priorities become the left subtree of the new one
+            last_popped = None
+            while right_spine and right_spine[-1].priority < node.priority:
+                last_popped = right_spine.pop()
+                last_popped.update_fields()
+            node.left_son = last_popped
+
+            if right_spine:
+                right_spine[-1].right_son = node
+            right_spine.append(node)
+
+        root = None
+        while right_spine:
+            root = right_spine.pop()
+            root.update_fields()
+
+        return cls(root)
+
+    def dump(self, file, priorities=False):
+        """ Streams the (key, value) pairs to a binary file, see Dictionary.dump.
+        :param priorities: Whether to save the priorities too, so that load rebuilds the same treap.
+        """
+        if not priorities:
+            return Dictionary.dump(self, file)
+        Snapshot.write(file, ((node.key, node.value, node.priority) for node in Dictionary._iter_nodes(self._root)),
+                       with_priorities=True)
+
+    @classmethod
+    def load(cls, file):
+        """ Restores a treap written by dump, with its priorities if they were saved.
+            WARNING: only for trusted files, see Dictionary.load.
+            Complexity: O(n)
+        """
+        items, priorities = Snapshot.read(file)
+        return cls.from_sorted(items, priorities)
 
     # Support erasing
     @staticmethod
@@ -146,86 +413,480 @@ class Treap(Dictionary):
 
     def erase(self, key):
 
+        self._version += 1
         self._root = Treap._erase(self._root, key)
 
     # Support split
-    def split(self, key):
-        key += 0.5
-        self.insert(key, None, 1)
-
-        root_lower, root_higher = self._root.left_son, self._root.right_son
-        del self._root
+    @staticmethod
+    def _split(node, key):
+        """ Splits the subtree of node into the keys lower than or equal to key and the higher ones.
+            Complexity: O(log n)
+        """
+        if node is None:
+            return None, None
 
-        return Treap(root_lower), Treap(root_higher)
+        if key < node.key:
+            lower, node.left_son = Treap._split(node.left_son, key)
+            node.update_fields()
+            return lower, node
+        else:
+            node.right_son, higher = Treap._split(node.right_son, key)
+            node.update_fields()
+            return node, higher
 
-    # Support join
-    def join(self, treap_higher):
-        if self.get_max_key() > treap_higher.get_min_key():
-            raise ValueError("All keys from the current treap must be lower than those of the argument treap.")
+    @staticmethod
+    def _split_out(node, key):
+        """ Splits the subtree of node into the keys lower than key, the node holding key
+            (or None) and the keys higher than key.
+            Complexity: O(log n)
+        """
+        if node is None:
+            return None, None, None
 
-        middle_key = self.get_max_key() + 0.5
+        if key < node.key:
+            lower, equal, node.left_son = Treap._split_out(node.left_son, key)
+            node.update_fields()
+            return lower, equal, node
+        if node.key < key:
+            node.right_son, equal, higher = Treap._split_out(node.right_son, key)
+            node.update_fields()
+            return node, equal, higher
+
+        lower, higher = node.left_son, node.right_son
+        node.left_son = node.right_son = None
+        node.update_fields()
+        return lower, node, higher
 
-        joining_root = _TreapNode(middle_key, None, self._root, treap_higher.get_root())
-        join_treap = Treap(joining_root)
-        join_treap.erase(middle_key)
+    def split(self, key):
+        """ Splits the treap into the keys lower than or equal to key and the higher ones.
+            The nodes are moved to the two new treaps, leaving the current one empty.
+            Complexity: O(log n)
+        """
+        root_lower, root_higher = Treap._split(self._root, key)
+        self._root = None
+        self._version += 1
 
-        return join_treap
+        return self._with_root(root_lower), self._with_root(root_higher)
 
-    def __add__(self, other):
-        return self.join(other)
+    # Support join
+    @staticmethod
+    def _merge(lower, higher):
+        """ Merges two subtrees, all the keys of lower being lower than those of higher.
+            Complexity: O(log n)
+        """
+        if lower is None:
+            return higher
+        if higher is None:
+            return lower
+
+        if lower.priority >= higher.priority:
+            lower.right_son = Treap._merge(lower.right_son, higher)
+            lower.update_fields()
+            return lower
+        else:
+            higher.left_son = Treap._merge(lower, higher.left_son)
+            higher.update_fields()
+            return higher
 
-    # Specific queries
+    @staticmethod
+    def merge(treap_lower, treap_higher):
+        """ Merges two treaps, all the keys of the first one being lower than those of the second one.
+            The nodes are moved to the new treap, leaving both arguments empty.
+            Complexity: O(log n)
+        """
+        root_lower, root_higher = treap_lower.get_root(), treap_higher.get_root()
+        if root_lower is not None and root_higher is not None and not root_lower.max_key < root_higher.min_key:
+            raise ValueError("All keys from the current treap must be lower than those of the argument treap.")
+        augmentations = Treap._joint_augmentations(treap_lower, treap_higher)
+        Treap._match_node_types(treap_lower, treap_higher)
+
+        root_lower, root_higher = treap_lower.get_root(), treap_higher.get_root()
+        treap_lower._root = treap_higher._root = None
+        treap_lower._version += 1
+        treap_higher._version += 1
+        treap = treap_lower._with_root(Treap._merge(root_lower, root_higher))
+        treap._augmentations = augmentations
+        treap._node_type = Treap._choose_node_type(treap._is_lazy(), bool(augmentations))
+        return treap
 
-    def size(self):
-        return self._root.weight_of_subtree
+    def join(self, treap_higher):
+        return Treap.merge(self, treap_higher)
 
-    def choose_element(self):
-        return self.get_kth_element(random.randint(0, self.size() - 1))
+    def __add__(self, other):
+        return self.join(other)
 
+    # Set algebra
     @staticmethod
-    def _get_min_key(node):
-        if node.left_son is not None:
-            return Treap._get_min_key(node.left_son)
+    def _union(first, second):
+        if first is None:
+            return second
+        if second is None:
+            return first
+
+        if first.priority >= second.priority:
+            lower, equal, higher = Treap._split_out(second, first.key)
+            if equal is not None:
+                first.value = equal.value
+            first.left_son = Treap._union(first.left_son, lower)
+            first.right_son = Treap._union(first.right_son, higher)
+            first.update_fields()
+            return first
         else:
-            return node.key
+            lower, equal, higher = Treap._split_out(first, second.key)
+            second.left_son = Treap._union(lower, second.left_son)
+            second.right_son = Treap._union(higher, second.right_son)
+            second.update_fields()
+            return second
 
-    def get_min_key(self):
-        if self._root is None:
+    @staticmethod
+    def _intersection(first, second):
+        if first is None or second is None:
             return None
+
+        # the node with the higher priority is the only one that can become the root
+        if first.priority >= second.priority:
+            lower, equal, higher = Treap._split_out(second, first.key)
+            root = first if equal is not None else None
+            left_son = Treap._intersection(first.left_son, lower)
+            right_son = Treap._intersection(first.right_son, higher)
         else:
-            return Treap._get_min_key(self._root)
+            lower, equal, higher = Treap._split_out(first, second.key)
+            root = second if equal is not None else None
+            if root is not None:
+                root.value = equal.value
+            left_son = Treap._intersection(lower, second.left_son)
+            right_son = Treap._intersection(higher, second.right_son)
+
+        if root is None:
+            return Treap._merge(left_son, right_son)
+        root.left_son, root.right_son = left_son, right_son
+        root.update_fields()
+        return root
 
     @staticmethod
-    def _get_max_key(node):
-        if node.right_son is not None:
-            return Treap._get_max_key(node.right_son)
+    def _difference(first, second):
+        if first is None or second is None:
+            return first
+
+        if first.priority >= second.priority:
+            lower, equal, higher = Treap._split_out(second, first.key)
+            left_son = Treap._difference(first.left_son, lower)
+            right_son = Treap._difference(first.right_son, higher)
+            if equal is not None:
+                return Treap._merge(left_son, right_son)
+            first.left_son, first.right_son = left_son, right_son
+            first.update_fields()
+            return first
         else:
-            return node.key
+            lower, equal, higher = Treap._split_out(first, second.key)
+            return Treap._merge(Treap._difference(lower, second.left_son),
+                                Treap._difference(higher, second.right_son))
+
+    def _set_operation(self, operation, other, augmentations=None):
+        if augmentations is None:
+            augmentations = Treap._joint_augmentations(self, other)
+        Treap._match_node_types(self, other)
+        root = operation(self._root, other.get_root())
+        self._root = other._root = None
+        self._version += 1
+        other._version += 1
+
+        treap = self._with_root(root)
+        treap._augmentations = augmentations
+        treap._node_type = Treap._choose_node_type(treap._is_lazy(), bool(augmentations))
+        return treap
+
+    def union(self, other):
+        """ Returns the treap with the keys of both treaps; the values of other take precedence.
+            The nodes are moved to the new treap, leaving both operands empty.
+            Complexity: O(m log(n/m + 1)), m being the size of the smaller treap
+        """
+        return self._set_operation(Treap._union, other)
+
+    def intersection(self, other):
+        """ Returns the treap with the keys found in both treaps, with the values of the current one.
+            The nodes are moved to the new treap, leaving both operands empty.
+            Complexity: O(m log(n/m + 1)), m being the size of the smaller treap
+        """
+        return self._set_operation(Treap._intersection, other)
+
+    def difference(self, other):
+        """ Returns the treap with the keys of the current treap which are not found in other.
+            The nodes are moved to the new treap, leaving both operands empty.
+            Complexity: O(m log(n/m + 1)), m being the size of the smaller treap
+        """
+        # only the nodes of the current treap are kept, so other needs no augmentations
+        return self._set_operation(Treap._difference, other, self._augmentations)
+
+    # Bulk updates
+
+    # A batch is built into a treap of its own once m log(n + m) exceeds this many times m (log(n/m + 1) + 1),
+    # the cost of the set operation plus that of sorting and building the batch
+    _SET_OPERATION_FACTOR = 1.3
+
+    def _set_operation_is_cheaper(self, batch_size):
+        size = self.size()
+        return batch_size > 0 and ((size + batch_size + 1).bit_length() >
+                                   self._SET_OPERATION_FACTOR * ((size // batch_size + 1).bit_length() + 1))
+
+    def insert_many(self, items):
+        """ Inserts a batch of (key, value) pairs; the last pair wins for repeated keys.
+            Large batches are built into a treap of their own, which is united with this one.
+            Complexity: O(m log m + m log(n/m + 1))
+        """
+        items = list(items)
+        if not self._set_operation_is_cheaper(len(items)):
+            for key, value in items:
+                self.insert(key, value)
+            return
+
+        batch = Treap.from_sorted(Dictionary._sort_batch(items))
+        batch._augmentations, batch._node_type = self._augmentations, self._node_type
+        batch._refresh_nodes()
+        self._version += 1
+        self._root = Treap._union(self._root, batch.get_root())
+
+    def erase_many(self, keys):
+        """ Erases a batch of keys, ignoring the missing ones.
+            Large batches are built into a treap of their own, which is subtracted from this one.
+            Complexity: O(m log m + m log(n/m + 1))
+        """
+        keys = list(keys)
+        if not self._set_operation_is_cheaper(len(keys)):
+            for key in keys:
+                self.erase(key)
+            return
+
+        batch = Treap.from_sorted((key, None) for key in sorted(set(keys)))
+        self._version += 1
+        self._root = Treap._difference(self._root, batch.get_root())
+
+    # Augmentations
+    @staticmethod
+    def _joint_augmentations(first, second):
+        """ Returns the augmentations of two treaps about to be combined, which must be the same
+            unless one of the treaps is empty or has none (its nodes then get those of the other one).
+        """
+        if first.get_root() is None:
+            return second._augmentations
+        if second.get_root() is None:
+            return first._augmentations
+
+        if first._augmentations != second._augmentations:
+            if first._augmentations and second._augmentations:
+                raise ValueError("The treaps must have the same augmentations.")
+            for treap in (first, second):
+                if not treap._augmentations:
+                    treap._augmentations = first._augmentations or second._augmentations
+                    treap._refresh_nodes()
+        return first._augmentations
 
-    def get_max_key(self):
-        if self._root is None:
-            return None
-        else:
-            return Treap._get_max_key(self._root)
+    @staticmethod
+    def _match_node_types(first, second):
+        """ Makes the nodes of two treaps about to be combined lazy if those of either one are.
+        """
+        if first._is_lazy() != second._is_lazy():
+            first._make_lazy()
+            second._make_lazy()
 
     @staticmethod
-    def _get_kth_element(node, k):
+    def _choose_node_type(lazy, augmented):
+        """ Returns the node type with room for pending range updates if lazy,
+            and for aggregates if augmented, so that the other nodes stay small.
+        """
+        if lazy:
+            return _LazyAugmentedTreapNode if augmented else _LazyTreapNode
+        return _AugmentedTreapNode if augmented else _TreapNode
+
+    def _refresh_nodes(self):
+        """ Gives the augmentations of the treap and the matching node type to all its nodes,
+            recomputing their aggregates from the leaves up. The node types having different
+            slots, the nodes of another type are replaced by copies, so the root must be read again.
+            Complexity: O(n)
+        """
+        augmentations = self._augmentations
+        self._node_type = node_type = Treap._choose_node_type(self._is_lazy(), bool(augmentations))
+
+        pre_order = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            pre_order.append(node)
+            stack.extend(son for son in (node.left_son, node.right_son) if son is not None)
+
+        # the reversed pre-order visits the sons before their father
+        copies = {}
+        for node in reversed(pre_order):
+            left_son, right_son = node.left_son, node.right_son
+            left_son, right_son = copies.get(left_son, left_son), copies.get(right_son, right_son)
+            if type(node) is not node_type:
+                copies[node] = node_type(node.key, node.value, left_son, right_son, node.priority, augmentations)
+                continue
+            node.left_son, node.right_son = left_son, right_son
+            if augmentations:
+                node.augmentations = augmentations
+                node.aggregates = node._aggregate()
+        self._root = copies.get(self._root, self._root)
+
+    def add_augmentation(self, name, monoid):
+        """ Starts maintaining the aggregate of the values of every subtree under a monoid,
+            through all the updates of the treap.
+            Complexity: O(n)
+        :param name: The name of the augmentation, for range_aggregate.
+        :param monoid: A Monoid.
+        """
+        if any(existing_name == name for existing_name, _ in self._augmentations):
+            raise ValueError("There already is an augmentation named {}.".format(name))
+        self._augmentations += ((name, monoid),)
+        self._refresh_nodes()
+
+    def remove_augmentation(self, name):
+        """ Complexity: O(n)
+        """
+        self._augmentations = tuple((existing_name, monoid) for existing_name, monoid in self._augmentations
+                                    if existing_name != name)
+        self._refresh_nodes()
+
+    @staticmethod
+    def _range_aggregate(node, low, high, inclusive, index, monoid):
         if node is None:
-            return None
+            return monoid.identity
+
+        include_low, include_high = inclusive
+        if (not Dictionary._after_low(node.max_key, low, include_low) or
+                not Dictionary._before_high(node.min_key, high, include_high)):
+            return monoid.identity
+        if (Dictionary._after_low(node.min_key, low, include_low) and
+                Dictionary._before_high(node.max_key, high, include_high)):
+            return node.aggregates[index]
+
+        aggregate = Treap._range_aggregate(node.left_son, low, high, inclusive, index, monoid)
+        if Dictionary._after_low(node.key, low, include_low) and Dictionary._before_high(node.key, high, include_high):
+            aggregate = monoid.combine(aggregate, monoid.lift(node.value))
+        return monoid.combine(aggregate, Treap._range_aggregate(node.right_son, low, high, inclusive, index, monoid))
+
+    def range_aggregate(self, low=None, high=None, name=None, inclusive=(True, True)):
+        """ Aggregates the values of the keys between low and high (None meaning unbounded)
+            with the monoid of an augmentation. Only the subtrees straddling a bound are
+            expanded, the others contributing their aggregates directly.
+            Complexity: O(log n)
+        :param name: The name of the augmentation, which can be omitted when there is only one.
+        :return: The aggregate, the identity of the monoid for an empty range.
+        """
+        for index, (existing_name, monoid) in enumerate(self._augmentations):
+            if name is None and len(self._augmentations) == 1 or existing_name == name:
+                return Treap._range_aggregate(self._root, low, high, inclusive, index, monoid)
+        raise KeyError(name)
+
+    # Range updates
+    def _is_lazy(self):
+        return issubclass(self._node_type, _LazyTreapNode)
+
+    def _make_lazy(self):
+        """ Switches the nodes to _LazyTreapNode, which can hold pending range updates.
+            Complexity: O(n), only the first time
+        """
+        if not self._is_lazy():
+            self._node_type = _LazyTreapNode
+            self._refresh_nodes()
+
+    def _reads_mutate(self):
+        # the lazy nodes push their pending updates down as they are read
+        return self._is_lazy()
+
+    def _descents_mutate(self):
+        # even along the plain descents of Dictionary._look_up
+        return self._is_lazy()
 
-        left_son_weight = node.left_son.weight_of_subtree if node.left_son is not None else 0
+    @staticmethod
+    def _range_update(node, low, high, inclusive, tag):
+        if node is None:
+            return
+
+        include_low, include_high = inclusive
+        if (not Dictionary._after_low(node.max_key, low, include_low) or
+                not Dictionary._before_high(node.min_key, high, include_high)):
+            return
+        if (Dictionary._after_low(node.min_key, low, include_low) and
+                Dictionary._before_high(node.max_key, high, include_high)):
+            node._apply(tag)
+            return
+
+        if Dictionary._after_low(node.key, low, include_low) and Dictionary._before_high(node.key, high, include_high):
+            node.value = _LazyTreapNode._updated(node.value, tag)
+        Treap._range_update(node.left_son, low, high, inclusive, tag)
+        Treap._range_update(node.right_son, low, high, inclusive, tag)
+        node.update_fields()
 
-        if k == left_son_weight:
-            return node.key, node.value
+    def range_add(self, low, high, delta, inclusive=(True, True)):
+        """ Adds delta to the values of all the keys between low and high (None meaning unbounded).
+            The subtrees inside the range only get a tag, which is pushed down to their sons
+            when a later operation descends through them.
+            Complexity: O(log n), plus O(n) the first time a range update is applied
+        """
+        for name, monoid in self._augmentations:
+            if monoid.add is None:
+                raise ValueError("The augmentation {} does not support range_add.".format(name))
+        self._make_lazy()
+        self._version += 1
+        Treap._range_update(self._root, low, high, inclusive, (False, None, delta))
+
+    def range_assign(self, low, high, value, inclusive=(True, True)):
+        """ Sets the values of all the keys between low and high (None meaning unbounded) to value,
+            lazily like range_add.
+            Complexity: O(log n), plus O(n) the first time a range update is applied
+        """
+        self._make_lazy()
+        self._version += 1
+        Treap._range_update(self._root, low, high, inclusive, (True, value, 0))
+
+    # Range queries
+    @staticmethod
+    def _iter_range_nodes(node, low, high, inclusive, reverse=False):
+        """ Same as Dictionary._iter_range_nodes, but uses the key bounds of the subtrees
+            to skip the disjoint ones and to stream the contained ones without comparisons.
+        """
+        include_low, include_high = inclusive
+        stack = [(node, True)]
+        while stack:
+            node, expand = stack.pop()
+            if not expand:
+                yield node
+                continue
+            if node is None:
+                continue
+
+            if (not Dictionary._after_low(node.max_key, low, include_low) or
+                    not Dictionary._before_high(node.min_key, high, include_high)):
+                continue
+            if (Dictionary._after_low(node.min_key, low, include_low) and
+                    Dictionary._before_high(node.max_key, high, include_high)):
+                yield from Dictionary._iter_nodes(node, reverse)
+                continue
+
+            first_son, last_son = (node.right_son, node.left_son) if reverse else (node.left_son, node.right_son)
+            stack.append((last_son, True))
+            if (Dictionary._after_low(node.key, low, include_low) and
+                    Dictionary._before_high(node.key, high, include_high)):
+                stack.append((node, False))
+            stack.append((first_son, True))
 
-        if k < left_son_weight:
-            return Treap._get_kth_element(node.left_son, k)
-        else:
-            return Treap._get_kth_element(node.right_son, k - left_son_weight - 1)
+    # Specific queries
 
+    def size(self):
+        return self._root.weight_of_subtree if self._root is not None else 0
 
-    def get_kth_element(self, k):
-        return Treap._get_kth_element(self._root, k)
+    def get_min_key(self):
+        if self._root is None:
+            return None
+        else:
+            return Dictionary._get_left_most(self._root).key
+
+    def get_max_key(self):
+        if self._root is None:
+            return None
+        else:
+            return Dictionary._get_right_most(self._root).key
 
 
 ########################## Testing
@@ -306,6 +967,50 @@ class TestTreapOperations(unittest.TestCase):
         # the treaps must have the apropiate structure
         self.assertTrue(TestTreapOperations.check_treap_priorities(t._root))
 
+    def test_split_and_join_any_keys(self):
+
+        words = Treap.from_sorted((word, len(word)) for word in sorted(set(string.ascii_lowercase)))
+        lower, higher = words.split("m")
+        self.assertEqual(lower.keys(), list("abcdefghijklm"))
+        self.assertEqual(higher.keys(), list("nopqrstuvwxyz"))
+        self.assertEqual(words.get_root(), None)
+        self.assertRaises(ValueError, higher.join, lower)
+
+        joined = Treap.merge(lower, higher)
+        self.assertEqual(joined.keys(), list(string.ascii_lowercase))
+        self.assertEqual(joined.size(), 26)
+        self.assertTrue(TestTreapOperations.check_treap_priorities(joined._root))
+        self.assertEqual(Treap.merge(Treap(), joined).keys(), list(string.ascii_lowercase))
+
+    def test_set_operations(self):
+
+        def random_treap(number_of_keys):
+            items = {random.randint(1, 2000): random.random() for _ in range(number_of_keys)}
+            treap = Treap.from_sorted(sorted(items.items()))
+            return treap, items
+
+        for first_size, second_size in [(1000, 1000), (1000, 10), (10, 1000), (0, 100)]:
+            for operation in ("union", "intersection", "difference"):
+                first, first_items = random_treap(first_size)
+                second, second_items = random_treap(second_size)
+
+                result = getattr(first, operation)(second)
+                if operation == "union":
+                    expected = dict(first_items)
+                    expected.update(second_items)
+                elif operation == "intersection":
+                    expected = {key: value for key, value in first_items.items() if key in second_items}
+                else:
+                    expected = {key: value for key, value in first_items.items() if key not in second_items}
+
+                self.assertEqual(result.items(), sorted(expected.items()))
+                self.assertTrue(TestTreapOperations.check_treap_priorities(result._root))
+                if expected:
+                    self.assertEqual(result.size(), len(expected))
+                    self.assertEqual(result._root.min_key, min(expected))
+                    self.assertEqual(result._root.max_key, max(expected))
+                self.assertEqual((first.get_root(), second.get_root()), (None, None))
+
     def test_queries(self):
 
         number_of_deletions = 50
@@ -314,6 +1019,8 @@ class TestTreapOperations(unittest.TestCase):
             self.treap.erase(k)
 
         self.assertTrue(self.treap._root.weight_of_subtree == len(self.treap.items()))
+        self.assertEqual(len(self.treap), len(self.treap.items()))
+        self.assertEqual((Treap().size(), len(Treap())), (0, 0))
 
         number_of_indexing_queries = 1000
         for i in range(number_of_indexing_queries):
@@ -340,5 +1047,252 @@ class TestTreapOperations(unittest.TestCase):
             self.assertTrue(self.treap.look_up(k) == v)
             self.assertTrue(self.treap[k] == v)
 
+    def test_from_sorted(self):
+
+        items = self.treap.items()
+        built = Treap.from_sorted(items)
+        self.assertEqual(built.items(), items)
+        self.assertEqual(built.size(), len(items))
+        self.assertTrue(TestTreapOperations.check_treap_priorities(built._root))
+        self.assertEqual((built._root.min_key, built._root.max_key), (items[0][0], items[-1][0]))
+
+        priorities = [random.random() for _ in items]
+        built = Treap.from_sorted(items, priorities)
+        self.assertEqual([node.priority for node in built._iter_nodes(built._root)], priorities)
+        self.assertTrue(TestTreapOperations.check_treap_priorities(built._root))
+
+        self.assertRaises(ValueError, Treap.from_sorted, items[::-1])
+        self.assertRaises(ValueError, Treap.from_sorted, items, priorities[1:])
+
+    def test_dump_and_load(self):
+
+        file = io.BytesIO()
+        self.treap.dump(file, priorities=True)
+        file.seek(0)
+        loaded = Treap.load(file)
+        self.assertEqual([(node.key, node.value, node.priority) for node in Dictionary._iter_nodes(loaded.get_root())],
+                         [(node.key, node.value, node.priority) for node in Dictionary._iter_nodes(self.treap.get_root())])
+
+        file = io.BytesIO()
+        self.treap.dump(file)
+        file.seek(0)
+        loaded = Treap.load(file)
+        self.assertEqual(loaded.items(), self.treap.items())
+        self.assertTrue(TestTreapOperations.check_treap_priorities(loaded.get_root()))
+
+    def test_augmentations(self):
+
+        treap = Treap()
+        treap.add_augmentation("sum", Monoid.sum())
+        model = {}
+        for i in range(2000):
+            key, value = random.randint(1, 10000), random.randint(-100, 100)
+            treap.insert(key, value)
+            model[key] = value
+        treap.add_augmentation("min", Monoid.min())
+        treap.add_augmentation("max", Monoid.max())
+        treap.add_augmentation("even", Monoid.count_if(lambda value: value % 2 == 0))
+        # not commutative, so it also checks the order of the aggregation
+        treap.add_augmentation("signs", Monoid(operator.add, "", lambda value: "-" if value < 0 else "+"))
+        self.assertRaises(ValueError, treap.add_augmentation, "sum", Monoid.sum())
+
+        # updates through erase, split and join, the set algebra and a cursor
+        for key in random.sample(list(model), 500):
+            treap.erase(key)
+            del model[key]
+        lower, higher = treap.split(5000)
+        treap = lower.join(higher)
+        treap.insert_many((key, key % 7) for key in range(0, 10000, 20))
+        model.update((key, key % 7) for key in range(0, 10000, 20))
+        treap = treap.difference(Treap.from_sorted((key, None) for key in range(0, 10000, 40)))
+        for key in range(0, 10000, 40):
+            model.pop(key, None)
+        key = random.choice(list(model))
+        treap.find_cursor(key).value = 1000
+        model[key] = 1000
+
+        for _ in range(100):
+            low, high = sorted(random.sample(range(10001), 2))
+            inclusive = (random.random() < 0.5, random.random() < 0.5)
+            values = [model[key] for key in sorted(model) if Dictionary._after_low(key, low, inclusive[0]) and
+                      Dictionary._before_high(key, high, inclusive[1])]
+
+            self.assertEqual(treap.range_aggregate(low, high, "sum", inclusive), sum(values))
+            self.assertEqual(treap.range_aggregate(low, high, "min", inclusive), min(values, default=None))
+            self.assertEqual(treap.range_aggregate(low, high, "max", inclusive), max(values, default=None))
+            self.assertEqual(treap.range_aggregate(low, high, "even", inclusive),
+                             sum(1 for value in values if value % 2 == 0))
+            self.assertEqual(treap.range_aggregate(low, high, "signs", inclusive),
+                             "".join("-" if value < 0 else "+" for value in values))
+
+        self.assertEqual(treap.range_aggregate(name="sum"), sum(model.values()))
+        treap.remove_augmentation("sum")
+        self.assertRaises(KeyError, treap.range_aggregate, 0, 10000, "sum")
+        other_treap = Treap.from_sorted([(10001, 0)])
+        other_treap.add_augmentation("sum", Monoid.sum())
+        self.assertRaises(ValueError, treap.join, other_treap)
+
+    def test_augmented_nodes(self):
+
+        # only the nodes of the augmented treaps have room for the aggregates
+        treap = Treap.from_sorted((key, key) for key in range(100))
+        self.assertFalse(hasattr(treap.get_root(), '__dict__'))
+        self.assertNotIn('aggregates', type(treap.get_root()).__slots__)
+        treap.add_augmentation("sum", Monoid.sum())
+        self.assertTrue(all(type(node) is type(treap.get_root()) for node in treap._iter_nodes(treap.get_root())))
+        self.assertIn('aggregates', type(treap.get_root()).__slots__)
+
+        # the treaps without augmentations adopt those of the others, even when empty
+        treap = Treap().join(treap)
+        treap.insert(100, 100)
+        treap = Treap.from_sorted([(-1, -1)]).union(treap)
+        treap.insert(101, 101)
+        self.assertEqual(treap.range_aggregate(), sum(range(102)) - 1)
+
+        # and keep them along with range updates
+        treap.range_add(0, 9, 1)
+        self.assertTrue(hasattr(treap.get_root(), 'tag'))
+        self.assertEqual(treap.range_aggregate(0, 9), sum(range(1, 11)))
+
+        treap.remove_augmentation("sum")
+        self.assertNotIn('aggregates', type(treap.get_root()).__slots__)
+        self.assertEqual(treap.look_up(5), 6)
+
+    def test_range_updates(self):
+
+        treap = Treap.from_sorted((key, 0) for key in range(0, 10000, 3))
+        treap.add_augmentation("sum", Monoid.sum())
+        treap.add_augmentation("max", Monoid.max())
+        model = dict(treap.iter_items())
+        self.assertFalse(hasattr(treap.get_root(), 'tag'))
+
+        for i in range(300):
+            low, high = sorted(random.sample(range(10001), 2))
+            inclusive = (random.random() < 0.5, random.random() < 0.5)
+            updated_keys = [key for key in model if Dictionary._after_low(key, low, inclusive[0]) and
+                            Dictionary._before_high(key, high, inclusive[1])]
+
+            if i % 3 == 0:
+                treap.range_assign(low, high, i, inclusive)
+                model.update((key, i) for key in updated_keys)
+            else:
+                delta = random.randint(-50, 50)
+                treap.range_add(low, high, delta, inclusive)
+                model.update((key, model[key] + delta) for key in updated_keys)
+
+            # the pending updates must survive all the kinds of descents
+            if i % 10 == 0:
+                key = random.randint(0, 10000)
+                treap.insert(key, -i)
+                model[key] = -i
+                treap.erase(random.choice(list(model)))
+                model = dict((key, value) for key, value in model.items() if key in treap)
+                lower, higher = treap.split(random.randint(0, 10000))
+                treap = lower.join(higher)
+            if i % 25 == 0:
+                treap = treap.union(Treap.from_sorted([(10001, 0)]))
+                model[10001] = 0
+
+            key = random.choice(list(model))
+            self.assertEqual(treap.look_up(key), model[key])
+            values = [model[key] for key in sorted(model) if low <= key <= high]
+            self.assertEqual(treap.range_aggregate(low, high, "sum"), sum(values))
+            self.assertEqual(treap.range_aggregate(low, high, "max"), max(values, default=None))
+
+        self.assertEqual(treap.items(), sorted(model.items()))
+        rank = random.randrange(len(model))
+        self.assertEqual(treap.get_kth_element(rank), sorted(model.items())[rank])
+        self.assertTrue(treap._reads_mutate())
+
+        treap.add_augmentation("even", Monoid.count_if(lambda value: value % 2 == 0))
+        treap.range_assign(None, None, 2)
+        self.assertEqual(treap.range_aggregate(name="even"), len(model))
+        self.assertRaises(ValueError, treap.range_add, None, None, 1)
+
+    def test_bulk_updates(self):
+
+        model = dict(self.treap.items())
+        for batch_size in (10, 5000):
+            batch = [(random.randint(1, 1000000), i) for i in range(batch_size)]
+            self.treap.insert_many(batch)
+            model.update(batch)
+            erased_keys = random.sample(list(model), batch_size // 2) + [0]
+            self.treap.erase_many(erased_keys)
+            for key in erased_keys:
+                model.pop(key, None)
+
+            self.assertEqual(self.treap.items(), sorted(model.items()))
+            self.assertEqual(self.treap.size(), len(model))
+            self.assertTrue(TestTreapOperations.check_treap_priorities(self.treap._root))
+
+        # the batches small compared to the treap are applied one key at a time
+        treap = Treap.from_sorted((key, key) for key in range(100000))
+        self.assertFalse(treap._set_operation_is_cheaper(10))
+        self.assertTrue(treap._set_operation_is_cheaper(100))
+        self.assertTrue(Treap()._set_operation_is_cheaper(10))
+
+    def test_range_queries(self):
+
+        keys = self.treap.keys()
+        for i in range(200):
+            low, high = sorted(random.sample(keys, 2))
+            inclusive = random.choice([True, False]), random.choice([True, False])
+            expected = [(key, self.treap[key]) for key in keys
+                        if Dictionary._after_low(key, low, inclusive[0]) and
+                        Dictionary._before_high(key, high, inclusive[1])]
+
+            self.assertEqual(list(self.treap.irange(low, high, inclusive)), expected)
+            self.assertEqual(list(self.treap.irange(low, high, inclusive, reverse=True)), expected[::-1])
+            self.assertEqual(self.treap.count_range(low, high, inclusive), len(expected))
+
+        self.assertEqual(list(self.treap.irange(high=keys[9])), self.treap.items()[:10])
+        self.assertEqual(list(self.treap.irange(keys[-1], keys[0])), [])
+        self.assertEqual(self.treap.count_range(keys[-1], keys[0]), 0)
+        self.assertEqual(self.treap.count_range(), len(keys))
+
+    def test_cursor(self):
+
+        keys = self.treap.keys()
+        cursor = self.treap.lower_bound(keys[0] - 1)
+        for key in keys:
+            self.assertEqual(cursor.key, key)
+            cursor.next()
+        self.assertFalse(cursor.valid)
+
+        cursor = self.treap.find_cursor(keys[-1])
+        for key in random.sample(keys, 100) + keys[-10:]:
+            self.assertTrue(cursor.seek(key))
+            self.assertEqual((cursor.key, cursor.value), (key, self.treap[key]))
+
+    def test_sampling(self):
+
+        items = self.treap.items()
+        ranks = [random.randrange(-5, len(items) + 5) for _ in range(1000)]
+        self.assertEqual(self.treap.get_kth_elements(ranks),
+                         [items[k] if 0 <= k < len(items) else None for k in ranks])
+
+        sample = self.treap.sample(500)
+        self.assertEqual(len(set(sample)), 500)
+        self.assertTrue(set(sample) <= set(items))
+        self.assertEqual(sorted(self.treap.sample(len(items))), items)
+        self.assertRaises(ValueError, self.treap.sample, len(items) + 1)
+
+        sample = self.treap.sample(2 * len(items), replace=True)
+        self.assertEqual(len(sample), 2 * len(items))
+        self.assertTrue(set(sample) <= set(items))
+
+        self.assertEqual(Treap().choose_element(), None)
+        self.assertEqual(Treap().sample(0), [])
+
+    def test_iterators(self):
+
+        items = self.treap.items()
+        self.assertEqual(list(self.treap.iter_items()), items)
+        self.assertEqual(list(self.treap.iter_keys()), [key for key, value in items])
+        self.assertEqual(list(self.treap.iter_values()), [value for key, value in items])
+        self.assertEqual(list(self.treap.reversed()), items[::-1])
+        self.assertEqual(self.treap.get_min_key(), items[0][0])
+        self.assertEqual(self.treap.get_max_key(), items[-1][0])
+
 if __name__ == "__main__":
     unittest.main()
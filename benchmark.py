@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+
+""" Benchmarks the trees against the dict and bisect-sorted list baselines.
+
+Every structure runs the same operations over the same keys, for each size and
+key distribution:
+
+    insert      inserts all the keys, one by one
+    lookup      looks up as many probes, drawn from the inserted keys with the same distribution
+    iterate     walks all the (key, value) pairs in order
+    kth         answers random k-th element queries
+    split_join  splits at the median key and joins the halves back
+    erase       erases all the keys, in random order
+
+Operations a structure does not support are left out of its results. The
+results are printed as a table and written as JSON, e.g.
+
+    python3 benchmark.py --sizes 1000 100000 --distributions uniform zipfian --output bench.json
+
+The SplayTree/<policy> structures compare the splay policies of look_up, e.g.
+
+    python3 benchmark.py --distributions zipfian --structures SplayTree SplayTree/semi SplayTree/none RBTree
+"""
+
+from RBTree import RBTree
+from Treap import Treap
+from SplayTree import SplayTree
+from ArrayRBTree import ArrayRBTree
+from BPlusTree import BPlusTree
+
+import argparse
+import bisect
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+
+
+########################## Structures
+
+
+class TreeBenchmark(object):
+
+    def __init__(self, tree_type, **options):
+        self.name = tree_type.__name__
+        self.tree_type = tree_type
+        self.tree = tree_type(**options)
+
+    def insert(self, key, value):
+        self.tree.insert(key, value)
+
+    def erase(self, key):
+        self.tree.erase(key)
+
+    def look_up(self, key):
+        return self.tree.look_up(key)
+
+    def iterate(self):
+        for _ in self.tree.iter_items():
+            pass
+
+    def supports_kth(self):
+        return hasattr(self.tree, "get_kth_element")
+
+    def kth(self, k):
+        return self.tree.get_kth_element(k)
+
+    def supports_split_join(self):
+        return hasattr(self.tree, "split") and hasattr(self.tree, "join")
+
+    def split_join(self, key):
+        lower, higher = self.tree.split(key)
+        self.tree = lower.join(higher)
+
+    def close(self):
+        # the trees kept in a file (BPlusTree) unmap it and delete their temporary file
+        if hasattr(self.tree, "close"):
+            self.tree.close()
+
+
+class DictBenchmark(object):
+    """ Hash map baseline: no order, so no k-th queries nor split/join. """
+
+    name = "dict"
+
+    def __init__(self):
+        self.dictionary = {}
+
+    def insert(self, key, value):
+        self.dictionary[key] = value
+
+    def erase(self, key):
+        self.dictionary.pop(key, None)
+
+    def look_up(self, key):
+        return self.dictionary.get(key)
+
+    def iterate(self):
+        for _ in self.dictionary.items():
+            pass
+
+    def supports_kth(self):
+        return False
+
+    def supports_split_join(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class SortedListBenchmark(object):
+    """ Ordered baseline: parallel sorted lists of keys and values kept with bisect. """
+
+    name = "sorted_list"
+
+    def __init__(self):
+        self.keys = []
+        self.values = []
+
+    def insert(self, key, value):
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            self.values[index] = value
+        else:
+            self.keys.insert(index, key)
+            self.values.insert(index, value)
+
+    def erase(self, key):
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            del self.keys[index]
+            del self.values[index]
+
+    def look_up(self, key):
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return self.values[index]
+        return None
+
+    def iterate(self):
+        for _ in zip(self.keys, self.values):
+            pass
+
+    def supports_kth(self):
+        return True
+
+    def kth(self, k):
+        return self.keys[k], self.values[k]
+
+    def supports_split_join(self):
+        return True
+
+    def split_join(self, key):
+        index = bisect.bisect_right(self.keys, key)
+        lower_keys, higher_keys = self.keys[:index], self.keys[index:]
+        lower_values, higher_values = self.values[:index], self.values[index:]
+        self.keys = lower_keys + higher_keys
+        self.values = lower_values + higher_values
+
+    def close(self):
+        pass
+
+
+STRUCTURES = {
+    "RBTree": lambda: TreeBenchmark(RBTree),
+    "Treap": lambda: TreeBenchmark(Treap),
+    "SplayTree": lambda: TreeBenchmark(SplayTree),
+    "SplayTree/semi": lambda: TreeBenchmark(SplayTree, splay_policy="semi"),
+    "SplayTree/periodic": lambda: TreeBenchmark(SplayTree, splay_policy="periodic", splay_parameter=4),
+    "SplayTree/deep": lambda: TreeBenchmark(SplayTree, splay_policy="deep", splay_parameter=24),
+    "SplayTree/none": lambda: TreeBenchmark(SplayTree, splay_policy="none"),
+    "ArrayRBTree": lambda: TreeBenchmark(ArrayRBTree),
+    "BPlusTree": lambda: TreeBenchmark(BPlusTree),
+    "dict": DictBenchmark,
+    "sorted_list": SortedListBenchmark,
+}
+
+
+########################## Key distributions
+
+
+def zipfian_ranks(universe, count, exponent=1.1):
+    """ Draws count ranks in [0, universe) with P(rank) proportional to 1 / (rank + 1) ** exponent.
+    """
+    cumulative_weights = list(itertools.accumulate(1.0 / (rank + 1) ** exponent for rank in range(universe)))
+    return random.choices(range(universe), cum_weights=cumulative_weights, k=count)
+
+
+# Each distribution returns the inserted keys and the probes looked up afterwards
+
+
+def uniform_keys(size):
+    keys = random.sample(range(10 * size), size)
+    return keys, random.choices(keys, k=size)
+
+
+def sequential_keys(size):
+    keys = list(range(size))
+    return keys, list(keys)
+
+
+def descending_keys(size):
+    keys = list(range(size - 1, -1, -1))
+    return keys, list(keys)
+
+
+def zipfian_keys(size):
+    # the hot ranks are scattered over the key space, and repeated keys only update
+    key_of_rank = random.sample(range(10 * size), size)
+    keys = [key_of_rank[rank] for rank in zipfian_ranks(size, size)]
+    probes = [key_of_rank[rank] for rank in zipfian_ranks(size, size)]
+    return keys, probes
+
+
+DISTRIBUTIONS = {
+    "uniform": uniform_keys,
+    "sequential": sequential_keys,
+    "descending": descending_keys,
+    "zipfian": zipfian_keys,
+}
+
+
+########################## Running
+
+
+def timed(function, *arguments):
+    start = time.perf_counter()
+    function(*arguments)
+    return time.perf_counter() - start
+
+
+def run(structure_name, keys, probes, queries, repeats):
+    """ Runs all the operations on a fresh structure.
+    :return: A dictionary mapping each supported operation to its seconds and number of operations.
+    """
+    structure = STRUCTURES[structure_name]()
+    distinct_keys = list(set(keys))
+    random.shuffle(distinct_keys)
+    median_key = sorted(distinct_keys)[len(distinct_keys) // 2]
+
+    def insert_all():
+        for key in keys:
+            structure.insert(key, key)
+
+    def look_up_all():
+        for key in probes:
+            structure.look_up(key)
+
+    def iterate_all():
+        for _ in range(repeats):
+            structure.iterate()
+
+    def kth_all():
+        for k in queries:
+            structure.kth(k)
+
+    def split_join_all():
+        for _ in range(repeats):
+            structure.split_join(median_key)
+
+    def erase_all():
+        for key in distinct_keys:
+            structure.erase(key)
+
+    try:
+        results = {
+            "insert": (timed(insert_all), len(keys)),
+            "lookup": (timed(look_up_all), len(probes)),
+            "iterate": (timed(iterate_all), repeats * len(distinct_keys)),
+        }
+        if structure.supports_kth():
+            results["kth"] = (timed(kth_all), len(queries))
+        if structure.supports_split_join():
+            results["split_join"] = (timed(split_join_all), repeats)
+        results["erase"] = (timed(erase_all), len(distinct_keys))
+    finally:
+        structure.close()
+
+    return {operation: {"seconds": seconds, "operations": operations,
+                        "ns_per_operation": 1e9 * seconds / operations if operations else None}
+            for operation, (seconds, operations) in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the trees against stdlib baselines.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--distributions", nargs="+", choices=sorted(DISTRIBUTIONS), default=sorted(DISTRIBUTIONS))
+    parser.add_argument("--structures", nargs="+", choices=sorted(STRUCTURES), default=list(STRUCTURES))
+    parser.add_argument("--repeats", type=int, default=3, help="repetitions of the iterate and split_join phases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file for the JSON results, standard output if missing")
+    arguments = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "seed": arguments.seed,
+        "results": [],
+    }
+
+    for size, distribution in itertools.product(arguments.sizes, arguments.distributions):
+        random.seed(arguments.seed)
+        keys, probes = DISTRIBUTIONS[distribution](size)
+        distinct_keys = len(set(keys))
+        queries = [random.randrange(distinct_keys) for _ in range(size)]
+
+        for structure_name in arguments.structures:
+            random.seed(arguments.seed)
+            operations = run(structure_name, keys, probes, queries, arguments.repeats)
+            report["results"].append({"structure": structure_name, "size": size,
+                                      "distribution": distribution, "operations": operations})
+
+            for operation, result in operations.items():
+                print("{:>18} {:>10} {:>10} {:>10} {:>12.0f} ns/op".format(
+                      structure_name, size, distribution, operation, result["ns_per_operation"]),
+                      file=sys.stderr)
+
+    if arguments.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(arguments.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
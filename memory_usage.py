@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+""" Reports how many bytes each tree spends per stored entry.
+
+The keys and values are allocated before measuring, so the numbers only cover
+the structure itself: the nodes, plus whatever they allocate on their own
+(e.g. the priorities of the treap).
+
+    python3 memory_usage.py [--sizes 1000 100000] [--seed 0]
+"""
+
+from RBTree import RBTree
+from Treap import Treap
+from SplayTree import SplayTree
+from ArrayRBTree import ArrayRBTree
+
+import argparse
+import random
+import tracemalloc
+
+
+TREE_TYPES = [RBTree, Treap, SplayTree, ArrayRBTree]
+
+
+def build_dict(keys):
+    result = {}
+    for key in keys:
+        result[key] = None
+    return result
+
+
+def build_tree(tree_type, keys):
+    tree = tree_type()
+    for key in keys:
+        tree.insert(key)
+    return tree
+
+
+def bytes_per_entry(build, keys):
+    """ Measures the memory retained by build(keys), divided by the number of keys.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    structure = build(keys)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del structure
+    return (after - before) / len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per entry memory usage of the trees.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    random.seed(arguments.seed)
+
+    print("{:>10} {:>10} {:>16}".format("structure", "entries", "bytes per entry"))
+    for size in arguments.sizes:
+        keys = random.sample(range(10 * size), size)
+
+        print("{:>10} {:>10} {:>16.1f}".format("dict", size, bytes_per_entry(build_dict, keys)))
+        for tree_type in TREE_TYPES:
+            usage = bytes_per_entry(lambda keys: build_tree(tree_type, keys), keys)
+            print("{:>10} {:>10} {:>16.1f}".format(tree_type.__name__, size, usage))
+
+
+if __name__ == "__main__":
+    main()